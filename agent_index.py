@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from config import INDEX_REFRESH_INTERVAL
+from formatting import extract_agents, render_agent_cards, tokenize
+from metrics import registry
+from offload import run_cpu
+from request_context import request_scope, BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# How long a command waits for the startup snapshot before fetching live
+_LOAD_WAIT = 2.0
+
+INDEX_REFRESH_TOTAL = registry.counter("masumi_bot_index_refresh_total", "Agent index refreshes", ("outcome",))
+registry.callback_gauge("masumi_bot_index_agents", "Agents in the in-memory index", (),
+                        lambda: {(): len(agent_index.agents)})
+
+
+# (slim agent, search terms, content hash), as produced by formatting.extract_agents
+Entry = Tuple[Dict[str, Any], Tuple[str, ...], str]
+
+
+def build_entries(result: str, derivers) -> Tuple[List[Entry], Dict[str, Any]]:
+    """Index entries from a list_agents result, plus the data derived from them.
+
+    Runs in the offload pool; `derivers` are (name, function) pairs, so
+    structures built from the entries cost the event loop nothing.
+    """
+    entries = _unique(extract_agents(result))
+    return entries, {name: derive(entries) for name, derive in derivers}
+
+
+def _unique(entries: List[Entry]) -> List[Entry]:
+    """First entry per agent id, in order"""
+    seen: Set[str] = set()
+    kept = []
+    for entry in entries:
+        agent_id = entry[0]["agentIdentifier"]
+        if agent_id not in seen:
+            seen.add(agent_id)
+            kept.append(entry)
+    return kept
+
+
+class RegistryDiff:
+    """Agents added, removed and changed between two registry refreshes"""
+
+    __slots__ = ("added", "removed", "changed")
+
+    def __init__(self, added: List[Dict[str, Any]], removed: List[Dict[str, Any]], changed: List[Dict[str, Any]]):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self) -> str:
+        return f"RegistryDiff(+{len(self.added)} -{len(self.removed)} ~{len(self.changed)})"
+
+
+class RegistryError(Exception):
+    """list_agents answered with an error instead of agents"""
+
+
+class AgentIndex:
+    """In-memory copy of the agent registry with a term index for search.
+
+    Filled from the warm-start snapshot at startup (see snapshot.py) and
+    refreshed from list_agents in the background, so listing and searching
+    agents never waits on MCP once either has happened.
+    """
+
+    def __init__(self):
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        self.order: List[str] = []  # registry order, for listings
+        self._entries: List[Entry] = []
+        self.hashes: Dict[str, str] = {}  # agent id -> content hash, for diffs
+        self.cards: Dict[str, str] = {}  # agent id -> pre-rendered Markdown card
+        self.terms: Dict[str, Set[str]] = defaultdict(set)
+        self.updated_at = 0.0  # wall time of the data, 0 before any load
+        self.version = 0  # bumped on every change, for checkpointing
+        # Last known network status, shown when a live check is not possible
+        self.status: Dict[str, Any] = {}
+        self.loaded = asyncio.Event()  # set once the snapshot load or a refresh finished
+        self._refreshing: Optional[asyncio.Future] = None
+        # Called with each non-empty RegistryDiff a refresh produces
+        self.listeners: List[Callable[[RegistryDiff], None]] = []
+        # name -> function of the entries, run in the offload pool on every
+        # parse; results are kept in `derived` alongside the entries
+        self.derivers: Dict[str, Callable[[List[Entry]], Any]] = {"cards": render_agent_cards}
+        self.derived: Dict[str, Any] = {}
+        # Called after every replace(), to pick up the new entries and derived data
+        self.on_replace: List[Callable[[], None]] = []
+
+    @property
+    def ready(self) -> bool:
+        return self.updated_at > 0
+
+    def replace(self, entries: List[Entry], updated_at: float,
+                derived: Optional[Dict[str, Any]] = None) -> Optional["RegistryDiff"]:
+        """Swap in a new set of (agent, search terms, content hash) entries.
+
+        `derived` holds what the derivers computed from these entries; any
+        that is missing is computed here. Returns what changed against the
+        previous contents, or None when the index was empty (nothing to
+        compare with).
+        """
+        kept = _unique(entries)
+        derived = dict(derived or {})
+        for name, derive in self.derivers.items():
+            if name not in derived:
+                derived[name] = derive(kept)
+        agents, hashes, terms = {}, {}, defaultdict(set)
+        for agent, tokens, digest in kept:
+            agent_id = agent["agentIdentifier"]
+            agents[agent_id] = agent
+            hashes[agent_id] = digest
+            for token in tokens:
+                terms[token].add(agent_id)
+        diff = None
+        if self.ready:
+            old_agents, old_hashes = self.agents, self.hashes
+            diff = RegistryDiff(
+                added=[agents[a] for a in hashes if a not in old_hashes],
+                removed=[old_agents[a] for a in old_hashes if a not in hashes],
+                changed=[agents[a] for a, digest in hashes.items() if a in old_hashes and old_hashes[a] != digest],
+            )
+        self.agents, self.hashes, self._entries, self.terms = agents, hashes, kept, terms
+        self.derived = derived
+        self.cards = {agent["agentIdentifier"]: card for (agent, _, _), card in zip(kept, derived["cards"])}
+        self.order = [entry[0]["agentIdentifier"] for entry in kept]
+        self.updated_at = updated_at
+        self.version += 1
+        for hook in self.on_replace:
+            hook()
+        return diff
+
+    def entries(self) -> List[Entry]:
+        """Entries in registry order, as replace() takes them"""
+        return self._entries
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [self.agents[agent_id] for agent_id in self.order]
+
+    def list_cards(self) -> Iterator[str]:
+        """Cards in registry order, lazily; listings only take the first few"""
+        return (self.cards[agent_id] for agent_id in self.order)
+
+    def search(self, query: str, limit: int = 10) -> Tuple[List[Dict[str, Any]], int]:
+        """Agents matching every query word (as a prefix), in registry order, and the match count"""
+        words = tokenize(query)
+        if not words:
+            return [], 0
+        matched: Optional[Set[str]] = None
+        for word in words:
+            ids = self.terms.get(word)
+            if ids is None:
+                # Prefix match for partial words ("trans" finds "translator")
+                ids = set().union(*(v for k, v in self.terms.items() if k.startswith(word)))
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                return [], 0
+        hits = [agent_id for agent_id in self.order if agent_id in matched]
+        return [self.agents[agent_id] for agent_id in hits[:limit]], len(hits)
+
+    async def ensure_ready(self, pool):
+        """Wait for the startup snapshot; fetch live if there is still nothing to serve"""
+        if self.ready:
+            return
+        try:
+            await asyncio.wait_for(self.loaded.wait(), _LOAD_WAIT)
+        except asyncio.TimeoutError:
+            pass
+        if not self.ready:
+            await self.refresh(pool)
+
+    def record_status(self, **status):
+        self.status = {**status, "checked_at": time.time()}
+        self.version += 1
+
+    async def refresh(self, pool) -> int:
+        """Reload the index from list_agents; concurrent callers share one fetch"""
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh(pool))
+            self._refreshing.add_done_callback(lambda _: setattr(self, "_refreshing", None))
+        return await asyncio.shield(self._refreshing)
+
+    async def _refresh(self, pool) -> int:
+        client = await pool.acquire()
+        try:
+            result = await client.list_agents()
+        finally:
+            await pool.release(client)
+        if "Error" in result or result.startswith("❌"):
+            raise RegistryError(result[:200])
+        entries, derived = await run_cpu("parse.agent_index", build_entries, result,
+                                         tuple(self.derivers.items()), size=len(result))
+        self.publish(self.replace(entries, time.time(), derived))
+        self.loaded.set()
+        return len(entries)
+
+    def publish(self, diff: Optional[RegistryDiff]):
+        """Hand what a replace() changed to the listeners"""
+        if diff:
+            logger.info(f"📇 Registry changed: {diff!r}")
+            for listener in self.listeners:
+                listener(diff)
+
+    async def run_refresh_loop(self, pool):
+        """Refresh every INDEX_REFRESH_INTERVAL seconds at background priority"""
+        while True:
+            try:
+                with request_scope("index_refresh", INDEX_REFRESH_INTERVAL, priority=BACKGROUND):
+                    count = await self.refresh(pool)
+                INDEX_REFRESH_TOTAL.labels("ok").inc()
+                logger.info(f"📇 Agent index refreshed: {count} agents")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                INDEX_REFRESH_TOTAL.labels("error").inc()
+                logger.warning(f"⚠️ Agent index refresh failed: {e}")
+            await asyncio.sleep(INDEX_REFRESH_INTERVAL)
+
+
+agent_index = AgentIndex()
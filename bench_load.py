@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark for the Telegram bot handlers.
+
+Feeds synthetic Telegram updates through the real Application and
+MasumiTelegramBot handlers at a target rate. The Telegram API is stubbed
+at the HTTP layer and MCP calls go to fake_mcp_server.py, so no network
+or real server is needed. Reports throughput, p50/p95/p99 latency,
+spawned server processes and peak RSS per command.
+
+Example:
+    python bench_load.py --rate 20 --duration 15 --commands list_agents,status
+    FAKE_MCP_AGENTS=5000 python bench_load.py --commands query_registry --json bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Point the bot at the fake server before config is imported
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("MCP_SERVER_PATH", os.path.join(HERE, "fake_mcp_server.py"))
+os.environ.setdefault("MCP_PYTHON", sys.executable)
+os.environ.setdefault("DEBUG_MODE", "false")
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest, RequestData
+
+import bot as bot_module
+from agent_index import agent_index
+from masumi_client import MasumiMCPClient
+from metrics import percentile
+from procstats import tree_rss_bytes
+
+COMMANDS = {
+    "status": "/status",
+    "list_agents": "/list_agents",
+    "query_registry": "/query_registry",
+    "query_payments": "/query_payments",
+    "hire_agent": "/hire_agent fake000001" + "ab" * 28,
+    "register_test_agent": "/register_test_agent",
+}
+
+
+class StubTelegramRequest(BaseRequest):
+    """Answers Bot API calls locally instead of talking to Telegram"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.bytes_sent = 0
+        self.error_chats = set()  # chats that got a "❌" reply
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if endpoint == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "BenchBot"}
+        elif endpoint.startswith("send") or endpoint.startswith("edit"):
+            text = params.get("text") or params.get("caption") or ""
+            self.bytes_sent += len(text)
+            if "❌" in text:
+                self.error_chats.add(params.get("chat_id"))
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id", 0), "type": "private"},
+                "text": text,
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def make_update(application: Application, update_id: int, chat_id: int, text: str) -> Update:
+    """Build a private-chat text Update as Telegram would deliver it"""
+    command_length = len(text.split()[0]) if text.startswith("/") else 0
+    data = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": command_length}] if command_length else [],
+        },
+    }
+    return Update.de_json(data, application.bot)
+
+
+async def build_application(telegram_latency: float):
+    request = StubTelegramRequest(telegram_latency)
+    application = (
+        Application.builder()
+        .token(os.environ["TELEGRAM_BOT_TOKEN"])
+        .request(request)
+        .get_updates_request(StubTelegramRequest())
+        .updater(None)
+        .concurrent_updates(True)
+        .build()
+    )
+    masumi_bot = bot_module.MasumiTelegramBot()
+    bot_module.register_handlers(application, masumi_bot)
+    await application.initialize()
+    # A deployed bot has its index from the startup snapshot or first refresh;
+    # without this the first /list_agents waits out the snapshot load
+    await agent_index.refresh(masumi_bot.mcp_pool)
+    return application, masumi_bot, request
+
+
+async def run_phase(application: Application, request: StubTelegramRequest, name: str, text: str,
+                    rate: float, duration: float, poisson: bool, update_ids) -> Dict[str, Any]:
+    """Drive one command at a fixed arrival rate and collect its numbers"""
+    latencies: List[float] = []
+    failures = 0
+    peak_rss = tree_rss_bytes()
+    spawned_before = MasumiMCPClient.spawn_count
+    stop_sampling = asyncio.Event()
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while not stop_sampling.is_set():
+            peak_rss = max(peak_rss, tree_rss_bytes())
+            await asyncio.sleep(0.05)
+
+    async def one(update: Update):
+        nonlocal failures
+        started = time.perf_counter()
+        await application.process_update(update)
+        latencies.append(time.perf_counter() - started)
+        if update.effective_chat.id in request.error_chats:
+            failures += 1
+
+    sampler = asyncio.create_task(sample_rss())
+    tasks = []
+    started = time.perf_counter()
+    next_at = started
+    while next_at - started < duration:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Every update comes from its own chat so none supersedes another
+        update_id = next(update_ids)
+        tasks.append(asyncio.create_task(one(make_update(application, update_id, 10_000_000 + update_id, text))))
+        next_at += random.expovariate(rate) if poisson else 1.0 / rate
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop_sampling.set()
+    await sampler
+
+    return {
+        "command": name,
+        "requests": len(latencies),
+        "failures": failures,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "spawned_processes": MasumiMCPClient.spawn_count - spawned_before,
+        "peak_rss_mb": peak_rss / (1024 * 1024),
+    }
+
+
+def print_report(results: List[Dict[str, Any]]):
+    header = f"{'command':<22}{'reqs':>7}{'fail':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'spawns':>8}{'rss MB':>9}"
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['command']:<22}{r['requests']:>7}{r['failures']:>6}{r['throughput_rps']:>9.1f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+              f"{r['spawned_processes']:>8}{r['peak_rss_mb']:>9.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", default=",".join(COMMANDS), help="comma-separated commands to run, in order")
+    parser.add_argument("--rate", type=float, default=10.0, help="target updates per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per command")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of a fixed interval")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="simulated Bot API latency (s)")
+    parser.add_argument("--json", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    application, masumi_bot, request = await build_application(args.telegram_latency)
+    update_ids = iter(range(1, 10 ** 9))
+
+    results = []
+    try:
+        for name in args.commands.split(","):
+            results.append(await run_phase(application, request, name, COMMANDS[name], args.rate,
+                                           args.duration, args.poisson, update_ids))
+    finally:
+        await masumi_bot.mcp_pool.close()
+        await application.shutdown()
+
+    print_report(results)
+    print(f"\nTelegram API calls: {dict(request.calls)}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,41 @@
 import asyncio
+import functools
+import io
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+import signal
+import time
+import weakref
+from telegram import Message, Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultsButton
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, InlineQueryHandler, MessageHandler, filters, ContextTypes
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
+from request_context import request_scope, check_deadline
+from update_order import ChatOrderedUpdateProcessor, UpdateKey, update_key
+from metrics import COMMANDS_TOTAL, COMMAND_SECONDS, TELEGRAM_API_SECONDS, start_metrics_server
+import tracing
+from tracing import start_trace, span, traced
+from log_pipeline import setup_logging
+from loop_monitor import loop_monitor
+from profiler import profiler
+import metrics
+import offload
+from formatting import count_agents, agent_topics, render_agents, render_search_results, render_recommendations, render_payments_page, job_result_status, clip_utf8, payments_callback_data, parse_payments_callback
+from delivery import deliver, send_document, send_markdown
+from schema_cache import schema_cache
+from payment_ledger import payment_ledger
+from result_store import result_store
+from agent_index import agent_index, RegistryError
+from snapshot import snapshotter
+from subscriptions import subscriptions, notifier
+from ranking import ranker, agent_stats, short_id
+from inline_search import inline_search
+from bulk_register import BulkRegistration, render_report
 
 # Test imports with error handling
 try:
     from masumi_client import MasumiMCPClient
+    from mcp_pool import MCPServerPool
     print("✅ MasumiMCPClient imported successfully")
 except Exception as e:
     print(f"❌ Failed to import MasumiMCPClient: {e}")
@@ -15,7 +44,10 @@ except Exception as e:
     raise
 
 try:
-    from config import TELEGRAM_BOT_TOKEN, DEBUG_MODE
+    from config import TELEGRAM_BOT_TOKEN, DEBUG_MODE, HANDLER_DEADLINE, SESSION_TTL, METRICS_HOST, METRICS_PORT
+    from config import ADMIN_USER_IDS, PROFILE_MAX_SECONDS, PROFILE_SIGNAL_SECONDS, BULK_REGISTER_RATE
+    from config import WORKER_ID, WORKER_COUNT
+    from config import PAYMENTS_PAGE_SIZE, DELIVERY_DOCUMENT_THRESHOLD, SUBSCRIPTIONS_PER_CHAT, INLINE_CACHE_TIME
     print("✅ Config imported successfully")
     print(f"📊 DEBUG_MODE: {DEBUG_MODE}")
     print(f"🤖 Token configured: {'Yes' if TELEGRAM_BOT_TOKEN else 'No'}")
@@ -25,29 +57,182 @@ except Exception as e:
     traceback.print_exc()
     raise
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO if not DEBUG_MODE else logging.DEBUG
-)
+# Configure logging: records are queued and written off the event loop
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Keep pagination callback data within Telegram's 64 bytes (UTF-8 encoded)
+PAYMENT_STATUS_BYTES = 20
+PAYMENT_AGENT_PREFIX_BYTES = 20
+
+# For testing, agents use a dummy API URL - in real implementation,
+# this would come from the agent registry
+DEMO_AGENT_API_URL = "https://example-agent.com/"
+
+# Upper bound; replies show as many as fit in one message
+SEARCH_RESULTS_LIMIT = 50
+RECOMMEND_RESULTS = 5
+SUBSCRIPTION_TOPIC_LEN = 64
+# Telegram accepts at most 50 results per inline answer
+INLINE_RESULTS = 20
+
+# Updates handled at once across all chats (PTB's default for concurrent_updates=True)
+_MAX_CONCURRENT_UPDATES = 256
+
+def with_deadline(handler, budget: float = HANDLER_DEADLINE):
+    """Run a handler inside a request scope carrying its end-to-end deadline"""
+    @functools.wraps(handler)
+    async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with request_scope(handler.__name__, budget):
+            return await handler(update, context)
+    return wrapped
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records Bot API latency per method"""
+    
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.monotonic()
+        try:
+            with span(f"telegram.{api_method}"):
+                return await super().do_request(url, method, request_data=request_data, **kwargs)
+        finally:
+            TELEGRAM_API_SECONDS.labels(api_method).observe(time.monotonic() - started)
+
 class MasumiTelegramBot:
     def __init__(self):
         self.user_sessions = {}  # Store user session data
+        self._last_prune = 0.0
+        self.inflight = {}  # (chat_id, user_id) -> task of the command being handled
+        self.stopped = weakref.WeakSet()  # tasks cancelled by stop_task()
+        self.mcp_pool = MCPServerPool()
+        self.bulk_run = None  # the running /bulk_register run, if any
+        self.bulk_task = None
+    
+    def cancellable(self, handler, supersede: bool = True):
+        """Track a command per chat and user so /cancel or their next command can stop it.
+
+        With `supersede` off (plain-text input) the handler is only traced and
+        counted: it neither stops the user's running command nor can be stopped.
+        """
+        command = handler.__name__.removesuffix("_command")
+        
+        @functools.wraps(handler)
+        async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            chat_id = update.effective_chat.id
+            # Per user, so another member of a group chat cannot stop this command
+            key = update_key(update)
+            task = asyncio.current_task()
+            if supersede:
+                self.interrupt(key)
+                self.inflight[key] = task
+            # Lets the profiler and loop monitor attribute work to the command
+            task.set_name(f"update.{command}")
+            started = time.monotonic()
+            outcome = "error"
+            try:
+                with start_trace(f"update.{command}", update_id=update.update_id, chat_id=chat_id):
+                    result = await handler(update, context)
+                outcome = "ok"
+                return result
+            except asyncio.CancelledError:
+                # The MCP client already told the server and the handler's
+                # finally released its server process
+                outcome = "cancelled"
+                logger.info(f"⏹️ {handler.__name__} cancelled in chat {chat_id}")
+                if task in self.stopped:
+                    self.stopped.discard(task)
+                    # Our own stop ends the update normally: PTB skips its queue
+                    # bookkeeping for a cancelled update, which would hang shutdown.
+                    # Any other cancellation (e.g. shutdown itself) propagates.
+                    if task.uncancel() == 0:
+                        return None
+                raise
+            finally:
+                if self.inflight.get(key) is task:
+                    del self.inflight[key]
+                COMMANDS_TOTAL.labels(command, outcome).inc()
+                COMMAND_SECONDS.labels(command).observe(time.monotonic() - started)
+        return wrapped
+    
+    def interrupt(self, key: UpdateKey):
+        """Stop the user's running command, if any, for their newer one"""
+        previous = self.inflight.get(key)
+        if previous and not previous.done():
+            logger.info(f"⏹️ Superseding in-flight command in chat {key[0]}")
+            self.stop_task(previous)
+    
+    def stop_task(self, task: asyncio.Task):
+        """Cancel a command's task on behalf of /cancel or a newer command"""
+        self.stopped.add(task)
+        task.cancel()
+    
+    def prune_sessions(self):
+        """Drop hire sessions the user abandoned more than SESSION_TTL ago"""
+        now = time.monotonic()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        cutoff = now - SESSION_TTL
+        stale = [user_id for user_id, session in self.user_sessions.items() if session["created"] < cutoff]
+        for user_id in stale:
+            del self.user_sessions[user_id]
+    
+    async def cancel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /cancel command"""
+        task = self.inflight.pop(update_key(update), None)
+        session = self.user_sessions.pop(update.effective_user.id, None)
+        
+        if task and not task.done():
+            self.stop_task(task)
+            await update.message.reply_text("⏹️ Cancelled the running operation.")
+        elif session:
+            await update.message.reply_text("⏹️ Cancelled the pending agent hire.")
+        else:
+            await update.message.reply_text("💡 Nothing to cancel.")
     
+    async def debug_profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /debug_profile command (admins only)"""
+        if update.effective_user.id not in ADMIN_USER_IDS:
+            await update.message.reply_text("❌ This command is for bot operators only.")
+            return
+        
+        try:
+            seconds = float(context.args[0]) if context.args else 10.0
+        except ValueError:
+            await update.message.reply_text("❌ Usage: `/debug_profile <seconds>`", parse_mode=ParseMode.MARKDOWN)
+            return
+        seconds = max(1.0, min(seconds, PROFILE_MAX_SECONDS))
+        
+        if profiler.running:
+            await update.message.reply_text("⏳ A profile is already running, try again when it finishes.")
+            return
+        await update.message.reply_text(f"🔬 Profiling the bot for {seconds:.0f}s...")
+        data = await profiler.profile(seconds)
+        await update.message.reply_document(
+            document=io.BytesIO(data),
+            filename=f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed",
+            caption="🔥 Collapsed stacks, rooted at the running task. Open with speedscope or flamegraph.pl."
+        )
+    
+    @traced("get_mcp_client")
     async def get_mcp_client(self):
-        """Get a fresh MCP client for each operation"""
+        """Lease an MCP client from the warm server pool"""
         try:
-            logger.info("🔄 Creating new MCP client...")
-            client = MasumiMCPClient()
-            logger.info("✅ MCP client created successfully")
+            # No point waiting for a server for a request that is already late
+            check_deadline()
+            logger.info("🔄 Leasing MCP client...")
+            client = await self.mcp_pool.acquire()
+            logger.info("✅ MCP client leased successfully")
             return client
         except Exception as e:
-            logger.error(f"❌ Failed to create MCP client: {e}")
-            import traceback
-            logger.error(f"❌ Traceback: {traceback.format_exc()}")
+            # Only a snapshot of the traceback is taken here; the log writer thread renders it
+            logger.error(f"❌ Failed to create MCP client: {e}", exc_info=True)
             raise
+    
+    async def release_mcp_client(self, client: MasumiMCPClient):
+        """Return a leased MCP client to the pool"""
+        await self.mcp_pool.release(client)
         
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -87,13 +272,18 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
 *🌟 Essential Demo Commands:*
 • `/status` - Network health & connectivity
 • `/list_agents` - Browse AI agent marketplace
+• `/search_agents <words>` - Find agents by capability or tag
+• `/recommend <task>` - Best agents for a task, with Hire buttons
+• `/subscribe <capability|tag>` - Get notified about new agents
 • `/register_test_agent` - Create your own agent
 • `/start` - Welcome & overview
 
 *🔧 Advanced Features:*
 • `/query_registry` - Explore full marketplace
-• `/query_payments` - Payment system demo
+• `/query_payments [status] [agent=<prefix>]` - Browse payment history
 • `/hire_agent <id>` - Interactive agent hiring
+• `/job_result <agent> <job>` - Fetch a finished job's result
+• `/cancel` - Stop the running command
 
 *🎯 Demo Workflow:*
 1️⃣ Check system status with `/status`
@@ -146,10 +336,9 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
                 
             elif "Error" not in agents_result:
                 # If agents work, registry might just have endpoint issues
-                import json
                 try:
-                    agents_data = json.loads(agents_result)
-                    agent_count = len(agents_data) if isinstance(agents_data, list) else 0
+                    agent_count = await offload.run_cpu("parse.list_agents", count_agents, agents_result,
+                                                        size=len(agents_result))
                     
                     status_msg = "✅ *Masumi Network Status: Operational*\n\n"
                     status_msg += "🔌 *MCP Server:* ✅ Connected\n"
@@ -171,6 +360,8 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
                 status_msg += "🔧 *Bot Functions:* ✅ Core features ready\n\n"
                 status_msg += "💡 *Demo ready - try `/list_agents` or `/register_test_agent`*"
                 
+            agent_index.record_status(registry_ok="Error" not in registry_result,
+                                      agents_ok="Error" not in agents_result)
             logger.info("✅ Returning professional status")
             
         except Exception as e:
@@ -178,78 +369,165 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
             status_msg = "❌ *Masumi Network Status: Connection Issues*\n\n"
             status_msg += "🔌 *MCP Server:* ❌ Connection failed\n"
             status_msg += "🛠️ *Action Required:* Please check server configuration\n\n"
+            last = agent_index.status
+            if last:
+                age = int(time.time() - last["checked_at"])
+                state = "✅ operational" if last.get("agents_ok") else "⚠️ limited"
+                status_msg += f"🕒 *Last known:* {state} {age // 60} min ago, {len(agent_index.agents)} agents indexed\n\n"
             status_msg += "💡 *Contact support for assistance*"
         finally:
             if mcp_client:
-                logger.info("🔄 Stopping MCP client...")
-                await mcp_client.stop_server()
-                logger.info("✅ MCP client stopped")
+                logger.info("🔄 Releasing MCP client...")
+                await self.release_mcp_client(mcp_client)
+                logger.info("✅ MCP client released")
         
         logger.info("📤 Sending professional status response...")
         await update.message.reply_text(status_msg, parse_mode=ParseMode.MARKDOWN)
     
     async def list_agents_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /list_agents command"""
-        await update.message.reply_text("🔍 Discovering Masumi agents...")
+        # Served from the agent index; only a cold start without a snapshot waits on MCP
+        if not agent_index.ready:
+            await update.message.reply_text("🔍 Discovering Masumi agents...")
         
-        mcp_client = None
         try:
-            mcp_client = await self.get_mcp_client()
-            result = await mcp_client.list_agents()
-            
-            # Format the response professionally for demo
-            if "Error" in result:
-                message = "⚠️ *Agent Discovery: Limited Results*\n\n"
-                message += "🔌 *MCP Connection:* ✅ Active\n"
-                message += "📡 *Registry Service:* 🔄 Synchronizing\n\n"
-                message += "💡 *Demo Tip:* Try `/register_test_agent` to create a test agent, "
-                message += "or `/status` to check network connectivity."
-            else:
-                # Parse and format agent data nicely
-                import json
-                try:
-                    agents_data = json.loads(result)
-                    if isinstance(agents_data, list) and len(agents_data) > 0:
-                        message = f"🤖 *Masumi Agent Marketplace*\n\n"
-                        message += f"📊 *{len(agents_data)} agents discovered*\n\n"
-                        
-                        # Show first 3 agents in a nice format
-                        for i, agent in enumerate(agents_data[:3], 1):
-                            agent_id = agent.get('agentIdentifier', 'Unknown')[:40] + '...'
-                            api_url = agent.get('apiBaseUrl', 'Unknown')
-                            capability = agent.get('capability', {}).get('name', 'General AI')
-                            
-                            message += f"*Agent {i}:*\n"
-                            message += f"🔹 ID: `{agent_id}`\n"
-                            message += f"🔹 Capability: {capability}\n"
-                            message += f"🔹 Endpoint: {api_url}\n\n"
-                        
-                        if len(agents_data) > 3:
-                            message += f"... and {len(agents_data) - 3} more agents available\n\n"
-                        
-                        message += "🚀 *Ready for agent interactions!*\n"
-                        message += "💡 *Next:* Use `/hire_agent <agent_id>` or `/register_test_agent`"
-                    else:
-                        message = "📭 *No agents currently registered*\n\n"
-                        message += "🔧 *Demo Mode:* Use `/register_test_agent` to create a test agent\n"
-                        message += "🌟 *Or explore the Masumi network for live agents*"
-                except json.JSONDecodeError:
-                    message = "🤖 *Masumi Agents Available*\n\n"
-                    message += "📊 *Network Data:* Successfully retrieved\n"
-                    message += "🔧 *Demo Ready:* Agent discovery is working\n\n"
-                    message += "💡 *Try `/register_test_agent` for hands-on demo*"
-                    
+            await agent_index.ensure_ready(self.mcp_pool)
+            message = render_agents(agent_index.list_cards(), len(agent_index.order))
+        except RegistryError:
+            message = "⚠️ *Agent Discovery: Limited Results*\n\n"
+            message += "🔌 *MCP Connection:* ✅ Active\n"
+            message += "📡 *Registry Service:* 🔄 Synchronizing\n\n"
+            message += "💡 *Demo Tip:* Try `/register_test_agent` to create a test agent, "
+            message += "or `/status` to check network connectivity."
         except Exception as e:
             message = "❌ *Agent Discovery Failed*\n\n"
             message += "🔌 *MCP Connection:* ❌ Issues detected\n"
             message += "🛠️ *Action:* Please check network configuration\n\n"
             message += f"*Error:* `{str(e)[:100]}...`"
-        finally:
-            if mcp_client:
-                await mcp_client.stop_server()
         
         await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
     
+    async def search_agents_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /search_agents command"""
+        if not context.args:
+            await update.message.reply_text(
+                "❌ Please provide search terms\n\n"
+                "Usage: `/search_agents <words>`\n"
+                "Example: `/search_agents translator`"
+            )
+            return
+        
+        query = " ".join(context.args)
+        try:
+            await agent_index.ensure_ready(self.mcp_pool)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Agent search is unavailable right now: {str(e)[:100]}")
+            return
+        
+        agents, total = agent_index.search(query, limit=SEARCH_RESULTS_LIMIT)
+        cards = [agent_index.cards[agent["agentIdentifier"]] for agent in agents]
+        await update.message.reply_text(render_search_results(query, cards, total), parse_mode=ParseMode.MARKDOWN)
+    
+    async def recommend_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /recommend command"""
+        if not context.args:
+            await update.message.reply_text(
+                "❌ Please describe the task\n\n"
+                "Usage: `/recommend <task>`\n"
+                "Example: `/recommend translate a contract to German`"
+            )
+            return
+        
+        task = " ".join(context.args)
+        try:
+            await agent_index.ensure_ready(self.mcp_pool)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Recommendations are unavailable right now: {str(e)[:100]}")
+            return
+        
+        with span("rank.recommend", agents=len(agent_index.agents)):
+            ranked = ranker.recommend(task, k=RECOMMEND_RESULTS)
+        # Callback data is limited to 64 bytes, so buttons carry a short agent key
+        buttons = [[InlineKeyboardButton(f"🤝 Hire {agent.get('name', 'agent')[:40]}",
+                                         callback_data=f"hire:{short_id(agent['agentIdentifier'])}")]
+                   for agent, _ in ranked]
+        cards = [(agent_index.cards[agent["agentIdentifier"]], score) for agent, score in ranked]
+        await update.message.reply_text(render_recommendations(task, cards), parse_mode=ParseMode.MARKDOWN,
+                                        reply_markup=InlineKeyboardMarkup(buttons) if buttons else None)
+    
+    async def hire_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the Hire buttons under a /recommend reply"""
+        query = update.callback_query
+        await query.answer()
+        agent_id = ranker.resolve(query.data.removeprefix("hire:"))
+        if agent_id is None:
+            await query.message.reply_text("❌ That agent is no longer in the registry. Try `/recommend` again.")
+            return
+        await self.start_hire(query.message, query.from_user.id, agent_id)
+    
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer @bot <words> inline queries from the agent index, without MCP"""
+        query = update.inline_query
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            if not agent_index.ready:
+                # Never fetch here; the snapshot or the first refresh fills the index
+                await query.answer([], cache_time=0, button=InlineQueryResultsButton(
+                    text="⏳ Agents are still loading, open the bot", start_parameter="inline"))
+                outcome = "not_ready"
+                return
+            offset = int(query.offset) if query.offset.isdigit() else 0
+            results, next_offset = inline_search.page(query.query, offset, INLINE_RESULTS)
+            await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False,
+                               next_offset=str(next_offset) if next_offset is not None else "")
+            outcome = "ok"
+        finally:
+            COMMANDS_TOTAL.labels("inline_query", outcome).inc()
+            COMMAND_SECONDS.labels("inline_query").observe(time.monotonic() - started)
+    
+    async def subscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /subscribe command"""
+        chat_id = update.effective_chat.id
+        if not context.args:
+            topics = subscriptions.topics(chat_id)
+            current = ", ".join(f"`{t}`" for t in topics) if topics else "none"
+            await update.message.reply_text(
+                f"🔔 *Subscriptions:* {current}\n\n"
+                "Usage: `/subscribe <capability or tag>`\n"
+                "Example: `/subscribe translator`\n\n"
+                "You get one message when agents with it are added, changed or removed.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        topic = " ".join(context.args).strip().lower()[:SUBSCRIPTION_TOPIC_LEN]
+        if not subscriptions.subscribe(chat_id, topic):
+            await update.message.reply_text(
+                f"❌ This chat already follows {SUBSCRIPTIONS_PER_CHAT} topics. "
+                "Use `/unsubscribe <topic>` first."
+            )
+            return
+        
+        message = f"🔔 Subscribed to *{topic}*"
+        if agent_index.ready:
+            matching = sum(1 for agent in agent_index.agents.values() if topic in agent_topics(agent))
+            message += f" ({matching} agents right now)"
+        await send_markdown(update.message, message + ".\n💡 `/unsubscribe <topic>` or `/unsubscribe all` to stop")
+    
+    async def unsubscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /unsubscribe command"""
+        chat_id = update.effective_chat.id
+        topic = " ".join(context.args or []).strip().lower()
+        if not topic:
+            await update.message.reply_text("Usage: `/unsubscribe <topic>` or `/unsubscribe all`")
+            return
+        removed = subscriptions.unsubscribe(chat_id, None if topic == "all" else topic)
+        if removed:
+            await update.message.reply_text(f"🔕 Removed {removed} subscription{'s' if removed != 1 else ''}.")
+        else:
+            await update.message.reply_text(f"🔕 This chat was not subscribed to {topic}.")
+    
     async def query_registry_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /query_registry command"""
         await update.message.reply_text("📋 Querying agent registry...")
@@ -260,44 +538,86 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
             result = await mcp_client.query_registry()
             
             if "Error" in result:
-                message = f"❌ *Registry query failed*\n\n```\n{result}\n```"
+                header, language = "❌ *Registry query failed*\n\n", ""
             else:
-                message = "📋 *Agent Registry*\n\n"
-                # Truncate if too long for Telegram
-                if len(result) > 3000:
-                    message += f"```\n{result[:3000]}...\n```"
-                    message += "\n⚠️ *Response truncated - full data available via direct API*"
-                else:
-                    message += f"```json\n{result}\n```"
+                # Long registries are split into several messages or sent as a file
+                header, language = "📋 *Agent Registry*\n\n", "json"
         except Exception as e:
-            message = f"❌ *Error*\n\n```\n{str(e)}\n```"
+            header, language, result = "❌ *Error*\n\n", "", str(e)
         finally:
             if mcp_client:
-                await mcp_client.stop_server()
+                await self.release_mcp_client(mcp_client)
         
-        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+        await deliver(update.message, header, result, language, filename="registry.json")
     
     async def query_payments_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /query_payments command"""
-        await update.message.reply_text("💳 Querying payment history...")
-        
-        mcp_client = None
-        try:
-            mcp_client = await self.get_mcp_client()
-            result = await mcp_client.query_payments()
-            
-            if "Error" in result:
-                message = f"❌ *Payment query failed*\n\n```\n{result}\n```"
+        """Handle /query_payments [status] [agent=<prefix>] from the local payment ledger"""
+        status, agent_prefix = "", ""
+        for arg in context.args or []:
+            if arg.lower().startswith("agent="):
+                agent_prefix = clip_utf8(arg[len("agent="):], PAYMENT_AGENT_PREFIX_BYTES)
             else:
-                message = "💳 *Payment History*\n\n"
-                message += f"```json\n{result}\n```"
-        except Exception as e:
-            message = f"❌ *Error*\n\n```\n{str(e)}\n```"
-        finally:
-            if mcp_client:
-                await mcp_client.stop_server()
+                status = clip_utf8(arg, PAYMENT_STATUS_BYTES)
+        if ":" in agent_prefix:
+            # Agent identifiers are hex; ":" would also break the page buttons
+            await update.message.reply_text("❌ An agent prefix cannot contain ':'\n\nUsage: `/query_payments [status] [agent=<prefix>]`",
+                                            parse_mode=ParseMode.MARKDOWN)
+            return
         
-        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+        if not await payment_ledger.count() and await payment_ledger.last_synced() is None:
+            # First use before the background sync has run
+            await update.message.reply_text("💳 Syncing payment history...")
+            try:
+                await payment_ledger.sync(self.mcp_pool)
+            except Exception as e:
+                message = f"❌ *Payment query failed*\n\n```\n{str(e)[:500]}\n```"
+                await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+                return
+        
+        text, markup = await self.render_payments(1, status, agent_prefix)
+        await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=markup)
+    
+    async def render_payments(self, page_no: int, status: str, agent_prefix: str):
+        """Text and pagination keyboard for one page of the payment ledger"""
+        page = await payment_ledger.page(status, agent_prefix, (page_no - 1) * PAYMENTS_PAGE_SIZE, PAYMENTS_PAGE_SIZE)
+        pages = max(1, -(-page["matched"] // PAYMENTS_PAGE_SIZE))
+        page_no = min(page_no, pages)
+        text = render_payments_page(page, page_no, pages, status, agent_prefix, await payment_ledger.last_synced() or 0)
+        
+        def data(target: int, target_status: str = status):
+            return payments_callback_data(target, target_status, agent_prefix)
+        
+        # A filter that cannot be carried in callback data (see
+        # payments_callback_data) gets no button
+        nav = []
+        if page_no > 1 and data(page_no - 1):
+            nav.append(InlineKeyboardButton("◀️ Prev", callback_data=data(page_no - 1)))
+        nav.append(InlineKeyboardButton(f"{page_no}/{pages}", callback_data="pay:noop"))
+        if page_no < pages and data(page_no + 1):
+            nav.append(InlineKeyboardButton("Next ▶️", callback_data=data(page_no + 1)))
+        filters_row = [InlineKeyboardButton(("✅ " if not status else "") + "All", callback_data=data(1, ""))]
+        filters_row += [InlineKeyboardButton(("✅ " if s.lower() == status.lower() else "") + s, callback_data=data(1, s))
+                        for s in (t["status"] for t in page["totals"][:3]) if data(1, s)]
+        return text, InlineKeyboardMarkup([nav, filters_row])
+    
+    async def payments_page_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the Prev/Next and filter buttons under a /query_payments reply"""
+        query = update.callback_query
+        await query.answer()
+        parsed = parse_payments_callback(query.data)
+        if parsed is None:
+            return
+        page_no, status, agent_prefix = parsed
+        # Buttons only carry statuses the ledger has seen; anything else is stale or forged
+        if status and status.lower() not in {s.lower() for s in await payment_ledger.statuses()}:
+            return
+        text, markup = await self.render_payments(page_no, status, agent_prefix)
+        try:
+            await query.edit_message_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=markup)
+        except BadRequest as e:
+            # Pressing the button of the page already shown
+            if "not modified" not in str(e).lower():
+                raise
     
     async def hire_agent_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /hire_agent command"""
@@ -309,45 +629,109 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
             )
             return
         
-        agent_id = context.args[0]
-        await update.message.reply_text(f"🔍 Looking up agent: `{agent_id}`...")
+        await self.start_hire(update.message, update.effective_user.id, context.args[0])
+    
+    async def start_hire(self, message: Message, user_id: int, agent_id: str):
+        """Fetch an agent's input schema and wait for the user's input (from /hire_agent or a Hire button)"""
+        await message.reply_text(f"🔍 Looking up agent: `{agent_id}`...")
         
-        # For testing, use a dummy API URL - in real implementation, 
-        # this would come from the agent registry
-        api_url = "https://example-agent.com/"
+        indexed = agent_index.agents.get(agent_id) or {}
+        api_url = indexed.get("apiBaseUrl") or DEMO_AGENT_API_URL
         
-        # Get agent input schema
-        mcp_client = None
-        try:
-            mcp_client = await self.get_mcp_client()
-            schema_result = await mcp_client.get_agent_input_schema(agent_id, api_url)
-        except Exception as e:
-            schema_result = f"Error: {str(e)}"
-        finally:
-            if mcp_client:
-                await mcp_client.stop_server()
-        
-        if "Error" in schema_result:
-            message = f"❌ *Could not retrieve agent schema*\n\n```\n{schema_result}\n```"
-            await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
-            return
+        # Get agent input schema, from the cache when we have seen this agent
+        schema = schema_cache.get(agent_id, api_url)
+        if schema is None:
+            mcp_client = None
+            try:
+                mcp_client = await self.get_mcp_client()
+                schema_result = await mcp_client.get_agent_input_schema(agent_id, api_url)
+            except Exception as e:
+                schema_result = f"Error: {str(e)}"
+            finally:
+                if mcp_client:
+                    await self.release_mcp_client(mcp_client)
+            
+            # Client-side failures start with ❌ and must not be cached as a schema
+            if "Error" in schema_result or schema_result.startswith("❌"):
+                text = f"❌ *Could not retrieve agent schema*\n\n```\n{schema_result}\n```"
+                await message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+                return
+            schema = schema_cache.put(agent_id, api_url, schema_result)
+        schema_result = schema.raw
         
         # Store session data for this user
-        user_id = update.effective_user.id
+        self.prune_sessions()
         self.user_sessions[user_id] = {
             "agent_id": agent_id,
             "api_url": api_url,
             "schema": schema_result,
-            "step": "awaiting_input"
+            "validate": schema.validate,
+            "step": "awaiting_input",
+            "created": time.monotonic()
         }
         
-        message = f"🤖 *Agent: {agent_id}*\n\n"
-        message += "*Input Schema:*\n"
-        message += f"```json\n{schema_result}\n```\n"
-        message += "📝 *Next Step:* Please send the input data as JSON\n"
-        message += "Example: `{\"text\": \"Hello world\", \"param2\": \"value\"}`"
+        text = f"🤖 *Agent: {agent_id}*\n\n"
+        text += "*Input Schema:*\n"
+        text += f"```json\n{schema_result}\n```\n"
+        text += "📝 *Next Step:* Please send the input data as JSON\n"
+        text += "Example: `{\"text\": \"Hello world\", \"param2\": \"value\"}`"
         
-        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+        await message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+    
+    async def job_result_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /job_result command"""
+        if len(context.args or []) < 2:
+            await update.message.reply_text(
+                "❌ Please provide the agent and job identifiers\n\n"
+                "Usage: `/job_result <agent_id> <job_id>`"
+            )
+            return
+        
+        agent_id, job_id = context.args[:2]
+        api_url = (agent_index.agents.get(agent_id) or {}).get("apiBaseUrl") or DEMO_AGENT_API_URL
+        await update.message.reply_text(f"📦 Fetching result of job `{job_id}`...")
+        
+        async def fetch():
+            mcp_client = await self.get_mcp_client()
+            try:
+                result = await mcp_client.get_job_full_result(agent_id, api_url, job_id)
+            finally:
+                await self.release_mcp_client(mcp_client)
+            return await offload.run_cpu("parse.job_result", job_result_status, result, size=len(result)), result
+        
+        # Finished results never change, so each is downloaded once and then
+        # served from disk, or by Telegram file id once it has been uploaded
+        try:
+            stored, result = await result_store.get_or_fetch(agent_id, job_id, fetch)
+        except Exception as e:
+            stored, result = None, f"Error: {str(e)}"
+        
+        if stored is None:
+            if "Error" in result or result.startswith("❌"):
+                header = "❌ *Could not fetch job result*\n\n"
+            else:
+                header = "⏳ *Job has not finished yet*\n\n"
+            await deliver(update.message, header, result, filename="job_result.txt")
+            return
+        
+        if stored.status == "failed":
+            header = f"❌ *Job* `{job_id}` *failed*\n\n"
+        else:
+            header = f"📦 *Result of job* `{job_id}`\n\n"
+        if stored.file_id:
+            await update.message.reply_document(stored.file_id, caption=header.strip(), parse_mode=ParseMode.MARKDOWN)
+        elif stored.size <= DELIVERY_DOCUMENT_THRESHOLD:
+            await deliver(update.message, header, await result_store.read_text(stored), filename="job_result.txt")
+        else:
+            # Uploaded from a memory map rather than a str copy of the result
+            data = await result_store.open(stored)
+            try:
+                sent = await send_document(update.message, data, "job_result.txt",
+                                           caption=f"{header}📎 Full result attached ({stored.size:,} bytes)")
+            finally:
+                data.close()
+            if sent and sent.document:
+                await result_store.set_file_id(stored, sent.document.file_id)
     
     async def register_test_agent_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /register_test_agent command for testing"""
@@ -402,13 +786,63 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
             message += "💡 *Try `/status` to check system health*"
         finally:
             if mcp_client:
-                await mcp_client.stop_server()
+                await self.release_mcp_client(mcp_client)
         
         await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
     
+    async def bulk_register_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /bulk_register command (admins only)"""
+        if update.effective_user.id not in ADMIN_USER_IDS:
+            await update.message.reply_text("❌ This command is for bot operators only.")
+            return
+        
+        running = self.bulk_task is not None and not self.bulk_task.done()
+        action = context.args[0].lower() if context.args else "status"
+        if action == "status":
+            status = f"📦 Bulk run {self.bulk_run.run_id}: {self.bulk_run.progress}" if self.bulk_run else "📦 No bulk run yet"
+            await update.message.reply_text(status + ("" if running else " (not running)"))
+            return
+        if action == "stop":
+            if running:
+                self.bulk_task.cancel()
+            await update.message.reply_text("⏹️ Stopping; progress is checkpointed" if running else "💡 No bulk run is running.")
+            return
+        if running:
+            await update.message.reply_text(f"⏳ Bulk run {self.bulk_run.run_id} is still running: {self.bulk_run.progress}")
+            return
+        try:
+            count = int(action)
+            if count <= 0:
+                raise ValueError(count)
+            run_id = context.args[1] if len(context.args) > 1 else "load"
+            rate = float(context.args[2]) if len(context.args) > 2 else BULK_REGISTER_RATE
+        except ValueError:
+            await update.message.reply_text(
+                "❌ Usage: `/bulk_register <count> [run_id] [rate]`, `/bulk_register status` or `/bulk_register stop`",
+                parse_mode=ParseMode.MARKDOWN)
+            return
+        
+        self.bulk_run = BulkRegistration(self.mcp_pool, count, run_id, rate=rate)
+        self.bulk_task = asyncio.create_task(self.report_bulk_run(update.message, self.bulk_run))
+        await update.message.reply_text(f"📦 Registering {count} synthetic agents as run {run_id} at up to {rate:g}/s. "
+                                        "Re-running the same command resumes it.")
+    
+    async def report_bulk_run(self, message: Message, run: BulkRegistration):
+        try:
+            report = await run.run()
+        except asyncio.CancelledError:
+            await message.reply_text(f"⏹️ Bulk run {run.run_id} stopped: {run.progress}")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Bulk run {run.run_id} failed: {e}", exc_info=True)
+            await message.reply_text(f"❌ Bulk run {run.run_id} failed: {str(e)[:100]}")
+            return
+        await message.reply_text(render_report(report))
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle regular messages (for multi-step workflows)"""
         user_id = update.effective_user.id
+        self.prune_sessions()
         
         if user_id not in self.user_sessions:
             await update.message.reply_text(
@@ -422,7 +856,8 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
             # Try to parse the input as JSON
             try:
                 import json
-                input_data = json.loads(update.message.text)
+                with span("parse.hire_input"):
+                    input_data = json.loads(update.message.text)
             except json.JSONDecodeError:
                 await update.message.reply_text(
                     "❌ Invalid JSON format. Please send valid JSON input data.\n"
@@ -430,10 +865,22 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
                 )
                 return
             
+            # Reject input the agent's schema rules out before paying for a job
+            validate = session.get("validate")
+            errors = validate(input_data) if validate else []
+            if errors:
+                await update.message.reply_text(
+                    "❌ Input does not match the agent's schema:\n"
+                    + "\n".join(f"• {error}" for error in errors[:10])
+                    + "\n\nPlease send corrected JSON input data."
+                )
+                return
+            
             await update.message.reply_text("🚀 Hiring agent...")
             
             # Hire the agent
             mcp_client = None
+            started = time.monotonic()
             try:
                 mcp_client = await self.get_mcp_client()
                 result = await mcp_client.hire_agent(
@@ -442,31 +889,30 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
                     input_data
                 )
                 
-                if "Error" in result:
-                    message = f"❌ *Agent hiring failed*\n\n```\n{result}\n```"
+                failed = "Error" in result or result.startswith("❌")
+                if failed:
+                    header = "❌ *Agent hiring failed*\n\n"
+                    # The agent may have changed its input schema; fetch it again next time
+                    schema_cache.invalidate(session["agent_id"], session["api_url"])
                 else:
-                    message = f"✅ *Agent hired successfully!*\n\n```\n{result}\n```"
+                    header = "✅ *Agent hired successfully!*\n\n"
+                # Feeds the success rate and latency columns /recommend ranks by
+                agent_stats.record(session["agent_id"], not failed, time.monotonic() - started)
             except Exception as e:
-                message = f"❌ *Error*\n\n```\n{str(e)}\n```"
+                header, result = "❌ *Error*\n\n", str(e)
             finally:
                 if mcp_client:
-                    await mcp_client.stop_server()
+                    await self.release_mcp_client(mcp_client)
             
-            await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+            await deliver(update.message, header, result, filename="hire_result.txt")
             
             # Clear session
             del self.user_sessions[user_id]
     
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors"""
-        import traceback
-        error_msg = f"Update {update} caused error {context.error}"
-        full_traceback = traceback.format_exc()
-        
-        logger.error(error_msg)
-        logger.error(f"Full traceback: {full_traceback}")
-        print(f"❌ ERROR: {error_msg}")
-        print(f"❌ TRACEBACK: {full_traceback}")
+        update_id = update.update_id if isinstance(update, Update) else None
+        logger.error(f"Update {update_id} caused error {context.error}", exc_info=context.error)
         
         if update and update.effective_message:
             error_text = str(context.error)
@@ -483,42 +929,132 @@ Try `/list_agents` to see available AI agents or `/status` to check network heal
                     f"❌ Error: {error_text}"
                 )
 
-async def main():
-    """Start the bot"""
-    bot = MasumiTelegramBot()
-    
-    # Create application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+def register_handlers(application: Application, bot: MasumiTelegramBot):
+    """Wire the bot's handlers into an Application"""
+    def handle(handler):
+        return with_deadline(bot.cancellable(handler))
     
     # Register handlers
-    application.add_handler(CommandHandler("start", bot.start_command))
-    application.add_handler(CommandHandler("help", bot.help_command))
-    application.add_handler(CommandHandler("status", bot.status_command))
-    application.add_handler(CommandHandler("list_agents", bot.list_agents_command))
-    application.add_handler(CommandHandler("query_registry", bot.query_registry_command))
-    application.add_handler(CommandHandler("query_payments", bot.query_payments_command))
-    application.add_handler(CommandHandler("hire_agent", bot.hire_agent_command))
-    application.add_handler(CommandHandler("register_test_agent", bot.register_test_agent_command))
+    application.add_handler(CommandHandler("start", bot.cancellable(bot.start_command)))
+    application.add_handler(CommandHandler("help", bot.cancellable(bot.help_command)))
+    application.add_handler(CommandHandler("cancel", bot.cancel_command))
+    # Runs longer than any handler deadline, and must not be superseded
+    application.add_handler(CommandHandler("debug_profile", bot.debug_profile_command))
+    application.add_handler(CommandHandler("status", handle(bot.status_command)))
+    application.add_handler(CommandHandler("list_agents", handle(bot.list_agents_command)))
+    application.add_handler(CommandHandler("search_agents", handle(bot.search_agents_command)))
+    application.add_handler(CommandHandler("recommend", handle(bot.recommend_command)))
+    application.add_handler(CallbackQueryHandler(handle(bot.hire_button), pattern=r"^hire:"))
+    # Inline queries have no chat to supersede commands in
+    application.add_handler(InlineQueryHandler(with_deadline(bot.inline_query)))
+    application.add_handler(CommandHandler("subscribe", handle(bot.subscribe_command)))
+    application.add_handler(CommandHandler("unsubscribe", handle(bot.unsubscribe_command)))
+    application.add_handler(CommandHandler("query_registry", handle(bot.query_registry_command)))
+    application.add_handler(CommandHandler("query_payments", handle(bot.query_payments_command)))
+    # Paging must not supersede a command still running in the chat
+    application.add_handler(CallbackQueryHandler(with_deadline(bot.payments_page_callback), pattern=r"^pay:"))
+    application.add_handler(CommandHandler("hire_agent", handle(bot.hire_agent_command)))
+    application.add_handler(CommandHandler("job_result", handle(bot.job_result_command)))
+    application.add_handler(CommandHandler("register_test_agent", handle(bot.register_test_agent_command)))
+    # Starts a background run and returns at once
+    application.add_handler(CommandHandler("bulk_register", bot.bulk_register_command))
     
     # Handle regular messages for multi-step workflows
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_message))
+    # Plain text (hire input) never supersedes a running command
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND,
+                                           with_deadline(bot.cancellable(bot.handle_message, supersede=False))))
     
     # Error handler
     application.add_error_handler(bot.error_handler)
+
+async def main(ingress=None):
+    """Start the bot.
+    
+    `ingress`, when given, feeds the application its updates instead of
+    polling Telegram, and the bot stops when it returns (see supervisor.py).
+    """
+    bot = MasumiTelegramBot()
+    
+    # Create application. Updates of different chats and users are handled
+    # concurrently; each user's messages in a chat run in order, and a newer
+    # command supersedes one still waiting on MCP.
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .concurrent_updates(ChatOrderedUpdateProcessor(_MAX_CONCURRENT_UPDATES, interrupt=bot.interrupt))
+    )
+    if ingress is not None:
+        builder = builder.updater(None)
+    application = builder.build()
+    register_handlers(application, bot)
+    
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    loop_monitor.start()
+    # Only the leader parses registry-sized payloads up front; other workers
+    # start their offload pool on first use
+    leader = WORKER_ID == 0
+    if leader:
+        await offload.warm_up()
+    metrics.routes[b"/debug/profile"] = profiler.http_route
+    if hasattr(signal, "SIGUSR2"):
+        profiler.install_signal_trigger(signal.SIGUSR2, PROFILE_SIGNAL_SECONDS)
+    
+    # Registry diffs from each index refresh become subscriber notifications
+    await subscriptions.load()
+    agent_index.listeners.append(notifier.publish)
+    
+    # The snapshot loads in the background; the first refresh then reconciles it.
+    # Only the leader refreshes the index and writes shared files; the other
+    # workers pick up its snapshots.
+    background = [
+        asyncio.create_task(snapshotter.load(), name="snapshot_load"),
+        asyncio.create_task(notifier.run(application.bot), name="notifier"),
+    ]
+    if leader:
+        background += [
+            asyncio.create_task(agent_index.run_refresh_loop(bot.mcp_pool), name="index_refresh"),
+            asyncio.create_task(snapshotter.run(), name="snapshot"),
+            asyncio.create_task(payment_ledger.run_sync_loop(bot.mcp_pool), name="ledger_sync"),
+        ]
+    else:
+        background.append(asyncio.create_task(snapshotter.follow(), name="snapshot_follow"))
     
     # Start the bot
-    logger.info("Starting Masumi Telegram Bot...")
+    logger.info(f"Starting Masumi Telegram Bot{f' worker {WORKER_ID}/{WORKER_COUNT}' if WORKER_COUNT > 1 else ''}...")
     await application.initialize()
     await application.start()
-    await application.updater.start_polling()
     
     try:
-        # Keep the bot running
-        await asyncio.Event().wait()
+        if ingress is not None:
+            await ingress(application)
+        else:
+            await application.updater.start_polling()
+            # Keep the bot running
+            await asyncio.Event().wait()
     except KeyboardInterrupt:
         logger.info("Stopping bot...")
     finally:
+        for task in background:
+            task.cancel()
+        if bot.bulk_task is not None and not bot.bulk_task.done():
+            # Lets the run write its checkpoint before the pool goes away
+            bot.bulk_task.cancel()
+            await asyncio.gather(bot.bulk_task, return_exceptions=True)
+        loop_monitor.stop()
+        offload.shutdown()
+        if application.updater is not None and application.updater.running:
+            await application.updater.stop()
         await application.stop()
+        await bot.mcp_pool.close()
+        payment_ledger.close()
+        if leader:
+            try:
+                await snapshotter.save()
+            except Exception as e:
+                logger.warning(f"⚠️ Final snapshot failed: {e}")
+        await tracing.exporter.flush()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Bulk registration of synthetic agents, for load testing the registry and the bot.
+
+Registers --count agents named masumi-load-<run>-<n> through the pooled MCP
+servers, at most --concurrency at a time and no faster than --rate per
+second. Progress is checkpointed to --checkpoint, so running the same
+command again resumes the run and retries the agents that failed. Prints
+throughput, error rate and latency when done. Operators can start the same
+run from Telegram with /bulk_register.
+
+Example:
+    python bulk_register.py --fake --count 2000 --rate 50
+    python bulk_register.py --count 500 --rate 2 --run-id preprod1 --checkpoint preprod1.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+if __name__ == "__main__" and "--fake" in sys.argv:
+    # Point the pool at the fake server before config is imported
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BULK")
+    os.environ.setdefault("MCP_SERVER_PATH", os.path.join(HERE, "fake_mcp_server.py"))
+    os.environ.setdefault("MCP_PYTHON", sys.executable)
+
+from atomic_file import atomic_write
+from config import BACKGROUND_RESERVED_SLOTS, BULK_REGISTER_CHECKPOINT, BULK_REGISTER_CONCURRENCY, BULK_REGISTER_RATE
+from metrics import percentile, registry
+from request_context import request_scope, BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+BULK_REGISTRATIONS_TOTAL = registry.counter("masumi_bot_bulk_registrations_total",
+                                            "Synthetic agents registered by bulk runs", ("outcome",))
+
+# Time allowed for one register_agent call, queueing for a server included
+_CALL_BUDGET = 120.0
+# Checkpoint after this many completions, and on exit
+_CHECKPOINT_EVERY = 50
+_CAPABILITIES = ("Summarizer", "Translator", "Image Tagger", "Sentiment Analyzer", "Code Reviewer")
+
+
+def synthetic_agent(run_id: str, n: int) -> Dict[str, Any]:
+    """register_agent arguments for agent `n` of a run; the same every time, so retries reuse the name"""
+    suffix = f"{run_id}-{n:06d}"
+    capability = _CAPABILITIES[n % len(_CAPABILITIES)]
+    return {
+        "name": f"masumi-load-{suffix}",
+        "api_base_url": f"https://load-agent-{suffix}.masumi-test.network/",
+        "selling_wallet_vkey": f"vkey_load_{suffix}".ljust(56, "0"),
+        "capability_name": capability,
+        "capability_version": "1.0.0",
+        "base_price": 1_000_000 + (n % 100) * 10_000,
+        "tags": ["load-test", f"run-{run_id}", capability.lower().replace(" ", "-")],
+        "description": f"Synthetic {capability.lower()} agent {n} of bulk registration run {run_id}",
+        "author": "Masumi Load Test",
+    }
+
+
+class RateLimiter:
+    """Spaces calls at most `rate` per second across all workers"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        at = max(now, self.next_at)
+        self.next_at = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+def _read_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_checkpoint(path: str, data: Dict[str, Any]):
+    with atomic_write(path, "w") as f:
+        json.dump(data, f)
+
+
+class BulkRegistration:
+    """One resumable bulk registration run over an MCPServerPool.
+
+    The checkpoint holds the run id, the target count and the numbers of
+    the agents registered so far. Registrations are not idempotent, so an
+    agent whose call timed out may be registered twice on resume; its
+    deterministic name makes such duplicates easy to spot.
+    """
+
+    def __init__(self, pool, count: int, run_id: str, network: str = "Preprod",
+                 concurrency: int = BULK_REGISTER_CONCURRENCY, rate: float = BULK_REGISTER_RATE,
+                 checkpoint: str = BULK_REGISTER_CHECKPOINT):
+        self.pool = pool
+        self.count = count
+        self.run_id = run_id
+        self.network = network
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate)
+        self.checkpoint = checkpoint
+        self.done: set = set()
+        self.resumed = 0
+        self.ok = 0
+        self.failed = 0
+        self.errors: Counter = Counter()
+        self.latencies: List[float] = []
+        self.started = 0.0
+        self.finished = 0.0
+        self._unsaved = 0
+
+    async def load(self):
+        """Pick up an earlier run with the same id from the checkpoint"""
+        data = await asyncio.to_thread(_read_checkpoint, self.checkpoint)
+        if not data or data.get("run_id") != self.run_id:
+            return
+        self.done = {n for n in data.get("done", []) if n < self.count}
+        self.resumed = len(self.done)
+        logger.info(f"📦 Resuming bulk run {self.run_id}: {self.resumed}/{self.count} already registered")
+
+    async def save(self):
+        data = {"run_id": self.run_id, "count": self.count, "network": self.network,
+                "done": sorted(self.done), "saved_at": time.time()}
+        await asyncio.to_thread(_write_checkpoint, self.checkpoint, data)
+        self._unsaved = 0
+
+    @property
+    def progress(self) -> str:
+        return f"{len(self.done)}/{self.count} registered, {self.failed} failed"
+
+    async def run(self, on_progress: Optional[Callable[["BulkRegistration"], None]] = None) -> Dict[str, Any]:
+        await self.load()
+        pending = iter([n for n in range(self.count) if n not in self.done])
+        self.started = time.monotonic()
+        try:
+            # Workers share one iterator, so each agent is taken exactly once
+            await asyncio.gather(*(self._worker(pending, on_progress) for _ in range(self.concurrency)))
+        finally:
+            self.finished = time.monotonic()
+            await self.save()
+        return self.report()
+
+    async def _worker(self, pending, on_progress):
+        for n in pending:
+            await self.limiter.wait()
+            await self._register(n)
+            if on_progress:
+                on_progress(self)
+            if self._unsaved >= _CHECKPOINT_EVERY:
+                await self.save()
+
+    async def _register(self, n: int):
+        started = time.monotonic()
+        error = None
+        # Background priority: user commands keep getting servers during a run
+        with request_scope("bulk_register", _CALL_BUDGET, priority=BACKGROUND):
+            try:
+                client = await self.pool.acquire()
+                try:
+                    result = await client.register_agent(network=self.network, **synthetic_agent(self.run_id, n))
+                finally:
+                    await self.pool.release(client)
+                if "Error" in result or result.startswith("❌"):
+                    error = result.strip().splitlines()[0][:80]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = f"{type(e).__name__}: {str(e)[:60]}"
+        self.latencies.append(time.monotonic() - started)
+        if error:
+            self.failed += 1
+            self.errors[error] += 1
+            BULK_REGISTRATIONS_TOTAL.labels("error").inc()
+        else:
+            self.ok += 1
+            self.done.add(n)
+            self._unsaved += 1
+            BULK_REGISTRATIONS_TOTAL.labels("ok").inc()
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        attempted = self.ok + self.failed
+        return {
+            "run_id": self.run_id,
+            "count": self.count,
+            "registered": len(self.done),
+            "resumed": self.resumed,
+            "attempted": attempted,
+            "ok": self.ok,
+            "failed": self.failed,
+            "error_rate": round(self.failed / attempted, 4) if attempted else 0.0,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_per_s": round(self.ok / elapsed, 2) if elapsed > 0 else 0.0,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 1),
+            "errors": dict(self.errors.most_common(5)),
+        }
+
+
+def render_report(report: Dict[str, Any]) -> str:
+    """Plain-text summary of BulkRegistration.report()"""
+    lines = [
+        f"Bulk run {report['run_id']}: {report['registered']}/{report['count']} registered"
+        f" ({report['resumed']} from an earlier run)",
+        f"This run: {report['ok']} ok, {report['failed']} failed ({report['error_rate']:.1%} errors)"
+        f" in {report['elapsed_s']}s, {report['throughput_per_s']}/s",
+        f"Latency p50 {report['p50_ms']}ms, p95 {report['p95_ms']}ms, p99 {report['p99_ms']}ms",
+    ]
+    for error, count in report["errors"].items():
+        lines.append(f"  {count}x {error}")
+    return "\n".join(lines)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, required=True, help="agents in the run")
+    parser.add_argument("--run-id", default="load", help="names the agents and identifies the checkpoint")
+    parser.add_argument("--network", default="Preprod")
+    parser.add_argument("--concurrency", type=int, default=BULK_REGISTER_CONCURRENCY,
+                        help="registrations in flight at once (one pooled MCP server each)")
+    parser.add_argument("--rate", type=float, default=BULK_REGISTER_RATE, help="registrations started per second")
+    parser.add_argument("--checkpoint", default=BULK_REGISTER_CHECKPOINT, help="progress file for resuming")
+    parser.add_argument("--fake", action="store_true", help="register against fake_mcp_server.py")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    from mcp_pool import MCPServerPool
+    logging.basicConfig(level=logging.WARNING)
+    # The run is background work, which never takes the reserved servers;
+    # nothing else uses them here, and servers only start when leased
+    pool = MCPServerPool(size=args.concurrency + BACKGROUND_RESERVED_SLOTS)
+    run = BulkRegistration(pool, args.count, args.run_id, args.network, args.concurrency, args.rate, args.checkpoint)
+    last = [0.0]
+
+    def on_progress(r: BulkRegistration):
+        if time.monotonic() - last[0] >= 5:
+            last[0] = time.monotonic()
+            print(f"… {r.progress}", flush=True)
+
+    try:
+        report = await run.run(on_progress)
+    finally:
+        await pool.close()
+    print(render_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if report["registered"] < report["count"] else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -11,7 +11,164 @@ if not TELEGRAM_BOT_TOKEN:
 # MCP Server Configuration
 MCP_SERVER_PATH = os.getenv("MCP_SERVER_PATH", "../masumi-mcp-server/server.py")
 PYTHONPATH = os.getenv("PYTHONPATH", "../masumi-mcp-server/")
+# Python interpreter with the MCP server's dependencies installed
+MCP_PYTHON = os.getenv("MCP_PYTHON", "/Users/marty/miniforge3/bin/python")
+# Grace period for a server to exit on SIGTERM before it is killed (seconds)
+MCP_STOP_TIMEOUT = float(os.getenv("MCP_STOP_TIMEOUT", "2.0"))
+# Largest single JSON-RPC line read from the server (bytes)
+MCP_STREAM_LIMIT = int(os.getenv("MCP_STREAM_LIMIT", str(64 * 1024 * 1024)))
 
 # Bot Settings
 BOT_USERNAME = os.getenv("BOT_USERNAME", "MasumiTestBot")
-DEBUG_MODE = os.getenv("DEBUG_MODE", "true").lower() == "true"
\ No newline at end of file
+DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
+# Pending /hire_agent sessions are dropped after this many seconds
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+
+# MCP request timeouts (seconds). The per-tool timeout adapts to observed
+# latency but never leaves the [MCP_MIN_TIMEOUT, MCP_REQUEST_TIMEOUT] range.
+MCP_REQUEST_TIMEOUT = float(os.getenv("MCP_REQUEST_TIMEOUT", "5.0"))
+MCP_MIN_TIMEOUT = float(os.getenv("MCP_MIN_TIMEOUT", "1.0"))
+MCP_TIMEOUT_PERCENTILE = float(os.getenv("MCP_TIMEOUT_PERCENTILE", "99"))
+MCP_TIMEOUT_MULTIPLIER = float(os.getenv("MCP_TIMEOUT_MULTIPLIER", "2.0"))
+MCP_LATENCY_WINDOW = int(os.getenv("MCP_LATENCY_WINDOW", "200"))
+
+# Circuit breaker settings (per tool and per upstream)
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30.0"))
+# Last good answers kept for idempotent calls, served while a breaker is open
+BREAKER_FALLBACK_ENTRIES = int(os.getenv("BREAKER_FALLBACK_ENTRIES", "256"))
+
+# End-to-end time budget for handling one Telegram update (seconds)
+HANDLER_DEADLINE = float(os.getenv("HANDLER_DEADLINE", "10.0"))
+
+# Warm MCP server pool. Hedging sends a duplicate of a slow idempotent read
+# to an idle server once the first attempt passes the observed percentile.
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "4"))
+MCP_HEDGING = os.getenv("MCP_HEDGING", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Priority scheduling of MCP capacity. Weights drive weighted fair queuing;
+# background work never takes the last BACKGROUND_RESERVED_SLOTS servers and
+# pauses while interactive queue wait exceeds INTERACTIVE_LATENCY_TARGET.
+SCHED_WEIGHT_INTERACTIVE = float(os.getenv("SCHED_WEIGHT_INTERACTIVE", "8"))
+SCHED_WEIGHT_NOTIFICATION = float(os.getenv("SCHED_WEIGHT_NOTIFICATION", "3"))
+SCHED_WEIGHT_BACKGROUND = float(os.getenv("SCHED_WEIGHT_BACKGROUND", "1"))
+BACKGROUND_RESERVED_SLOTS = int(os.getenv("BACKGROUND_RESERVED_SLOTS", "1"))
+INTERACTIVE_LATENCY_TARGET = float(os.getenv("INTERACTIVE_LATENCY_TARGET", "0.5"))
+
+# Append every MCP request/response pair to this log (JSONL, gzip if *.gz)
+MCP_RECORD_PATH = os.getenv("MCP_RECORD_PATH", "")
+
+# Prometheus metrics endpoint (GET /metrics); 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Tracing: fraction of updates traced, exported as JSONL and/or OTLP/HTTP JSON
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+
+# Logging goes through a bounded queue to a writer thread. LOG_SAMPLING keeps
+# a fraction of sub-WARNING records per logger ("httpx=0.05,masumi_client=0.5");
+# each log call site is limited to LOG_RATE_LIMIT records/s (0 = unlimited).
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "20"))
+LOG_RATE_BURST = float(os.getenv("LOG_RATE_BURST", "50"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Event loop health: lag is sampled every LOOP_LAG_INTERVAL seconds and logged
+# above LOOP_LAG_WARNING; callbacks holding the loop longer than
+# SLOW_CALLBACK_THRESHOLD are reported (0 disables the detector)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
+LOOP_LAG_WARNING = float(os.getenv("LOOP_LAG_WARNING", "0.1"))
+SLOW_CALLBACK_THRESHOLD = float(os.getenv("SLOW_CALLBACK_THRESHOLD", "0.05"))
+
+# Telegram user ids allowed to run operator commands such as /debug_profile
+ADMIN_USER_IDS = {int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").replace(" ", "").split(",") if uid}
+
+# On-demand sampling profiler (/debug_profile, SIGUSR2, GET /debug/profile)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+PROFILE_SIGNAL_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", "30"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".")
+
+# CPU-heavy decoding and rendering runs in a worker pool ("process", "thread"
+# or "off") once the payload reaches OFFLOAD_MIN_BYTES; smaller ones run inline.
+# json.loads holds the GIL for the whole parse, so only "process" keeps the
+# event loop free while a multi-megabyte payload is decoded.
+OFFLOAD_MODE = os.getenv("OFFLOAD_MODE", "process").lower()
+OFFLOAD_WORKERS = int(os.getenv("OFFLOAD_WORKERS", "2"))
+OFFLOAD_MIN_BYTES = int(os.getenv("OFFLOAD_MIN_BYTES", str(256 * 1024)))
+
+# Long results: above DELIVERY_DOCUMENT_THRESHOLD characters they are sent as a
+# file instead of several messages; files of DELIVERY_GZIP_THRESHOLD characters
+# or more are gzipped (0 disables compression)
+DELIVERY_DOCUMENT_THRESHOLD = int(os.getenv("DELIVERY_DOCUMENT_THRESHOLD", "16000"))
+DELIVERY_GZIP_THRESHOLD = int(os.getenv("DELIVERY_GZIP_THRESHOLD", str(1024 * 1024)))
+
+# Agent input schemas are cached (and compiled into validators) per agent
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", "256"))
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "600"))
+
+# Payment ledger: a local SQLite copy of the payment history serves
+# /query_payments. It is synced every LEDGER_SYNC_INTERVAL seconds, reading at
+# most LEDGER_SYNC_MAX_PAGES pages of LEDGER_SYNC_PAGE payments per round, and
+# fully rescanned every LEDGER_RESCAN_INTERVAL seconds to pick up status changes
+LEDGER_PATH = os.getenv("LEDGER_PATH", "payments.sqlite3")
+LEDGER_SYNC_INTERVAL = float(os.getenv("LEDGER_SYNC_INTERVAL", "60"))
+LEDGER_SYNC_PAGE = int(os.getenv("LEDGER_SYNC_PAGE", "100"))
+LEDGER_SYNC_MAX_PAGES = int(os.getenv("LEDGER_SYNC_MAX_PAGES", "20"))
+LEDGER_RESCAN_INTERVAL = float(os.getenv("LEDGER_RESCAN_INTERVAL", "3600"))
+PAYMENTS_PAGE_SIZE = int(os.getenv("PAYMENTS_PAGE_SIZE", "10"))
+
+# Completed job results are kept on disk under RESULT_STORE_DIR, content
+# addressed, and the least recently read are evicted past RESULT_STORE_MAX_BYTES
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR", "results")
+RESULT_STORE_MAX_BYTES = int(os.getenv("RESULT_STORE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Agent index: refreshed from list_agents every INDEX_REFRESH_INTERVAL seconds,
+# and checkpointed with the schema cache to SNAPSHOT_PATH every
+# SNAPSHOT_INTERVAL seconds so a restart can serve agents before the first refresh
+INDEX_REFRESH_INTERVAL = float(os.getenv("INDEX_REFRESH_INTERVAL", "300"))
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshot.bin")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "60"))
+
+# Registry change notifications: each chat may follow SUBSCRIPTIONS_PER_CHAT
+# topics, and notifications go out at most NOTIFY_RATE messages per second
+# (Telegram allows about 30 per second across chats)
+SUBSCRIPTIONS_PATH = os.getenv("SUBSCRIPTIONS_PATH", "subscriptions.json")
+SUBSCRIPTIONS_PER_CHAT = int(os.getenv("SUBSCRIPTIONS_PER_CHAT", "20"))
+NOTIFY_RATE = float(os.getenv("NOTIFY_RATE", "20"))
+
+# /recommend scoring weights: match on capability/tags/description, price
+# (cheaper is better), past hire success rate and hire latency (faster is better)
+RANK_WEIGHT_MATCH = float(os.getenv("RANK_WEIGHT_MATCH", "0.6"))
+RANK_WEIGHT_PRICE = float(os.getenv("RANK_WEIGHT_PRICE", "0.15"))
+RANK_WEIGHT_SUCCESS = float(os.getenv("RANK_WEIGHT_SUCCESS", "0.15"))
+RANK_WEIGHT_LATENCY = float(os.getenv("RANK_WEIGHT_LATENCY", "0.1"))
+
+# Inline mode (@bot <words>): matches for the last INLINE_CACHE_QUERIES query
+# texts are kept in memory, and Telegram may reuse an answer for
+# INLINE_CACHE_TIME seconds
+INLINE_CACHE_QUERIES = int(os.getenv("INLINE_CACHE_QUERIES", "2048"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "60"))
+
+# Bulk registration of synthetic agents (bulk_register.py, /bulk_register):
+# registrations in flight at once, started per second, and the progress file
+# a run resumes from
+BULK_REGISTER_CONCURRENCY = int(os.getenv("BULK_REGISTER_CONCURRENCY", str(MCP_POOL_SIZE)))
+BULK_REGISTER_RATE = float(os.getenv("BULK_REGISTER_RATE", "5"))
+BULK_REGISTER_CHECKPOINT = os.getenv("BULK_REGISTER_CHECKPOINT", "bulk_register.json")
+
+# Multi-process mode (supervisor.py): one poller routes updates to
+# SUPERVISOR_WORKERS bot processes over SUPERVISOR_SOCKET. WORKER_ID and
+# WORKER_COUNT are set for each worker by the supervisor; worker 0 also runs
+# the jobs that must run once (index refresh, snapshot checkpoints, payment
+# ledger sync)
+SUPERVISOR_WORKERS = int(os.getenv("SUPERVISOR_WORKERS", str(os.cpu_count() or 1)))
+SUPERVISOR_SOCKET = os.getenv("SUPERVISOR_SOCKET", "masumi-bot.sock")
+WORKER_ID = int(os.getenv("WORKER_ID", "0"))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
@@ -0,0 +1,155 @@
+import asyncio
+import gzip
+import io
+import logging
+import mmap
+from typing import Iterable, Iterator, List, Optional, Union
+
+from telegram import Message
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import BadRequest
+
+from config import DELIVERY_DOCUMENT_THRESHOLD, DELIVERY_GZIP_THRESHOLD
+from formatting import utf16_len
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DELIVERIES_TOTAL = registry.counter("masumi_bot_deliveries_total", "Long results delivered, by method", ("method",))
+
+# Room for the code fence, language and part counter. Budgets are in UTF-16
+# code units, as Telegram counts message length (emoji count twice)
+_FENCE_MARGIN = 128
+_ENCODE_SLICE = 64 * 1024
+# Bots may upload documents up to 50 MB
+_MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+# Bodies that can be sliced and uploaded as they are, e.g. a memory-mapped file
+_BYTES_LIKE = (bytes, bytearray, memoryview, mmap.mmap)
+
+Body = Union[str, bytes, bytearray, memoryview, mmap.mmap, Iterable[str]]
+
+
+def fence_safe(text: str) -> str:
+    """Keep a literal ``` inside the body from closing the code block"""
+    return text.replace("```", "`\u200b``")
+
+
+def _fitting_end(text: str, start: int, budget: int) -> int:
+    """The largest end such that text[start:end] is at most `budget` UTF-16 units"""
+    # Each character is one or two units, so the answer is within [budget // 2, budget] characters
+    low, high = start + max(1, budget // 2), min(len(text), start + budget)
+    if low >= high:
+        return high
+    while low < high:
+        middle = (low + high + 1) // 2
+        if utf16_len(text[start:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def split_chunks(text: str, budget: int) -> Iterator[str]:
+    """Slices of at most `budget` UTF-16 units, cut after a newline when there is one"""
+    start, total = 0, len(text)
+    while start < total:
+        end = _fitting_end(text, start, budget)
+        if end >= total:
+            yield text[start:]
+            return
+        cut = text.rfind("\n", start, end)
+        end = cut + 1 if cut > start else end
+        yield text[start:end]
+        start = end
+
+
+async def send_markdown(message: Message, text: str):
+    """Reply with Markdown, falling back to plain text if Telegram cannot parse it"""
+    try:
+        return await message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        if "parse entities" not in str(e).lower():
+            raise
+        logger.warning(f"⚠️ Markdown rejected, resending as plain text: {e}")
+        return await message.reply_text(text)
+
+
+def build_document(body: Body, compress: bool) -> io.BytesIO:
+    """Encode text (or bytes, or a generator of text pieces) into a buffer, gzipped if asked.
+
+    The body is written in slices so no second full-size string is created.
+    """
+    buffer = io.BytesIO()
+    sink = gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) if compress else buffer
+    if isinstance(body, (str, *_BYTES_LIKE)):
+        pieces = (body[i:i + _ENCODE_SLICE] for i in range(0, len(body), _ENCODE_SLICE))
+    else:
+        pieces = body
+    for piece in pieces:
+        sink.write(piece.encode("utf-8") if isinstance(piece, str) else piece)
+    if compress:
+        sink.close()
+    buffer.seek(0)
+    return buffer
+
+
+async def send_document(message: Message, body: Body, filename: str,
+                        caption: str = "", compress: Optional[bool] = None) -> Optional[Message]:
+    """Send text as a file; gzip it when large (or when `compress` says so).
+
+    Bytes-like bodies that need no compression are uploaded as they are.
+    Returns the sent message, whose document file id can be sent again.
+    """
+    sized = isinstance(body, (str, *_BYTES_LIKE))
+    if compress is None:
+        compress = bool(DELIVERY_GZIP_THRESHOLD) and sized and len(body) >= DELIVERY_GZIP_THRESHOLD
+    if not compress and isinstance(body, _BYTES_LIKE):
+        # InputFile takes bytes or a readable file; a bytearray, memoryview or mmap is copied
+        document = body if isinstance(body, bytes) else bytes(body)
+        size = len(document)
+    else:
+        # zlib releases the GIL, so building the file on a thread keeps the loop free
+        document = await asyncio.to_thread(build_document, body, compress)
+        size = document.getbuffer().nbytes
+    if not compress and size > _MAX_DOCUMENT_BYTES and sized:
+        document = await asyncio.to_thread(build_document, body, True)
+        size = document.getbuffer().nbytes
+        compress = True
+    if size > _MAX_DOCUMENT_BYTES:
+        await message.reply_text(f"⚠️ Result is too large to send ({size // (1024 * 1024)} MB).")
+        return None
+    DELIVERIES_TOTAL.labels("document_gzip" if compress else "document").inc()
+    return await message.reply_document(
+        document=document,
+        filename=filename + ".gz" if compress else filename,
+        caption=caption[:MessageLimit.CAPTION_LENGTH] or None,
+        parse_mode=ParseMode.MARKDOWN if caption else None,
+    )
+
+
+async def deliver(message: Message, header: str, body: str, language: str = "",
+                  filename: str = "result.txt"):
+    """Reply with `header` followed by `body` in a code block, however long the body is.
+
+    Short bodies go in one message. Longer ones are split on line boundaries
+    into several messages, each a complete code block so the Markdown stays
+    valid. Past DELIVERY_DOCUMENT_THRESHOLD characters the body is sent as a
+    document instead.
+    """
+    budget = MessageLimit.MAX_TEXT_LENGTH - _FENCE_MARGIN - utf16_len(header)
+    # Cheap length check first: a body over the budget in characters is over it in units too
+    if len(body) <= budget and utf16_len(safe := fence_safe(body)) <= budget:
+        DELIVERIES_TOTAL.labels("single").inc()
+        await send_markdown(message, f"{header}```{language}\n{safe}\n```")
+        return
+
+    if len(body) > DELIVERY_DOCUMENT_THRESHOLD:
+        await send_document(message, body, filename, caption=f"{header}📎 Full result attached ({len(body):,} characters)")
+        return
+
+    # Escaped before splitting, since escaping lengthens the body
+    chunks: List[str] = list(split_chunks(fence_safe(body), budget))
+    DELIVERIES_TOTAL.labels("chunked").inc()
+    await send_markdown(message, header.rstrip() + f" _(1/{len(chunks)})_\n\n```{language}\n{chunks[0]}\n```")
+    for part, chunk in enumerate(chunks[1:], 2):
+        await send_markdown(message, f"_({part}/{len(chunks)})_\n```{language}\n{chunk}\n```")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Fake Masumi MCP server for benchmarks and soak tests.
+
+Speaks the same JSON-RPC over stdio as the real server, so MasumiMCPClient
+can launch it in place of server.py (point MCP_SERVER_PATH here and
+MCP_PYTHON at any Python). Behaviour is driven by environment variables:
+
+  FAKE_MCP_LATENCY     latency distribution for tool calls, one of
+                       "fixed:<s>", "uniform:<lo>:<hi>", "lognormal:<median>:<sigma>"
+                       (default "lognormal:0.05:0.6"); per tool with
+                       FAKE_MCP_LATENCY_<TOOL_NAME>
+  FAKE_MCP_AGENTS      number of agents returned by list_agents/query_registry
+  FAKE_MCP_PAYLOAD_PAD extra bytes of description per agent
+  FAKE_MCP_PAYMENTS    size of the payment history paged by query_payments
+  FAKE_MCP_ERROR_RATE  probability a tool call returns an upstream error
+  FAKE_MCP_CRASH_RATE  probability the process exits mid-request
+  FAKE_MCP_SEED        random seed for reproducible runs
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+rng = random.Random(os.getenv("FAKE_MCP_SEED"))
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Turn a latency spec string into a sampler returning seconds"""
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+DEFAULT_LATENCY = parse_latency(os.getenv("FAKE_MCP_LATENCY", "lognormal:0.05:0.6"))
+AGENT_COUNT = int(os.getenv("FAKE_MCP_AGENTS", "50"))
+PAYLOAD_PAD = int(os.getenv("FAKE_MCP_PAYLOAD_PAD", "0"))
+PAYMENT_COUNT = int(os.getenv("FAKE_MCP_PAYMENTS", "250"))
+ERROR_RATE = float(os.getenv("FAKE_MCP_ERROR_RATE", "0"))
+CRASH_RATE = float(os.getenv("FAKE_MCP_CRASH_RATE", "0"))
+
+
+def latency_for(tool_name: str) -> float:
+    spec = os.getenv(f"FAKE_MCP_LATENCY_{tool_name.upper()}")
+    return parse_latency(spec)() if spec else DEFAULT_LATENCY()
+
+
+def make_agent(i: int) -> Dict[str, Any]:
+    return {
+        "agentIdentifier": f"fake{i:06d}" + "ab" * 28,
+        "name": f"masumi-test-fake-{i}",
+        "apiBaseUrl": f"https://fake-agent-{i}.masumi-test.network/",
+        "capability": {"name": ["Summarizer", "Translator", "Image Tagger", "Coder"][i % 4], "version": "1.0.0"},
+        "tags": ["fake", ["text", "vision", "code"][i % 3]],
+        "description": "Synthetic agent for load testing. " + "x" * PAYLOAD_PAD,
+        "pricing": [{"unit": "lovelace", "quantity": str(1000000 + 1000 * (i % 50))}],
+    }
+
+
+def make_payment(i: int) -> Dict[str, Any]:
+    created = 1_760_000_000 + 600 * i
+    return {
+        "id": f"pay-{i:06d}",
+        "status": ["Pending", "Completed", "Refunded", "Completed"][i % 4],
+        "agentIdentifier": make_agent(i % AGENT_COUNT)["agentIdentifier"],
+        "createdAt": f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(created))}.000Z",
+        "requestedFunds": [{"amount": str(1000000 + 1000 * (i % 50)), "unit": "lovelace"}],
+    }
+
+
+def payments_page(limit: int, cursor_id: Optional[str]) -> List[Dict[str, Any]]:
+    """Newest first; a page continues after the cursor payment, like the payment service"""
+    start = PAYMENT_COUNT - 1
+    if cursor_id:
+        start = int(cursor_id.rsplit("-", 1)[-1]) - 1
+    return [make_payment(i) for i in range(start, max(start - limit, -1), -1)]
+
+
+def tool_result(tool_name: str, arguments: Dict[str, Any]) -> Any:
+    """Canned payload for each tool the bot uses"""
+    if tool_name in ("list_agents", "query_registry"):
+        return [make_agent(i) for i in range(AGENT_COUNT)]
+    if tool_name == "query_payments":
+        return payments_page(int(arguments.get("limit", 10)), arguments.get("cursor_id"))
+    if tool_name == "get_agent_input_schema":
+        return {"input_data": [{"id": "text", "type": "string", "name": "Text"}]}
+    if tool_name == "hire_agent":
+        return {"job_id": f"job-{rng.randrange(10 ** 9)}", "status": "running"}
+    if tool_name == "check_job_status":
+        return {"job_id": arguments.get("job_id"), "status": "completed"}
+    if tool_name == "get_job_full_result":
+        return {"job_id": arguments.get("job_id"), "status": "completed", "result": "y" * (PAYLOAD_PAD or 1024)}
+    if tool_name == "register_agent":
+        return {"status": "registered", "name": arguments.get("name")}
+    return {"echo": arguments}
+
+
+class FakeServer:
+    """Line-delimited JSON-RPC loop handling requests concurrently"""
+
+    def __init__(self, writer: Callable[[Dict[str, Any]], None]):
+        self.write = writer
+        self.tasks: Dict[Any, asyncio.Task] = {}
+
+    async def handle(self, message: Dict[str, Any]):
+        method = message.get("method")
+        if "id" not in message:
+            if method == "notifications/cancelled":
+                task = self.tasks.get(message.get("params", {}).get("requestId"))
+                if task:
+                    task.cancel()
+            return
+        if method == "initialize":
+            self.reply(message["id"], {
+                "protocolVersion": "2024-11-05",
+                "capabilities": {"tools": {}},
+                "serverInfo": {"name": "fake-masumi", "version": "0.0.1"}
+            })
+            return
+        if method == "tools/call":
+            self.tasks[message["id"]] = asyncio.create_task(self.call_tool(message))
+            return
+        self.write({"jsonrpc": "2.0", "id": message["id"],
+                    "error": {"code": -32601, "message": f"Method not found: {method}"}})
+
+    async def call_tool(self, message: Dict[str, Any]):
+        params = message["params"]
+        try:
+            await asyncio.sleep(latency_for(params["name"]))
+            if rng.random() < CRASH_RATE:
+                os._exit(3)
+            if rng.random() < ERROR_RATE:
+                self.reply(message["id"], {"content": [{"type": "text", "text": "Error: injected upstream failure"}],
+                                           "isError": True})
+                return
+            text = json.dumps(tool_result(params["name"], params.get("arguments", {})))
+            self.reply(message["id"], {"content": [{"type": "text", "text": text}]})
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.tasks.pop(message["id"], None)
+
+    def reply(self, request_id: Any, result: Dict[str, Any]):
+        self.write({"jsonrpc": "2.0", "id": request_id, "result": result})
+
+
+async def serve(handler_factory=FakeServer):
+    """Run a JSON-RPC stdio loop with the given server class"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2 ** 24)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    def write(message: Dict[str, Any]):
+        sys.stdout.write(json.dumps(message) + "\n")
+        sys.stdout.flush()
+
+    server = handler_factory(write)
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        await server.handle(message)
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,334 @@
+"""
+Pure parsing and rendering helpers for MCP tool results.
+
+Kept free of bot, config and event loop state so they can run in an offload
+worker thread or process (see offload.py) as well as inline.
+"""
+import hashlib
+import json
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def decode_response(line: bytes) -> Optional[Dict[str, Any]]:
+    """One line of MCP server output as a JSON-RPC message, or None if it is not one.
+
+    Only what the client reads is kept: the id, any error, and a result's
+    first content text and isError flag. Run in a worker process, the rest
+    of a large envelope is never pickled back to the event loop.
+    """
+    try:
+        message = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(message, dict):
+        return None
+    decoded = {"id": message.get("id")}
+    if "error" in message:
+        decoded["error"] = message["error"]
+    result = message.get("result")
+    if isinstance(result, dict):
+        content = result.get("content")
+        if content and isinstance(content, list):
+            first = content[0] if isinstance(content[0], dict) else {}
+            result = {"content": [{"text": first.get("text", "No content")}], "isError": bool(result.get("isError"))}
+        else:
+            result = {}
+    if "result" in message:
+        decoded["result"] = result
+    return decoded
+
+
+def count_agents(result: str) -> int:
+    """Number of agents in a list_agents result; raises ValueError if not JSON"""
+    agents_data = json.loads(result)
+    return len(agents_data) if isinstance(agents_data, list) else 0
+
+
+def render_agents(cards: Iterable[str], total: int) -> str:
+    """Markdown listing of registry agents from their pre-rendered cards, as many as fit"""
+    if total > 0:
+        header = f"🤖 *Masumi Agent Marketplace*\n\n"
+        header += f"📊 *{total} agents discovered*\n\n"
+
+        def footer(shown: int) -> str:
+            message = f"\n... and {total - shown} more agents available\n" if total > shown else ""
+            message += "\n🚀 *Ready for agent interactions!*\n"
+            message += "💡 *Next:* Use `/search_agents <words>`, `/hire_agent <agent_id>` or `/register_test_agent`"
+            return message
+
+        return fill_message(header, (f"🔹 {card}" for card in cards), footer)
+    message = "📭 *No agents currently registered*\n\n"
+    message += "🔧 *Demo Mode:* Use `/register_test_agent` to create a test agent\n"
+    message += "🌟 *Or explore the Masumi network for live agents*"
+    return message
+
+
+# Registry fields the agent index keeps; the rest of each entry is dropped
+AGENT_FIELDS = ("agentIdentifier", "name", "apiBaseUrl", "capability", "tags", "description",
+                "authorName", "pricing", "agentPricing")
+_DESCRIPTION_CHARS = 500
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def capability_name(agent: dict, default: str = "") -> str:
+    """An agent's capability name; registries send either {"name": ...} or a plain string"""
+    capability = agent.get("capability") or {}
+    name = capability.get("name", default) if isinstance(capability, dict) else capability
+    return str(name)
+
+
+def agent_tokens(agent: dict) -> Tuple[str, ...]:
+    """Search terms for an agent: name, capability, tags and description words"""
+    parts = [str(agent.get("name", "")), capability_name(agent),
+             " ".join(map(str, agent.get("tags") or [])), str(agent.get("description", ""))]
+    return tuple(sorted(set(tokenize(" ".join(parts)))))
+
+
+def agent_topics(agent: dict) -> List[str]:
+    """Subscription topics an agent belongs to: its capability name and tags, lowercased"""
+    topics = {capability_name(agent).strip().lower()} | {str(tag).strip().lower() for tag in agent.get("tags") or []}
+    topics.discard("")
+    return sorted(topics)
+
+
+def agent_price(agent: dict) -> float:
+    """Lowest lovelace price an agent lists, or NaN when it lists none"""
+    pricing = agent.get("agentPricing") or {}
+    if isinstance(pricing, dict):
+        prices = pricing.get("fixedPricing") or pricing.get("pricing") or []
+    else:
+        prices = pricing
+    prices = list(prices or []) + list(agent.get("pricing") or [])
+    amounts = []
+    for price in prices:
+        if not isinstance(price, dict) or price.get("unit", "lovelace") not in ("lovelace", ""):
+            continue
+        try:
+            amounts.append(float(price.get("amount", price.get("quantity"))))
+        except (TypeError, ValueError):
+            continue
+    return min(amounts) if amounts else float("nan")
+
+
+_MARKDOWN_SPECIAL = re.compile(r"([_*`\[])")
+# Telegram's limit on message length (MessageLimit.MAX_TEXT_LENGTH), in UTF-16 code units
+MESSAGE_CHARS = 4096
+
+
+def escape_markdown(text: str) -> str:
+    """Escape the characters Telegram's Markdown treats as markup"""
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", text)
+
+
+def render_agent_card(agent: dict) -> str:
+    """An agent as a Markdown fragment: name, capability, price and identifier"""
+    capability = capability_name(agent, "General AI")
+    price = agent_price(agent)
+    cost = _ada(int(price)) if price == price else "price n/a"
+    return (f"*{escape_markdown(str(agent.get('name') or 'Unnamed'))}* · {escape_markdown(capability)} · {cost}\n"
+            f"    `{agent['agentIdentifier']}`\n")
+
+
+def render_agent_cards(entries) -> List[str]:
+    """AgentIndex deriver: a card per index entry, rendered once per refresh"""
+    return [render_agent_card(agent) for agent, _, _ in entries]
+
+
+def utf16_len(text: str) -> int:
+    """Length as Telegram counts it: emoji and other non-BMP characters count twice"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def clip_utf8(text: str, limit: int) -> str:
+    """The longest prefix of `text` that is at most `limit` bytes in UTF-8"""
+    return text.encode("utf-8")[:limit].decode("utf-8", "ignore")
+
+
+def fill_message(header: str, fragments: Iterable[str], footer: Callable[[int], str],
+                 budget: int = MESSAGE_CHARS) -> str:
+    """`header`, then fragments in order while they fit in `budget`, then footer(number shown).
+
+    `fragments` is consumed lazily, so a listing of the whole registry only
+    touches the cards that make it into the message.
+    """
+    # The footer's counts can grow by a few digits once fragments are shown
+    used = utf16_len(header) + utf16_len(footer(0)) + 8
+    parts = [header]
+    for fragment in fragments:
+        size = utf16_len(fragment)
+        if used + size > budget:
+            break
+        parts.append(fragment)
+        used += size
+    parts.append(footer(len(parts) - 1))
+    return "".join(parts)
+
+
+def render_inline_card(agent: dict, card: str) -> Tuple[str, str, str]:
+    """Title, description line and Markdown message for an inline query result"""
+    capability = capability_name(agent, "General AI")
+    price = agent_price(agent)
+    cost = _ada(int(price)) if price == price else "price n/a"
+    description = str(agent.get("description") or "")
+    summary = f"{capability} · {cost}" + (f" · {description[:80]}" if description else "")
+    text = f"🤖 {card}\n💡 Hire it with `/hire_agent {agent['agentIdentifier']}`"
+    return str(agent.get("name") or "Unnamed"), summary, text
+
+
+def extract_agents(result: str) -> List[Tuple[dict, Tuple[str, ...], str]]:
+    """Slim agent entries with their search terms and content hash from a list_agents result.
+
+    Raises ValueError if the result is not JSON. Runs in the offload pool, so
+    it returns only what the index keeps rather than the full registry.
+    """
+    data = json.loads(result)
+    if isinstance(data, dict):
+        data = data.get("agents") or data.get("data") or []
+    agents = []
+    for entry in data if isinstance(data, list) else []:
+        if not isinstance(entry, dict) or not entry.get("agentIdentifier"):
+            continue
+        agent = {key: entry[key] for key in AGENT_FIELDS if key in entry}
+        if isinstance(agent.get("description"), str):
+            agent["description"] = agent["description"][:_DESCRIPTION_CHARS]
+        digest = hashlib.blake2b(json.dumps(agent, sort_keys=True).encode(), digest_size=16).hexdigest()
+        agents.append((agent, agent_tokens(agent), digest))
+    return agents
+
+
+def render_search_results(query: str, cards: List[str], total: int) -> str:
+    """Markdown for /search_agents matches, from their pre-rendered cards"""
+    if not cards:
+        return (f"🔎 No agents match *{escape_markdown(query)}*.\n\n"
+                "💡 Try a capability or tag, e.g. `/search_agents translator`")
+    header = f"🔎 *{total} agents match* _{escape_markdown(query)}_\n\n"
+
+    def footer(shown: int) -> str:
+        return f"\n... and {total - shown} more; refine the query to narrow it down" if total > shown else ""
+
+    return fill_message(header, (f"🔹 {card}" for card in cards), footer)
+
+
+def _code(text: str) -> str:
+    """Text for inside a `code` span, where Markdown has no escapes"""
+    return text.replace("`", "'")
+
+
+def _ada(lovelace: int) -> str:
+    return f"{lovelace / 1_000_000:,.2f} ₳"
+
+
+def render_payments_page(page: dict, page_no: int, pages: int, status: str = "",
+                         agent_prefix: str = "", synced_at: float = 0.0) -> str:
+    """Markdown for one /query_payments page from PaymentLedger.page()"""
+    message = "💳 *Payment History*\n\n"
+    totals = page["totals"]
+    if totals:
+        message += "📊 " + " · ".join(f"{escape_markdown(t['status'])}: {t['count']} ({_ada(t['total'])})"
+                                     for t in totals) + "\n"
+    # Both filters are typed by the user
+    filters = [f"status {escape_markdown(status)}"] if status else []
+    if agent_prefix:
+        filters.append(f"agent `{_code(agent_prefix)}…`")
+    if filters:
+        message += f"🔎 Filtered by {', '.join(filters)}: {page['matched']} payments\n"
+    message += "\n"
+
+    if not page["payments"]:
+        message += "📭 No payments match.\n"
+    for payment in page["payments"]:
+        created = time.strftime("%Y-%m-%d %H:%M", time.gmtime(payment["created_at"]))
+        amount = _ada(payment["amount"]) if payment["unit"] == "lovelace" else f"{payment['amount']} {escape_markdown(payment['unit'])}"
+        message += f"🔹 `{_code(payment['id'][:24])}` {escape_markdown(payment['status'])} · {amount}\n"
+        message += f"    {created} UTC · agent `{_code(payment['agent'][:16])}…`\n"
+
+    message += f"\n📄 Page {page_no}/{max(pages, 1)}"
+    if synced_at:
+        message += f" · synced {time.strftime('%H:%M:%S', time.gmtime(synced_at))} UTC"
+    return message
+
+
+# Telegram's limit on a button's callback data, in UTF-8 bytes
+CALLBACK_DATA_BYTES = 64
+
+
+def payments_callback_data(page_no: int, status: str, agent_prefix: str) -> Optional[str]:
+    """Callback data for a /query_payments button: pay:<page>:<status>:<agent prefix>.
+
+    An empty field means no filter. None when a field contains the ":"
+    separator or the whole would not fit Telegram's 64 bytes.
+    """
+    if ":" in status or ":" in agent_prefix:
+        return None
+    data = f"pay:{page_no}:{status}:{agent_prefix}"
+    return data if len(data.encode("utf-8")) <= CALLBACK_DATA_BYTES else None
+
+
+def parse_payments_callback(data: str) -> Optional[Tuple[int, str, str]]:
+    """(page, status, agent prefix) from payments_callback_data(), or None if malformed"""
+    parts = data.split(":")
+    if len(parts) != 4 or parts[0] != "pay" or not parts[1].isdigit():
+        return None
+    return max(1, int(parts[1])), parts[2], parts[3]
+
+
+# Job states after which get_job_full_result no longer changes
+COMPLETED_JOB_STATES = {"completed", "complete", "done", "success", "succeeded"}
+FAILED_JOB_STATES = {"failed", "failure", "cancelled", "canceled"}
+
+
+def job_result_status(result: str) -> Optional[str]:
+    """"completed" or "failed" when a get_job_full_result reply is a finished job's result, else None.
+
+    Only a JSON reply with a terminal status counts; plain text such as "Job
+    not found" or an upstream hiccup is never taken as final, so it is not cached.
+    """
+    try:
+        data = json.loads(result)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    status = str(data.get("status", "")).lower()
+    if status in COMPLETED_JOB_STATES:
+        return "completed"
+    if status in FAILED_JOB_STATES:
+        return "failed"
+    return None
+
+
+def _agent_line(agent: dict) -> str:
+    name = escape_markdown(str(agent.get("name") or "Unnamed"))
+    capability = escape_markdown(capability_name(agent, "General AI"))
+    return f"• {name} · {capability}\n  `{agent['agentIdentifier']}`\n"
+
+
+def render_registry_changes(topics: List[str], changes: dict, limit: int = 10) -> str:
+    """Markdown notification of registry changes matching a chat's subscriptions"""
+    message = f"🔔 *Registry update for* {escape_markdown(', '.join(topics))}\n"
+    for kind, title in (("added", "🆕 *New agents*"), ("changed", "✏️ *Updated agents*"),
+                        ("removed", "🗑️ *Removed agents*")):
+        agents = changes.get(kind) or []
+        if not agents:
+            continue
+        message += f"\n{title} ({len(agents)})\n"
+        message += "".join(_agent_line(agent) for agent in agents[:limit])
+        if len(agents) > limit:
+            message += f"… and {len(agents) - limit} more\n"
+    message += "\n💡 `/unsubscribe <topic>` to stop these"
+    return message
+
+
+def render_recommendations(task: str, ranked: list) -> str:
+    """Markdown for /recommend: (card, score) pairs, best first"""
+    if not ranked:
+        return f"🤷 No agents look suited to *{escape_markdown(task)}*.\n\n💡 Try other words, or `/search_agents <words>`"
+    header = f"🎯 *Best agents for* _{escape_markdown(task)}_\n\n"
+    return fill_message(header, (f"{i}. {card}    score {score:.2f}\n" for i, (card, score) in enumerate(ranked, 1)),
+                        lambda shown: "")
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+from telegram.constants import ParseMode
+
+from agent_index import agent_index
+from config import INLINE_CACHE_QUERIES
+from formatting import render_inline_card, tokenize
+from metrics import CACHE_REQUESTS_TOTAL
+from ranking import AgentMatrix, ranker, short_id
+
+
+class InlineSearch:
+    """Answers inline queries from the agent index, never from MCP.
+
+    Telegram sends a query per keystroke of "@bot transl…", and another for
+    each page as the user scrolls, so matches are computed once per query
+    text and cached until the index changes; pages are slices of the cached
+    positions. A query not seen yet is matched among the cached matches of
+    its longest seen prefix ("transl" among those of "trans"). Result
+    articles are built once per agent.
+    """
+
+    def __init__(self, max_queries: int = INLINE_CACHE_QUERIES):
+        self.max_queries = max_queries
+        self.matches: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.articles: Dict[str, InlineQueryResultArticle] = {}
+        self._matrix: Optional[AgentMatrix] = None
+
+    def _current(self) -> AgentMatrix:
+        matrix = ranker.current()
+        if matrix is not self._matrix:
+            # Positions and cards refer to the previous index contents
+            self.matches.clear()
+            self.articles.clear()
+            self._matrix = matrix
+        return matrix
+
+    def match(self, query: str) -> np.ndarray:
+        """Positions of agents matching every query word as a prefix, in registry order"""
+        matrix = self._current()
+        words = tokenize(query)
+        key = " ".join(words)
+        positions = self.matches.get(key)
+        if positions is not None:
+            self.matches.move_to_end(key)
+            CACHE_REQUESTS_TOTAL.labels("inline_query", "hit").inc()
+            return positions
+        # Each keystroke extends the previous query, whose matches hold this one's
+        shorter = next((self.matches[key[:end]] for end in range(len(key) - 1, 0, -1)
+                        if key[:end] in self.matches), None)
+        CACHE_REQUESTS_TOTAL.labels("inline_query", "miss" if shorter is None else "prefix").inc()
+        positions = matrix.prefix_match(words, within=shorter)
+        self.matches[key] = positions
+        if len(self.matches) > self.max_queries:
+            self.matches.popitem(last=False)
+        return positions
+
+    def page(self, query: str, offset: int, limit: int) -> Tuple[List[InlineQueryResultArticle], Optional[int]]:
+        """Results from `offset` on, and the offset of the next page if there is one"""
+        positions = self.match(query)
+        matrix = self._matrix
+        results = [self._article(matrix.agents[i]) for i in positions[offset:offset + limit]]
+        more = offset + limit < len(positions)
+        return results, offset + limit if more else None
+
+    def _article(self, agent) -> InlineQueryResultArticle:
+        agent_id = agent["agentIdentifier"]
+        article = self.articles.get(agent_id)
+        if article is None:
+            title, description, text = render_inline_card(agent, agent_index.cards[agent_id])
+            article = self.articles[agent_id] = InlineQueryResultArticle(
+                id=short_id(agent_id), title=title, description=description,
+                input_message_content=InputTextMessageContent(text, parse_mode=ParseMode.MARKDOWN))
+        return article
+
+
+inline_search = InlineSearch()
@@ -0,0 +1,264 @@
+import atexit
+import copy
+import json
+import linecache
+import logging
+import logging.handlers
+import numbers
+import queue
+import random
+import sys
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+
+from config import DEBUG_MODE, LOG_FORMAT, LOG_SAMPLING, LOG_RATE_LIMIT, LOG_RATE_BURST, LOG_QUEUE_SIZE
+from metrics import registry
+from request_context import current_request
+from tracing import current_span
+
+LOG_RECORDS_TOTAL = registry.counter("masumi_bot_log_records_total", "Log records by fate", ("level", "result"))
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "exc_snapshot"}
+# Log arguments kept as they are; anything else is queued as its repr()
+_IMMUTABLE_ARGS = (str, bytes, numbers.Number, type(None))
+_CAUSE = "The above exception was the direct cause of the following exception:"
+_CONTEXT = "During handling of the above exception, another exception occurred:"
+
+
+def _snapshot_arg(value):
+    return value if isinstance(value, _IMMUTABLE_ARGS) else repr(value)
+
+
+def _exception_lines(exc: BaseException):
+    """The last lines of a traceback for one exception, without touching its chain.
+
+    traceback.format_exception_only() builds the whole chain's stack summaries,
+    which reads source files; this only needs the type, message and notes.
+    """
+    cls = type(exc)
+    name = cls.__qualname__ if cls.__module__ in ("builtins", "__main__") else f"{cls.__module__}.{cls.__qualname__}"
+    try:
+        message = str(exc)
+    except Exception:
+        message = "<exception str() failed>"
+    lines = [f"{name}: {message}\n" if message else f"{name}\n"]
+    notes = getattr(exc, "__notes__", None)
+    if isinstance(notes, (list, tuple)):
+        lines.extend(f"{note}\n" for note in notes)
+    return lines
+
+
+class ExceptionSnapshot:
+    """A traceback reduced to file names, line numbers and exception text.
+
+    Taking one walks the frames but reads no source files, so it is cheap
+    enough for the event loop; format() looks up the source lines later, on
+    the writer thread. The cause/context chain is kept, as in a traceback.
+    """
+
+    __slots__ = ("parts",)
+
+    def __init__(self, exc: BaseException):
+        # (frames, exception lines, how it follows from the next part), outermost first
+        self.parts = []
+        seen = set()
+        while exc is not None and id(exc) not in seen:
+            seen.add(id(exc))
+            if exc.__cause__ is not None:
+                inner, link = exc.__cause__, _CAUSE
+            elif exc.__context__ is not None and not exc.__suppress_context__:
+                inner, link = exc.__context__, _CONTEXT
+            else:
+                inner, link = None, None
+            frames = [(frame.f_code.co_filename, lineno, frame.f_code.co_name)
+                      for frame, lineno in traceback.walk_tb(exc.__traceback__)]
+            self.parts.append((frames, _exception_lines(exc), link))
+            exc = inner
+
+    def format(self) -> str:
+        lines = []
+        for frames, exception, link in reversed(self.parts):
+            if link:
+                lines.append(f"\n{link}\n\n")
+            if frames:
+                lines.append("Traceback (most recent call last):\n")
+            for filename, lineno, name in frames:
+                lines.append(f'  File "{filename}", line {lineno}, in {name}\n')
+                source = linecache.getline(filename, lineno).strip()
+                if source:
+                    lines.append(f"    {source}\n")
+            lines.extend(exception)
+        return "".join(lines).rstrip("\n")
+
+
+def _render_exception(record: logging.LogRecord):
+    """Writer thread: turn a queued ExceptionSnapshot into exc_text"""
+    snapshot = getattr(record, "exc_snapshot", None)
+    if snapshot is not None and not record.exc_text:
+        record.exc_text = snapshot.format()
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """Parse "httpx=0.05,masumi_client=0.5" into logger prefix -> keep ratio"""
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, rate = part.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Drops sampled-out and over-rate records before they cost anything.
+
+    Below WARNING, records are kept at the ratio configured for the longest
+    matching logger prefix. Every call site (logger and line) is also rate
+    limited by a token bucket; the next record that gets through carries
+    the number suppressed in between.
+    """
+
+    def __init__(self, rates: Dict[str, float], rate_limit: float, burst: float):
+        super().__init__()
+        self.rates = rates
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self._ratio_cache: Dict[str, float] = {}
+        self._buckets: Dict[Tuple[str, int], list] = {}
+        self._suppressed: Dict[Tuple[str, int], int] = {}
+
+    def ratio_for(self, name: str) -> float:
+        ratio = self._ratio_cache.get(name)
+        if ratio is None:
+            matches = [prefix for prefix in self.rates if name == prefix or name.startswith(prefix + ".")]
+            ratio = self.rates[max(matches, key=len)] if matches else 1.0
+            self._ratio_cache[name] = ratio
+        return ratio
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            ratio = self.ratio_for(record.name)
+            if ratio < 1.0 and random.random() >= ratio:
+                LOG_RECORDS_TOTAL.labels(record.levelname, "sampled").inc()
+                return False
+        if self.rate_limit <= 0:
+            return True
+
+        site = (record.name, record.lineno)
+        now = time.monotonic()
+        bucket = self._buckets.get(site)
+        if bucket is None:
+            bucket = self._buckets[site] = [self.burst, now]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_limit)
+        bucket[1] = now
+        if bucket[0] < 1.0:
+            self._suppressed[site] = self._suppressed.get(site, 0) + 1
+            LOG_RECORDS_TOTAL.labels(record.levelname, "rate_limited").inc()
+            return False
+        bucket[0] -= 1.0
+        suppressed = self._suppressed.pop(site, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without waiting or formatting.
+
+    The queued copy holds no live objects: arguments that could change
+    before the writer gets to them are reduced to their repr(), and an
+    exception to an ExceptionSnapshot. The message, the source lines of a
+    traceback and the layout are all rendered on the writer thread. The
+    context that lives in this task (trace and request) is captured here.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if not isinstance(record.msg, str):
+            record.msg = str(record.msg)
+        if isinstance(record.args, dict):
+            record.args = {key: _snapshot_arg(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(map(_snapshot_arg, record.args))
+        if record.exc_info:
+            if record.exc_info[1] is not None and not record.exc_text:
+                record.exc_snapshot = ExceptionSnapshot(record.exc_info[1])
+            record.exc_info = None
+        span = current_span.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+        request = current_request.get()
+        if request is not None:
+            record.request = request.name
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            LOG_RECORDS_TOTAL.labels(record.levelname, "queued").inc()
+        except queue.Full:
+            LOG_RECORDS_TOTAL.labels(record.levelname, "dropped").inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "site": f"{record.module}:{record.lineno}",
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        _render_exception(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The original human-readable format, plus pipeline context"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        _render_exception(record)
+        line = super().format(record)
+        if getattr(record, "suppressed", 0):
+            line += f" [{record.suppressed} similar suppressed]"
+        return line
+
+
+def setup_logging(level: int = logging.DEBUG if DEBUG_MODE else logging.INFO) -> logging.handlers.QueueListener:
+    """Route all logging through a bounded queue drained by a writer thread"""
+    records: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(SamplingFilter(parse_sampling(LOG_SAMPLING), LOG_RATE_LIMIT, LOG_RATE_BURST))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, writer, respect_handler_level=True)
+    listener.start()
+
+    def flush_on_exit():
+        # Drains whatever is still queued; skipped if already stopped
+        if listener._thread is not None:
+            listener.stop()
+
+    atexit.register(flush_on_exit)
+    return listener
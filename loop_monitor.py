@@ -0,0 +1,135 @@
+import asyncio
+import inspect
+import logging
+import sys
+import threading
+import time
+from typing import Optional, Tuple
+
+from config import LOOP_LAG_INTERVAL, LOOP_LAG_WARNING, SLOW_CALLBACK_THRESHOLD
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = registry.histogram("masumi_bot_event_loop_lag_seconds",
+                                      "Delay between when a timer was due and when it ran",
+                                      buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+LOOP_LAG_MAX = registry.gauge("masumi_bot_event_loop_lag_max_seconds", "Largest event loop lag in the current minute")
+SLOW_CALLBACKS_TOTAL = registry.counter("masumi_bot_slow_callbacks_total",
+                                        "Callbacks that held the event loop past the threshold", ("source",))
+SLOW_CALLBACK_SECONDS = registry.histogram("masumi_bot_slow_callback_seconds",
+                                           "How long slow callbacks held the event loop", ("source",))
+
+
+def describe_stack(frame) -> Tuple[str, Optional[str]]:
+    """Name what a blocked loop thread is running, and where, from its stack.
+
+    The source is the innermost coroutine on the stack (the async function
+    that made the blocking call, i.e. the handler), else the innermost
+    function. The location is the innermost line outside asyncio itself.
+    """
+    source, location = None, None
+    while frame is not None:
+        code = frame.f_code
+        if "/asyncio/" not in code.co_filename:
+            if location is None:
+                location = f"{code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno} in {code.co_name}"
+            if source is None and code.co_flags & inspect.CO_COROUTINE:
+                source = code.co_qualname
+        frame = frame.f_back
+    return source or (location.rsplit(" in ", 1)[-1] if location else "unknown"), location
+
+
+class LoopMonitor:
+    """Measures event loop scheduling delay and reports what blocks it.
+
+    Lag is sampled by a task that sleeps for a fixed interval and records how
+    late it woke up. Blocking is found with a heartbeat: a callback on the
+    loop stamps the time every quarter of the slow threshold, and a watchdog
+    thread that sees the stamp go stale samples the loop thread's stack
+    while it is still blocked. The heartbeat reports the stall once the loop
+    runs again.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, lag_warning: float = LOOP_LAG_WARNING,
+                 slow_threshold: float = SLOW_CALLBACK_THRESHOLD):
+        self.interval = interval
+        self.lag_warning = lag_warning
+        self.slow_threshold = slow_threshold
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._period = slow_threshold / 4
+        self._beat_handle: Optional[asyncio.TimerHandle] = None
+        self._last_beat = 0.0
+        # Stack sample of the current stall, and the beat it followed
+        self._culprit: Optional[Tuple[str, Optional[str]]] = None
+        self._caught = 0.0
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._task = loop.create_task(self._measure_lag())
+        if self.slow_threshold > 0 and self._watchdog is None:
+            self._stopped.clear()
+            self._last_beat = time.monotonic()
+            self._beat_handle = loop.call_later(self._period, self._beat, loop)
+            self._watchdog = threading.Thread(target=self._watch, args=(threading.get_ident(),),
+                                              name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog is not None:
+            self._beat_handle.cancel()
+            self._stopped.set()
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _measure_lag(self):
+        window_started = time.monotonic()
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.lag_warning:
+                logger.warning(f"🐢 Event loop lagged {lag * 1000:.0f}ms")
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_MAX.set(self.max_lag)
+            if time.monotonic() - window_started >= 60:
+                self.max_lag = 0.0
+                window_started = time.monotonic()
+
+    def _beat(self, loop: asyncio.AbstractEventLoop):
+        now = time.monotonic()
+        stalled = now - self._last_beat - self._period
+        if stalled >= self.slow_threshold:
+            culprit = self._culprit if self._caught == self._last_beat else None
+            self._report(stalled, *(culprit or ("unknown", None)))
+        self._last_beat = now
+        self._beat_handle = loop.call_later(self._period, self._beat, loop)
+
+    def _watch(self, loop_thread: int):
+        """Watchdog thread: sample the loop thread's stack once per stall"""
+        while not self._stopped.wait(self._period):
+            beat = self._last_beat
+            if beat == self._caught or time.monotonic() - beat < self.slow_threshold:
+                continue
+            try:
+                self._culprit = describe_stack(sys._current_frames().get(loop_thread))
+            except Exception:
+                self._culprit = None
+            self._caught = beat
+
+    def _report(self, elapsed: float, source: str, location: Optional[str]):
+        SLOW_CALLBACKS_TOTAL.labels(source).inc()
+        SLOW_CALLBACK_SECONDS.labels(source).observe(elapsed)
+        logger.warning(f"🐢 {source} blocked the event loop for {elapsed * 1000:.0f}ms",
+                       extra={"blocked_ms": round(elapsed * 1000, 1), "blocked_at": location})
+
+
+loop_monitor = LoopMonitor()
@@ -1,24 +1,47 @@
 import asyncio
 import json
+import logging
 import sys
 import os
-from typing import Dict, Any, Optional
-from config import MCP_SERVER_PATH, PYTHONPATH
+import time
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+from config import MCP_SERVER_PATH, PYTHONPATH, MCP_PYTHON, MCP_STREAM_LIMIT, MCP_REQUEST_TIMEOUT, MCP_STOP_TIMEOUT
+from resilience import resilience, upstream_for, OK, ERROR, FAILURE
+from request_context import DeadlineExceeded, bounded_timeout
+from mcp_recorder import get_recorder
+from metrics import TOOL_CALLS_TOTAL, TOOL_SECONDS, SERVER_SPAWN_SECONDS, CACHE_REQUESTS_TOTAL
+from tracing import span, traced
+from offload import run_cpu
+from formatting import decode_response
+
+logger = logging.getLogger(__name__)
+
+# _send_request's stand-in response when the server did not answer in time
+TIMEOUT_ERROR = "Request timeout"
 
 class MasumiMCPClient:
     """Simple MCP client for communicating with Masumi MCP server"""
     
+    spawn_count = 0  # Server processes started by all clients in this process
+    
     def __init__(self):
         self.server_process = None
         self.request_id = 1
+        self.pool = None  # Set by MCPServerPool for clients it leases out
+        self.lease_priority = None
+        self.abandoned = False  # True once a request was given up mid-flight
+        self.stderr_tail = deque(maxlen=50)
+        self._stderr_task = None
     
+    @traced("mcp.start_server")
     async def start_server(self):
         """Start the MCP server process"""
         if self.server_process:
             return
         
-        print(f"🔄 Starting MCP server: {MCP_SERVER_PATH}")
-        print(f"📁 PYTHONPATH: {PYTHONPATH}")
+        logger.info(f"🔄 Starting MCP server: {MCP_SERVER_PATH}")
+        logger.debug(f"📁 PYTHONPATH: {PYTHONPATH}")
             
         # Create environment with current env + all required MCP server vars
         env = os.environ.copy()
@@ -43,19 +66,22 @@ class MasumiMCPClient:
         
         try:
             # Use the system Python that has MCP dependencies, not the venv Python
-            system_python = "/Users/marty/miniforge3/bin/python"
-            print(f"🚀 Command: {system_python} {MCP_SERVER_PATH} stdio")
-            print(f"🌍 Environment vars: {[k for k in env.keys() if 'MASUMI' in k]}")
+            system_python = MCP_PYTHON
+            logger.debug(f"🚀 Command: {system_python} {MCP_SERVER_PATH} stdio")
+            logger.debug(f"🌍 Environment vars: {[k for k in env.keys() if 'MASUMI' in k]}")
             
+            spawn_started = time.monotonic()
             self.server_process = await asyncio.create_subprocess_exec(
                 system_python, MCP_SERVER_PATH, "stdio",
                 stdin=asyncio.subprocess.PIPE,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
                 env=env,
-                cwd=os.path.dirname(MCP_SERVER_PATH)
+                cwd=os.path.dirname(MCP_SERVER_PATH),
+                limit=MCP_STREAM_LIMIT
             )
-            print("✅ MCP server process created")
+            MasumiMCPClient.spawn_count += 1
+            logger.debug("✅ MCP server process created")
             
             # Give the server a moment to start
             await asyncio.sleep(0.5)
@@ -67,11 +93,14 @@ class MasumiMCPClient:
                 raise Exception(f"MCP server died immediately. Exit code: {self.server_process.returncode}. Stderr: {stderr_output}")
             
         except Exception as e:
-            print(f"❌ Failed to create MCP server process: {e}")
+            logger.error(f"❌ Failed to create MCP server process: {e}")
             raise
         
+        # Keep stderr flowing so a chatty long-lived server never blocks on it
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+        
         # Initialize the server
-        print("🔄 Sending initialize request...")
+        logger.debug("🔄 Sending initialize request...")
         init_response = await self._send_request({
             "jsonrpc": "2.0",
             "id": self._next_id(),
@@ -82,64 +111,170 @@ class MasumiMCPClient:
                 "clientInfo": {"name": "telegram-bot", "version": "1.0.0"}
             }
         })
-        print(f"📨 Initialize response: {init_response}")
+        logger.debug("📨 Initialize response: %s", init_response)
         
         # Send initialized notification
-        print("🔄 Sending initialized notification...")
-        notify_response = await self._send_request({
-            "jsonrpc": "2.0",
-            "method": "notifications/initialized",
-            "params": {}
-        })
-        print(f"📨 Notification response: {notify_response}")
-        print("✅ MCP server initialized successfully")
+        # Notifications get no reply, so don't wait for one
+        logger.debug("🔄 Sending initialized notification...")
+        await self._send_notification("notifications/initialized", {})
+        SERVER_SPAWN_SECONDS.observe(time.monotonic() - spawn_started)
+        logger.info("✅ MCP server initialized successfully")
+    
+    async def _drain_stderr(self):
+        """Read server stderr continuously, keeping the last lines for errors"""
+        while True:
+            line = await self.server_process.stderr.readline()
+            if not line:
+                return
+            self.stderr_tail.append(line.decode(errors="replace"))
     
     async def stop_server(self):
         """Stop the MCP server process"""
-        if self.server_process:
-            self.server_process.terminate()
-            await self.server_process.wait()
-            self.server_process = None
+        if self._stderr_task:
+            self._stderr_task.cancel()
+            self._stderr_task = None
+        process, self.server_process = self.server_process, None
+        if not process:
+            return
+        if process.returncode is None:
+            try:
+                process.terminate()
+                await asyncio.wait_for(process.wait(), timeout=MCP_STOP_TIMEOUT)
+            except ProcessLookupError:
+                pass
+            except asyncio.TimeoutError:
+                # Ignored SIGTERM; don't leave it running or as a zombie
+                process.kill()
+                await process.wait()
+        if process.stdin and not process.stdin.is_closing():
+            process.stdin.close()
     
     def _next_id(self) -> int:
         """Generate next request ID"""
         self.request_id += 1
         return self.request_id
     
-    async def _send_request(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    async def _write(self, message: Dict[str, Any]):
+        """Write one JSON-RPC message to the server's stdin"""
+        self.server_process.stdin.write((json.dumps(message) + "\n").encode())
+        await self.server_process.stdin.drain()
+    
+    async def _send_notification(self, method: str, params: Dict[str, Any]):
+        """Send JSON-RPC notification (no response expected)"""
+        await self._write({"jsonrpc": "2.0", "method": method, "params": params})
+    
+    async def _cancel_request(self, request_id: int, reason: str):
+        """Ask the server to stop working on a request we no longer wait for"""
+        try:
+            await self._send_notification("notifications/cancelled", {
+                "requestId": request_id,
+                "reason": reason
+            })
+        except (ConnectionError, RuntimeError):
+            pass
+    
+    async def _read_response(self, request_id: int) -> Optional[Dict[str, Any]]:
+        """Read stdout until the response for request_id arrives"""
+        while True:
+            response_line = await self.server_process.stdout.readline()
+            if not response_line:
+                return None
+            # Multi-megabyte registry listings are decoded off the event loop
+            message = await run_cpu("decode.jsonrpc", decode_response, response_line, size=len(response_line))
+            # Skip non-JSON output, server notifications and late replies to abandoned requests
+            if message is not None and message["id"] == request_id:
+                return message
+    
+    async def _send_request(self, request: Dict[str, Any], timeout: float = MCP_REQUEST_TIMEOUT) -> Optional[Dict[str, Any]]:
         """Send JSON-RPC request to server"""
         if not self.server_process:
             await self.start_server()
         
-        request_json = json.dumps(request) + "\n"
-        self.server_process.stdin.write(request_json.encode())
-        await self.server_process.stdin.drain()
+        with span(f"mcp.{request.get('method')}", request_id=request["id"],
+                  tool=request.get("params", {}).get("name", "")) as request_span:
+            if request_span:
+                # Let the server join the trace (MCP reserves params._meta for this)
+                request.setdefault("params", {})["_meta"] = {"traceparent": request_span.traceparent}
+            return await self._exchange(request, timeout)
+    
+    async def _exchange(self, request: Dict[str, Any], timeout: float) -> Optional[Dict[str, Any]]:
+        """Write a request and wait for its response within the deadline"""
+        # Never wait past the deadline of the update being handled
+        wait = bounded_timeout(timeout)
+        recorder = get_recorder()
+        sent_at, started = time.time(), time.monotonic()
+        await self._write(request)
         
         try:
-            response_line = await asyncio.wait_for(
-                self.server_process.stdout.readline(),
-                timeout=5.0
-            )
-            if response_line:
-                return json.loads(response_line.decode())
+            response = await asyncio.wait_for(self._read_response(request["id"]), timeout=wait)
+            if recorder:
+                recorder.record(request, response, sent_at, time.monotonic() - started)
+            return response
         except asyncio.TimeoutError:
-            return {"error": "Request timeout"}
-        return None
+            if recorder:
+                recorder.record(request, None, sent_at, time.monotonic() - started, timed_out=True)
+            self.abandoned = True
+            await self._cancel_request(request["id"], "timeout")
+            if wait < timeout:
+                raise DeadlineExceeded(f"{request.get('method')} abandoned at request deadline")
+            return {"error": TIMEOUT_ERROR}
+        except asyncio.CancelledError:
+            # The caller gave up (e.g. /cancel); free the server before unwinding
+            self.abandoned = True
+            await self._cancel_request(request["id"], "cancelled")
+            raise
     
     async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
         """Call a tool and return formatted response"""
+        if self.pool is not None:
+            # Lets the pool hedge idempotent reads onto another server
+            return await self.pool.call_tool(self, tool_name, arguments)
+        return await self.call_tool_direct(tool_name, arguments)
+    
+    async def call_tool_direct(self, tool_name: str, arguments: Dict[str, Any]) -> str:
+        """Call a tool on this client's own server"""
+        upstream = upstream_for(tool_name, arguments)
+        cache_key = json.dumps(arguments, sort_keys=True, default=str)
+        
+        # Fail fast while the tool or its upstream is known to be down
+        breaker = resilience.open_breaker(tool_name, upstream)
+        if breaker:
+            TOOL_CALLS_TOTAL.labels(tool_name, "rejected").inc()
+            cached = resilience.fallback(tool_name, cache_key)
+            CACHE_REQUESTS_TOTAL.labels("breaker_fallback", "hit" if cached is not None else "miss").inc()
+            if cached is not None:
+                return cached
+            return f"❌ Error: {breaker.name} unavailable (circuit {breaker.state}), try again shortly"
+        
+        started = time.monotonic()
+        try:
+            outcome, result = await self._call_tool(tool_name, arguments, resilience.timeout_for(tool_name))
+        except DeadlineExceeded:
+            # Our own budget ran out; that says nothing about the upstream
+            resilience.abandon(tool_name, upstream)
+            TOOL_CALLS_TOTAL.labels(tool_name, "deadline").inc()
+            return "❌ Error: Request deadline exceeded"
+        except asyncio.CancelledError:
+            resilience.abandon(tool_name, upstream)
+            TOOL_CALLS_TOTAL.labels(tool_name, "cancelled").inc()
+            raise
+        
+        elapsed = time.monotonic() - started
+        resilience.record(tool_name, upstream, elapsed, outcome)
+        TOOL_SECONDS.labels(tool_name).observe(elapsed)
+        TOOL_CALLS_TOTAL.labels(tool_name, outcome).inc()
+        if outcome == OK:
+            resilience.remember(tool_name, cache_key, result)
+        return result
+    
+    async def _call_tool(self, tool_name: str, arguments: Dict[str, Any], timeout: float) -> Tuple[str, str]:
+        """Call a tool, returning (outcome, formatted response); outcome is OK, ERROR or FAILURE"""
         try:
             # Check if server process is still alive
             if self.server_process and self.server_process.returncode is not None:
-                # Server died, capture stderr for debugging
-                stderr_output = ""
-                if self.server_process.stderr:
-                    try:
-                        stderr_data = await self.server_process.stderr.read()
-                        stderr_output = stderr_data.decode()
-                    except:
-                        pass
-                return f"❌ MCP server process died. Exit code: {self.server_process.returncode}. Stderr: {stderr_output[:200]}"
+                # Server died, report its last stderr lines for debugging
+                stderr_output = "".join(self.stderr_tail)
+                return FAILURE, f"❌ MCP server process died. Exit code: {self.server_process.returncode}. Stderr: {stderr_output[:200]}"
             
             response = await self._send_request({
                 "jsonrpc": "2.0",
@@ -149,23 +284,31 @@ class MasumiMCPClient:
                     "name": tool_name,
                     "arguments": arguments
                 }
-            })
+            }, timeout=timeout)
             
             if not response:
-                return "❌ No response from server"
+                return FAILURE, "❌ No response from server"
+            
+            if response.get("error") == TIMEOUT_ERROR:
+                return FAILURE, f"❌ Error: {TIMEOUT_ERROR}"
             
             if "error" in response:
-                return f"❌ Error: {response['error']}"
+                return ERROR, f"❌ Error: {response['error']}"
             
             if "result" in response:
                 result = response["result"]
                 if "content" in result and result["content"]:
-                    return result["content"][0].get("text", "No content")
+                    text = result["content"][0].get("text", "No content")
+                    # Upstream failures come back as tool text, not JSON-RPC errors
+                    failed = result.get("isError") or text.startswith("Error")
+                    return ERROR if failed else OK, text
             
-            return "❌ Unexpected response format"
+            return FAILURE, "❌ Unexpected response format"
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            return f"❌ Connection error: {str(e)}"
+            return FAILURE, f"❌ Connection error: {str(e)}"
     
     # Convenient wrapper methods for each tool
     async def list_agents(self) -> str:
@@ -203,12 +346,15 @@ class MasumiMCPClient:
             "job_id": job_id
         })
     
-    async def query_payments(self, network: str = "Preprod", limit: int = 10) -> str:
-        """Query payments"""
-        return await self.call_tool("query_payments", {
+    async def query_payments(self, network: str = "Preprod", limit: int = 10, cursor_id: Optional[str] = None) -> str:
+        """Query payments, newest first; cursor_id continues after that payment"""
+        arguments = {
             "network": network,
             "limit": limit
-        })
+        }
+        if cursor_id:
+            arguments["cursor_id"] = cursor_id
+        return await self.call_tool("query_payments", arguments)
     
     async def query_registry(self, network: str = "Preprod") -> str:
         """Query registry"""
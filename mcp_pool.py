@@ -0,0 +1,151 @@
+import asyncio
+from typing import Dict, Any, List, Optional
+
+from config import MCP_POOL_SIZE, MCP_HEDGING, HEDGE_PERCENTILE, HEDGE_BUDGET_RATIO, HEDGE_MIN_SAMPLES
+from masumi_client import MasumiMCPClient
+from request_context import bounded_timeout, current_priority, DeadlineExceeded
+from resilience import resilience, IDEMPOTENT_TOOLS
+from scheduler import PriorityScheduler
+from metrics import registry, HEDGES_TOTAL
+
+
+class HedgeBudget:
+    """Token bucket capping hedged calls to a fraction of all calls"""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def earn(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def refund(self):
+        """Give back a token spent on a hedge that was never sent"""
+        self.tokens = min(self.burst, self.tokens + 1.0)
+
+
+def _failed(task: asyncio.Future) -> bool:
+    """Whether a finished call raised or came back as an error message"""
+    if task.exception() is not None:
+        return True
+    return task.result().startswith(("❌", "Error"))
+
+
+class MCPServerPool:
+    """Keeps warm MCP server processes and leases them to handlers"""
+
+    def __init__(self, size: int = MCP_POOL_SIZE, hedging: bool = MCP_HEDGING):
+        self.size = size
+        self.hedging = hedging
+        self.idle: List[MasumiMCPClient] = []
+        self.leased = 0
+        self.budget = HedgeBudget()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.scheduler = PriorityScheduler(size)
+        registry.callback_gauge("masumi_bot_mcp_pool_servers", "Pooled MCP servers by state", ("state",),
+                                lambda: {("leased",): self.leased, ("idle",): len(self.idle)})
+        registry.callback_gauge("masumi_bot_mcp_queue_depth", "Requests waiting for an MCP server", ("priority",),
+                                lambda: {(p,): self.scheduler.queue_depth(p) for p in self.scheduler.weights})
+
+    async def acquire(self) -> MasumiMCPClient:
+        """Lease a client, queuing by the current request's priority class"""
+        priority = current_priority()
+        try:
+            await self.scheduler.acquire(priority, timeout=bounded_timeout(3600.0))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("no MCP server became free before the deadline")
+        return self._lease(priority)
+
+    def try_acquire_idle(self) -> Optional[MasumiMCPClient]:
+        """Lease an already running client without waiting, or return None"""
+        priority = current_priority()
+        if not self.idle or not self.scheduler.try_acquire(priority):
+            return None
+        return self._lease(priority)
+
+    def _lease(self, priority: str) -> MasumiMCPClient:
+        client = self.idle.pop() if self.idle else MasumiMCPClient()
+        client.pool = self
+        client.lease_priority = priority
+        self.leased += 1
+        return client
+
+    async def release(self, client: MasumiMCPClient):
+        """Return a client; servers with abandoned or failed work are stopped"""
+        self.leased -= 1
+        self.scheduler.release(client.lease_priority)
+        process = client.server_process
+        if client.abandoned or (process and process.returncode is not None):
+            await client.stop_server()
+        elif process:
+            self.idle.append(client)
+
+    async def close(self):
+        """Stop every idle server"""
+        idle, self.idle = self.idle, []
+        await asyncio.gather(*(client.stop_server() for client in idle), return_exceptions=True)
+
+    def _hedge_delay(self, tool_name: str) -> Optional[float]:
+        """Observed latency percentile after which a hedge is sent"""
+        if not self.hedging or tool_name not in IDEMPOTENT_TOOLS:
+            return None
+        tracker = resilience.tracker(tool_name)
+        if len(tracker.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return tracker.percentile(HEDGE_PERCENTILE)
+
+    async def call_tool(self, client: MasumiMCPClient, tool_name: str, arguments: Dict[str, Any]) -> str:
+        """Call a tool, hedging slow idempotent reads onto a second server"""
+        delay = self._hedge_delay(tool_name)
+        if delay is None:
+            return await client.call_tool_direct(tool_name, arguments)
+
+        self.budget.earn()
+        primary = asyncio.ensure_future(client.call_tool_direct(tool_name, arguments))
+        backup_client = None
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+
+            if not self.budget.spend():
+                return await primary
+            backup_client = self.try_acquire_idle()
+            if backup_client is None:
+                self.budget.refund()
+                return await primary
+
+            self.hedges_sent += 1
+            HEDGES_TOTAL.labels("sent").inc()
+            backup = asyncio.ensure_future(backup_client.call_tool_direct(tool_name, arguments))
+            tasks.add(backup)
+            # The first attempt to succeed wins; a fast failure waits for the other one
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, backup):
+                    if task in done and not _failed(task):
+                        if task is backup:
+                            self.hedges_won += 1
+                            HEDGES_TOTAL.labels("won").inc()
+                        return task.result()
+            # Both failed; report the primary's error
+            return primary.result()
+        finally:
+            # The loser is cancelled; its client is marked abandoned and the
+            # pool stops it on release instead of reusing a busy server
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if backup_client is not None:
+                await self.release(backup_client)
@@ -0,0 +1,131 @@
+import atexit
+import gzip
+import json
+import queue
+import threading
+from typing import Dict, Any, Iterator, Optional
+
+
+# A partial batch is written after this many idle seconds
+_FLUSH_INTERVAL = 1.0
+_STOP = object()
+
+
+def canonical_key(method: str, params: Dict[str, Any]) -> str:
+    """Stable key for matching a replayed request to a recorded one"""
+    # _meta carries per-request trace context, which never repeats
+    params = {k: v for k, v in params.items() if k != "_meta"}
+    return json.dumps([method, params], sort_keys=True, separators=(",", ":"), default=str)
+
+
+class MCPRecorder:
+    """Append-only JSONL log of MCP request/response pairs (gzip if *.gz).
+
+    record() only queues the pair; a writer thread encodes, compresses and
+    writes it, since responses can be megabytes. The dicts are not copied:
+    callers never change a request or parsed response once it is recorded.
+    """
+
+    def __init__(self, path: str, batch_size: int = 64, max_pending: int = 10_000):
+        self.path = path
+        self.batch_size = batch_size
+        self.compress = path.endswith(".gz")
+        self.dropped = 0
+        self._pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._file = open(path, "ab")
+        self._writer = threading.Thread(target=self._write_loop, name="mcp-recorder", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, request: Dict[str, Any], response: Optional[Dict[str, Any]], sent_at: float,
+               latency: float, timed_out: bool = False):
+        try:
+            self._pending.put_nowait((request, response, sent_at, latency, timed_out))
+        except queue.Full:
+            # Never block the event loop on a slow disk
+            self.dropped += 1
+
+    @staticmethod
+    def _encode(request, response, sent_at, latency, timed_out) -> str:
+        entry = {
+            "t": round(sent_at, 6),
+            "lat": round(latency, 6),
+            "method": request.get("method"),
+            "params": request.get("params", {}),
+        }
+        if timed_out:
+            entry["timeout"] = True
+        elif response is not None:
+            entry["result" if "result" in response else "error"] = response.get("result", response.get("error"))
+        return json.dumps(entry, separators=(",", ":"))
+
+    def _write_loop(self):
+        batch = []
+        while True:
+            try:
+                item = self._pending.get(timeout=_FLUSH_INTERVAL if batch else None)
+            except queue.Empty:
+                # Idle: write out the partial batch
+                item = None
+            if isinstance(item, tuple):
+                try:
+                    batch.append(self._encode(*item))
+                except (TypeError, ValueError):
+                    self.dropped += 1
+                if len(batch) < self.batch_size:
+                    continue
+            self._write(batch)
+            batch = []
+            if isinstance(item, threading.Event):
+                # flush() is waiting on it
+                item.set()
+            elif item is _STOP:
+                return
+
+    def _write(self, batch):
+        """Append a batch; with gzip each batch is its own member"""
+        if not batch or self._file.closed:
+            return
+        data = ("\n".join(batch) + "\n").encode()
+        self._file.write(gzip.compress(data) if self.compress else data)
+        self._file.flush()
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until everything recorded so far is written (blocking; not for the event loop)"""
+        if self._writer.is_alive():
+            done = threading.Event()
+            self._pending.put(done)
+            done.wait(timeout)
+
+    def close(self):
+        if self._writer.is_alive():
+            self._pending.put(_STOP)
+            self._writer.join(5.0)
+        self._file.close()
+
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield recorded entries in the order they were written"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        except (EOFError, json.JSONDecodeError):
+            # A crash can leave a truncated last batch; keep what is complete
+            return
+
+
+_recorder: Optional[MCPRecorder] = None
+
+
+def get_recorder() -> Optional[MCPRecorder]:
+    """Process-wide recorder, or None unless MCP_RECORD_PATH is set"""
+    # Imported lazily so the replay server can use this module without config
+    from config import MCP_RECORD_PATH
+    global _recorder
+    if _recorder is None and MCP_RECORD_PATH:
+        _recorder = MCPRecorder(MCP_RECORD_PATH)
+    return _recorder
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Replay recorded MCP traffic (see MCP_RECORD_PATH) offline.
+
+Two modes:
+
+  Stand-in server - launched by MasumiMCPClient like the real server.
+  Point MCP_SERVER_PATH at this file and set MCP_REPLAY_LOG. Each
+  tools/call is answered with a recorded response for the same tool and
+  arguments (or the same tool if the arguments never occurred), after the
+  recorded latency divided by MCP_REPLAY_SPEED (0 = no delay).
+
+  Traffic driver - re-issues the recorded calls against whatever server
+  MCP_SERVER_PATH points to, keeping the original inter-arrival times
+  (scaled by --speed), and prints per-tool latency percentiles:
+
+      python mcp_replay.py drive traffic.jsonl.gz --speed 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Dict, Any, Deque, List, Optional
+
+from fake_mcp_server import FakeServer, serve
+from mcp_recorder import canonical_key, read_log
+from metrics import percentile
+
+
+class ReplayServer(FakeServer):
+    """Serves tool calls from a recorded log with the recorded timing"""
+
+    def __init__(self, writer):
+        super().__init__(writer)
+        self.speed = float(os.getenv("MCP_REPLAY_SPEED", "1.0"))
+        self.exact: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self.by_tool: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        for entry in read_log(os.environ["MCP_REPLAY_LOG"]):
+            if entry["method"] != "tools/call":
+                continue
+            self.exact[canonical_key(entry["method"], entry["params"])].append(entry)
+            self.by_tool[entry["params"]["name"]].append(entry)
+
+    def next_entry(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Next recording for this call, cycling when a key repeats"""
+        for recorded in (self.exact.get(canonical_key("tools/call", params)), self.by_tool.get(params["name"])):
+            if recorded:
+                entry = recorded[0]
+                recorded.rotate(-1)
+                return entry
+        return None
+
+    async def call_tool(self, message: Dict[str, Any]):
+        entry = self.next_entry(message["params"])
+        try:
+            if entry is None:
+                self.write({"jsonrpc": "2.0", "id": message["id"],
+                            "error": {"code": -32602, "message": f"No recording for {message['params']['name']}"}})
+                return
+            if self.speed > 0:
+                await asyncio.sleep(entry["lat"] / self.speed)
+            if entry.get("timeout"):
+                # The original call never answered in time; neither do we
+                return
+            if "error" in entry:
+                self.write({"jsonrpc": "2.0", "id": message["id"], "error": entry["error"]})
+            else:
+                self.reply(message["id"], entry.get("result", {}))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.tasks.pop(message["id"], None)
+
+
+async def drive(path: str, speed: float):
+    """Re-issue recorded tool calls with their original spacing"""
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:REPLAY")
+    from mcp_pool import MCPServerPool
+
+    calls = [entry for entry in read_log(path) if entry["method"] == "tools/call"]
+    if not calls:
+        print("No tool calls in log")
+        return
+
+    pool = MCPServerPool()
+    latencies: Dict[str, List[float]] = defaultdict(list)
+
+    async def one(params: Dict[str, Any]):
+        client = await pool.acquire()
+        try:
+            started = time.perf_counter()
+            await client.call_tool(params["name"], params.get("arguments", {}))
+            latencies[params["name"]].append(time.perf_counter() - started)
+        finally:
+            await pool.release(client)
+
+    tasks = []
+    origin, wall_start = calls[0]["t"], time.perf_counter()
+    for entry in calls:
+        delay = (entry["t"] - origin) / speed - (time.perf_counter() - wall_start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(entry["params"])))
+    await asyncio.gather(*tasks)
+    await pool.close()
+
+    print(f"{'tool':<26}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for tool, values in sorted(latencies.items()):
+        print(f"{tool:<26}{len(values):>7}{percentile(values, 50) * 1000:>10.1f}"
+              f"{percentile(values, 95) * 1000:>10.1f}{percentile(values, 99) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "drive":
+        parser = argparse.ArgumentParser(description="Replay recorded MCP traffic against a server")
+        parser.add_argument("mode")
+        parser.add_argument("log")
+        parser.add_argument("--speed", type=float, default=1.0, help="replay N times faster")
+        args = parser.parse_args()
+        asyncio.run(drive(args.log, args.speed))
+    else:
+        asyncio.run(serve(ReplayServer))
@@ -0,0 +1,243 @@
+import asyncio
+import bisect
+import logging
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cached reply to a slow upstream
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def percentile(values: Iterable[float], p: float) -> float:
+    """Nearest-rank p-th percentile (0-100) of raw samples; 0.0 without any"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    """Base for labelled metrics; children are cached per label tuple"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self.children.items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, values)} {child.value}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child: _Buckets) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, values, le)} {cumulative}")
+        label_text = _format_labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{label_text} {child.sum}")
+        lines.append(f"{self.name}_count{label_text} {child.count}")
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose labelled values are computed when scraped"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning(f"Metric callback {self.name} failed: {e}")
+            return lines
+        for label_values, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered in Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def callback_gauge(self, name: str, help_text: str, labels: Sequence[str],
+                       callback: Callable[[], Dict[Tuple[str, ...], float]]) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help_text, labels, callback))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Hot-path metrics shared across modules
+COMMANDS_TOTAL = registry.counter("masumi_bot_commands_total", "Telegram updates handled", ("command", "outcome"))
+COMMAND_SECONDS = registry.histogram("masumi_bot_command_seconds", "Handler latency per command", ("command",))
+TOOL_CALLS_TOTAL = registry.counter("masumi_bot_mcp_tool_calls_total", "MCP tool calls", ("tool", "outcome"))
+TOOL_SECONDS = registry.histogram("masumi_bot_mcp_tool_seconds", "MCP call_tool latency", ("tool",))
+SERVER_SPAWN_SECONDS = registry.histogram("masumi_bot_mcp_server_spawn_seconds",
+                                          "Time from spawn to initialized MCP server")
+HEDGES_TOTAL = registry.counter("masumi_bot_mcp_hedges_total", "Hedged MCP requests", ("result",))
+CACHE_REQUESTS_TOTAL = registry.counter("masumi_bot_cache_requests_total", "Cache lookups", ("cache", "result"))
+TELEGRAM_API_SECONDS = registry.histogram("masumi_bot_telegram_api_seconds",
+                                          "Outbound Bot API call latency including connection pool wait",
+                                          ("method",))
+
+
+# Extra GET endpoints served next to /metrics: path -> coroutine(query)
+# returning (status code, content type, body)
+RouteHandler = Callable[[bytes], Awaitable[Tuple[int, str, bytes]]]
+routes: Dict[bytes, RouteHandler] = {}
+
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        # Skip the headers; nothing in them matters here
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        path, _, query = (parts[1] if len(parts) > 1 else b"").partition(b"?")
+        if path == b"/metrics":
+            code, content_type, body = 200, "text/plain; version=0.0.4; charset=utf-8", registry.render().encode()
+        elif path in routes:
+            code, content_type, body = await routes[path](query)
+        else:
+            code, content_type, body = 404, "text/plain", b"Not found\n"
+        status = f"{code} {HTTPStatus(code).phrase}".encode()
+        writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: " + content_type.encode() +
+                     b"\r\nContent-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> Optional[asyncio.AbstractServer]:
+    """Serve GET /metrics in Prometheus text format"""
+    server = await asyncio.start_server(_handle_scrape, host, port)
+    logger.info(f"📈 Metrics available on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,77 @@
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from config import OFFLOAD_MODE, OFFLOAD_WORKERS, OFFLOAD_MIN_BYTES
+from metrics import registry
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+OFFLOAD_TASKS_TOTAL = registry.counter("masumi_bot_offload_tasks_total",
+                                       "CPU-bound steps by where they ran", ("task", "where"))
+OFFLOAD_SECONDS = registry.histogram("masumi_bot_offload_seconds",
+                                     "Wall time of offloaded steps including handoff", ("task",))
+
+_executor: Optional[concurrent.futures.Executor] = None
+
+
+def _get_executor() -> concurrent.futures.Executor:
+    global _executor
+    if _executor is None:
+        if OFFLOAD_MODE == "process":
+            # forkserver avoids forking a process that already runs threads
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=OFFLOAD_WORKERS, mp_context=multiprocessing.get_context(method))
+        else:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=OFFLOAD_WORKERS, thread_name_prefix="offload")
+    return _executor
+
+
+async def run_cpu(task: str, func: Callable[..., Any], *args, size: int) -> Any:
+    """Run a CPU-bound step, off the event loop once its input reaches OFFLOAD_MIN_BYTES.
+
+    Small inputs run inline because handing them to a worker costs more than
+    the work. In process mode `func` and its arguments must be picklable, so
+    pass raw text and return the small rendered result rather than parsed
+    objects.
+    """
+    with span(task, bytes=size):
+        if OFFLOAD_MODE == "off" or size < OFFLOAD_MIN_BYTES:
+            OFFLOAD_TASKS_TOTAL.labels(task, "inline").inc()
+            return func(*args)
+
+        started = time.monotonic()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge payload); start a fresh pool next time
+            logger.warning(f"⚠️ Offload pool broke during {task}, running inline")
+            shutdown()
+            OFFLOAD_TASKS_TOTAL.labels(task, "inline").inc()
+            return func(*args)
+        OFFLOAD_TASKS_TOTAL.labels(task, OFFLOAD_MODE).inc()
+        OFFLOAD_SECONDS.labels(task).observe(time.monotonic() - started)
+        return result
+
+
+async def warm_up():
+    """Start the workers now; starting them on the first large payload stalls the loop"""
+    if OFFLOAD_MODE == "off":
+        return
+    executor = _get_executor()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(executor, int) for _ in range(OFFLOAD_WORKERS)))
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,307 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    LEDGER_PATH,
+    LEDGER_SYNC_INTERVAL,
+    LEDGER_SYNC_PAGE,
+    LEDGER_SYNC_MAX_PAGES,
+    LEDGER_RESCAN_INTERVAL,
+)
+from metrics import registry
+from request_context import request_scope, BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+LEDGER_SYNC_TOTAL = registry.counter("masumi_bot_ledger_sync_total", "Payment ledger sync rounds", ("outcome",))
+LEDGER_PAGES_TOTAL = registry.counter("masumi_bot_ledger_pages_total", "Payment pages fetched by the ledger sync")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS payments (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    unit TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payments_created ON payments (created_at DESC);
+CREATE INDEX IF NOT EXISTS payments_status ON payments (status, created_at DESC);
+CREATE INDEX IF NOT EXISTS payments_agent ON payments (agent, created_at DESC);
+
+-- Per-status aggregates kept current by triggers, so totals never scan payments.
+-- Inside an upsert, SQLite applies the upsert's own conflict handling to
+-- trigger statements, so INSERT OR IGNORE would fail on a known status; the
+-- triggers insert missing statuses with NOT EXISTS instead. They are
+-- recreated on every start, in one transaction, replacing older definitions.
+CREATE TABLE IF NOT EXISTS payment_totals (
+    status TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0
+);
+BEGIN;
+DROP TRIGGER IF EXISTS payments_ins;
+CREATE TRIGGER payments_ins AFTER INSERT ON payments BEGIN
+    INSERT INTO payment_totals (status) SELECT NEW.status
+        WHERE NOT EXISTS (SELECT 1 FROM payment_totals WHERE status = NEW.status);
+    UPDATE payment_totals SET count = count + 1, total = total + NEW.amount WHERE status = NEW.status;
+END;
+DROP TRIGGER IF EXISTS payments_del;
+CREATE TRIGGER payments_del AFTER DELETE ON payments BEGIN
+    UPDATE payment_totals SET count = count - 1, total = total - OLD.amount WHERE status = OLD.status;
+END;
+DROP TRIGGER IF EXISTS payments_upd;
+CREATE TRIGGER payments_upd AFTER UPDATE ON payments BEGIN
+    UPDATE payment_totals SET count = count - 1, total = total - OLD.amount WHERE status = OLD.status;
+    INSERT INTO payment_totals (status) SELECT NEW.status
+        WHERE NOT EXISTS (SELECT 1 FROM payment_totals WHERE status = NEW.status);
+    UPDATE payment_totals SET count = count + 1, total = total + NEW.amount WHERE status = NEW.status;
+END;
+COMMIT;
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Only rows whose content changed are rewritten, so the rowcount tells the
+# sync loop whether a page held anything new
+_UPSERT = """
+INSERT INTO payments (id, status, agent, amount, unit, created_at, raw) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    status = excluded.status, agent = excluded.agent, amount = excluded.amount,
+    unit = excluded.unit, created_at = excluded.created_at, raw = excluded.raw
+WHERE payments.raw != excluded.raw
+"""
+
+# Marks a rescan that starts again from the newest payment
+_HEAD = "@head"
+
+
+def _timestamp(value: Any) -> float:
+    if isinstance(value, (int, float)):
+        # Epoch milliseconds from the payment service, seconds otherwise
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return 0.0
+
+
+def normalize_payment(payment: Dict[str, Any]) -> Optional[Tuple]:
+    """Row for the payments table, or None if the entry has no identifier"""
+    payment_id = payment.get("id") or payment.get("blockchainIdentifier")
+    if not payment_id:
+        return None
+    status = payment.get("status") or payment.get("onChainState") or "Unknown"
+    agent = payment.get("agentIdentifier") or (payment.get("agent") or {}).get("agentIdentifier") or ""
+    amount, unit = 0, "lovelace"
+    for funds in payment.get("requestedFunds") or payment.get("amounts") or []:
+        try:
+            amount += int(funds.get("amount", 0))
+        except (TypeError, ValueError):
+            continue
+        unit = funds.get("unit") or unit
+    created = _timestamp(payment.get("createdAt") or payment.get("created_at"))
+    raw = json.dumps(payment, sort_keys=True, separators=(",", ":"))
+    return str(payment_id), str(status), str(agent), amount, unit, created, raw
+
+
+def parse_payments(result: str) -> List[Dict[str, Any]]:
+    """Payments from a query_payments result; raises ValueError if it is not JSON"""
+    data = json.loads(result)
+    if isinstance(data, dict):
+        data = data.get("data", data)
+    if isinstance(data, dict):
+        data = data.get("payments") or data.get("Payments") or []
+    return [p for p in data if isinstance(p, dict)] if isinstance(data, list) else []
+
+
+class PaymentLedger:
+    """Local SQLite copy of the payment history, kept current by a background sync.
+
+    /query_payments pages, filters and totals are answered from here, so a
+    command costs an indexed query instead of an MCP round trip. All SQLite
+    work runs on one dedicated thread that owns the connection.
+    """
+
+    def __init__(self, path: str = LEDGER_PATH):
+        self.path = path
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._sync_lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # -- blocking helpers, run on the ledger thread --
+
+    def _upsert(self, rows: List[Tuple]) -> int:
+        conn = self._connect()
+        with conn:
+            # rowcount leaves out the trigger writes to payment_totals
+            return conn.executemany(_UPSERT, rows).rowcount
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: Optional[str]):
+        conn = self._connect()
+        with conn:
+            if value is None:
+                conn.execute("DELETE FROM sync_state WHERE key = ?", (key,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+
+    def _page(self, status: Optional[str], agent_prefix: str, offset: int, limit: int):
+        conn = self._connect()
+        where, params = [], []
+        if status:
+            # Users type "pending" for "Pending"; match the stored spelling
+            known = conn.execute("SELECT status FROM payment_totals WHERE status = ? COLLATE NOCASE",
+                                 (status,)).fetchone()
+            status = known[0] if known else status
+            where.append("status = ?")
+            params.append(status)
+        if agent_prefix:
+            # A range on the agent index instead of LIKE, which cannot use it
+            where.append("agent >= ? AND agent < ?")
+            params += [agent_prefix, agent_prefix + "\uffff"]
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        rows = conn.execute(
+            f"SELECT id, status, agent, amount, unit, created_at FROM payments {clause} "
+            f"ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?", (*params, limit, offset)).fetchall()
+        if agent_prefix:
+            matched = conn.execute(f"SELECT COUNT(*) FROM payments {clause}", params).fetchone()[0]
+        else:
+            matched = conn.execute("SELECT COALESCE(SUM(count), 0) FROM payment_totals"
+                                   + (" WHERE status = ?" if status else ""), params).fetchone()[0]
+        totals = conn.execute("SELECT status, count, total FROM payment_totals WHERE count > 0 "
+                              "ORDER BY count DESC").fetchall()
+        return rows, matched, totals
+
+    # -- async API --
+
+    async def count(self) -> int:
+        return await self._run(lambda: self._connect().execute(
+            "SELECT COALESCE(SUM(count), 0) FROM payment_totals").fetchone()[0])
+
+    async def statuses(self) -> List[str]:
+        """Every status the ledger has seen"""
+        return await self._run(lambda: [row[0] for row in self._connect().execute(
+            "SELECT status FROM payment_totals")])
+
+    async def last_synced(self) -> Optional[float]:
+        value = await self._run(self._get_state, "synced_at")
+        return float(value) if value else None
+
+    async def page(self, status: Optional[str] = None, agent_prefix: str = "",
+                   offset: int = 0, limit: int = 10) -> Dict[str, Any]:
+        """One page of payments, newest first, with the match count and per-status totals"""
+        rows, matched, totals = await self._run(self._page, status, agent_prefix, offset, limit)
+        return {
+            "payments": [dict(zip(("id", "status", "agent", "amount", "unit", "created_at"), row)) for row in rows],
+            "matched": matched,
+            "totals": [{"status": s, "count": c, "total": t} for s, c, t in totals],
+        }
+
+    async def _fetch(self, pool, cursor_id: Optional[str]) -> List[Tuple]:
+        client = await pool.acquire()
+        try:
+            result = await client.query_payments(limit=LEDGER_SYNC_PAGE, cursor_id=cursor_id)
+        finally:
+            await pool.release(client)
+        if result.startswith("❌") or result.startswith("Error"):
+            raise RuntimeError(result[:200])
+        LEDGER_PAGES_TOTAL.inc()
+        return [row for row in map(normalize_payment, parse_payments(result)) if row]
+
+    async def sync(self, pool) -> int:
+        """Pull new and changed payments; returns the number of rows written.
+
+        The head of the history is read newest first until a page holds
+        nothing new. Whatever the page budget leaves unread (the initial
+        backfill, or a periodic rescan that picks up status changes on older
+        payments) is continued from a saved cursor in later rounds.
+        """
+        async with self._sync_lock:
+            budget, written = LEDGER_SYNC_MAX_PAGES, 0
+            backfill = await self._run(self._get_state, "backfill_cursor")
+            if backfill is None:
+                last_rescan = float(await self._run(self._get_state, "rescanned_at") or 0)
+                if time.time() - last_rescan >= LEDGER_RESCAN_INTERVAL:
+                    backfill = _HEAD
+
+            if backfill != _HEAD:
+                cursor = None
+                while budget:
+                    rows = await self._fetch(pool, cursor)
+                    budget -= 1
+                    changed = await self._run(self._upsert, rows)
+                    written += changed
+                    if len(rows) < LEDGER_SYNC_PAGE or changed < len(rows):
+                        break
+                    cursor = rows[-1][0]
+                else:
+                    # More new payments than the budget; keep going from here next round
+                    backfill = backfill or cursor
+
+            while backfill and budget:
+                rows = await self._fetch(pool, None if backfill == _HEAD else backfill)
+                budget -= 1
+                written += await self._run(self._upsert, rows)
+                # A page that contains its own cursor means the server ignores cursor_id
+                ignored = backfill != _HEAD and any(row[0] == backfill for row in rows)
+                backfill = rows[-1][0] if len(rows) == LEDGER_SYNC_PAGE and not ignored else None
+                if backfill is None:
+                    await self._run(self._set_state, "rescanned_at", str(time.time()))
+
+            await self._run(self._set_state, "backfill_cursor", backfill)
+            await self._run(self._set_state, "synced_at", str(time.time()))
+            return written
+
+    async def run_sync_loop(self, pool):
+        """Sync every LEDGER_SYNC_INTERVAL seconds at background priority"""
+        while True:
+            try:
+                with request_scope("ledger_sync", LEDGER_SYNC_INTERVAL, priority=BACKGROUND):
+                    written = await self.sync(pool)
+                LEDGER_SYNC_TOTAL.labels("ok").inc()
+                if written:
+                    logger.info(f"💳 Ledger sync wrote {written} payments")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LEDGER_SYNC_TOTAL.labels("error").inc()
+                logger.warning(f"⚠️ Ledger sync failed: {e}")
+            await asyncio.sleep(LEDGER_SYNC_INTERVAL)
+
+    def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(_close)
+        self._executor.shutdown(wait=True)
+
+
+payment_ledger = PaymentLedger()
@@ -0,0 +1,68 @@
+import os
+import resource
+from typing import List
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes(pid: int = 0) -> int:
+    """Current resident set size of a process (this one by default)"""
+    path = f"/proc/{pid or 'self'}/statm"
+    try:
+        with open(path) as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        if pid:
+            return 0
+        # No procfs (macOS): fall back to the peak, reported in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child_pids(pid: int = 0) -> List[int]:
+    """Direct children of a process, via procfs"""
+    parent = pid or os.getpid()
+    children = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, so split after its ")"
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == parent:
+            children.append(int(entry))
+    return children
+
+
+def tree_rss_bytes() -> int:
+    """RSS of this process plus its direct children (MCP servers)"""
+    return rss_bytes() + sum(rss_bytes(pid) for pid in child_pids())
+
+
+def open_fds() -> int:
+    """Number of file descriptors open in this process"""
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return -1
+
+
+def zombie_children() -> int:
+    """Children that exited but were never waited for"""
+    count = 0
+    for pid in child_pids():
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    count += 1
+        except (OSError, IndexError):
+            continue
+    return count
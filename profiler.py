@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+from urllib.parse import parse_qs
+
+from config import PROFILE_INTERVAL, PROFILE_MAX_SECONDS, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _task_label(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "(event loop)"
+    name = task.get_name()
+    # Handler tasks are renamed after their command; others fall back to the coroutine
+    if name.startswith("update."):
+        return name
+    return getattr(task.get_coro(), "__qualname__", name)
+
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack from a side thread.
+
+    Each sample is rooted at the asyncio task that was running (or the bare
+    event loop when idle), so time can be attributed to commands. Output is
+    the collapsed-stack format read by flamegraph.pl and speedscope. The
+    sampler reads frames when it gets the GIL, which the loop thread hands
+    over every switch interval (5ms by default) or when it goes idle; steps
+    much shorter than that are under-sampled.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def profile(self, seconds: float) -> bytes:
+        """Profile the calling loop for `seconds`; one run at a time"""
+        if self._running:
+            raise RuntimeError("A profile is already running")
+        seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+        loop = asyncio.get_running_loop()
+        self._running = True
+        try:
+            samples = await asyncio.to_thread(self._sample, threading.get_ident(), loop, seconds)
+        finally:
+            self._running = False
+        logger.info(f"🔬 Profiled {seconds:.0f}s: {sum(samples.values())} samples")
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common()).encode()
+
+    def _sample(self, thread_id: int, loop: asyncio.AbstractEventLoop, seconds: float) -> Counter:
+        samples: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(_task_label(asyncio.current_task(loop)))
+            samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        return samples
+
+    async def profile_to_file(self, seconds: float) -> str:
+        """Profile and write the result under PROFILE_DIR"""
+        data = await self.profile(seconds)
+        path = os.path.join(PROFILE_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+        await asyncio.to_thread(_write_bytes, path, data)
+        logger.info(f"🔬 Profile written to {path}")
+        return path
+
+    def install_signal_trigger(self, signum: int, seconds: float):
+        """Profile for `seconds` into PROFILE_DIR whenever `signum` arrives"""
+        loop = asyncio.get_running_loop()
+
+        def on_signal():
+            if not self._running:
+                loop.create_task(self.profile_to_file(seconds))
+
+        loop.add_signal_handler(signum, on_signal)
+
+    async def http_route(self, query: bytes):
+        """GET /debug/profile?seconds=N for the metrics server"""
+        params = parse_qs(query.decode())
+        try:
+            seconds = float(params.get("seconds", ["10"])[0])
+        except ValueError:
+            return 400, "text/plain", b"seconds must be a number\n"
+        try:
+            return 200, "text/plain; charset=utf-8", await self.profile(seconds)
+        except RuntimeError as e:
+            return 409, "text/plain", f"{e}\n".encode()
+
+
+def _write_bytes(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,259 @@
+import bisect
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent_index import agent_index
+from config import RANK_WEIGHT_MATCH, RANK_WEIGHT_PRICE, RANK_WEIGHT_SUCCESS, RANK_WEIGHT_LATENCY
+from formatting import agent_price, agent_topics, tokenize
+
+# Words that say nothing about the task
+_STOPWORDS = {"a", "an", "and", "the", "to", "for", "of", "in", "on", "with", "my", "me", "i",
+              "please", "can", "you", "that", "this", "is", "it", "from", "into"}
+# Capability and tag matches count for more than words in the description
+_TOPIC_WEIGHT = 2.0
+_TERM_WEIGHT = 1.0
+# Shortest stem tried when a word matches nothing as typed
+_MIN_STEM = 4
+
+
+def short_id(agent_id: str) -> str:
+    """Stable 16-character key for an agent, short enough for callback data"""
+    return hashlib.blake2b(agent_id.encode(), digest_size=8).hexdigest()
+
+
+class AgentStats:
+    """Outcomes of hires made through the bot, per agent"""
+
+    def __init__(self):
+        # agent id -> [hires, successes, mean latency in seconds]
+        self.stats: Dict[str, List[float]] = {}
+        self.version = 0
+
+    def record(self, agent_id: str, ok: bool, latency: float):
+        entry = self.stats.setdefault(agent_id, [0, 0, 0.0])
+        entry[0] += 1
+        entry[1] += 1 if ok else 0
+        # Running mean; hires are rare enough that it need not decay
+        entry[2] += (latency - entry[2]) / entry[0]
+        self.version += 1
+
+    def export(self) -> Dict[str, List[float]]:
+        return {agent_id: list(entry) for agent_id, entry in self.stats.items()}
+
+    def restore(self, data: Dict[str, List[float]]):
+        for agent_id, entry in data.items():
+            self.stats.setdefault(agent_id, list(entry))
+        self.version += 1
+
+
+def build_columns(entries) -> Dict[str, Any]:
+    """Ranking columns for index entries; runs in the offload pool as an AgentIndex deriver.
+
+    One array per scoring feature, aligned with the entries, plus posting
+    lists (agent positions per term) so a query adds its matches into the
+    score column with one numpy call per word.
+    """
+    agents = [agent for agent, _, _ in entries]
+    ids = [agent["agentIdentifier"] for agent in agents]
+    # Topics repeat across agents, so each distinct one is tokenized once
+    topic_tokens = {topic: tokenize(topic) for agent in agents for topic in agent_topics(agent)}
+    terms = Postings((i, tokens) for i, (_, tokens, _) in enumerate(entries))
+    topics = Postings((i, {token for topic in agent_topics(agent) for token in topic_tokens[topic]})
+                      for i, agent in enumerate(agents))
+    return {
+        "ids": ids,
+        "short": [short_id(agent_id) for agent_id in ids],
+        "price": np.array([agent_price(agent) for agent in agents], dtype=np.float64),
+        "terms": terms,
+        "topics": topics,
+    }
+
+
+class AgentMatrix:
+    """Column-oriented view of the agent index for vectorized ranking"""
+
+    def __init__(self, entries, columns: Dict[str, Any], stats: AgentStats):
+        self.agents = [agent for agent, _, _ in entries]
+        self.ids = columns["ids"]
+        self.position = {agent_id: i for i, agent_id in enumerate(self.ids)}
+        self.by_short = dict(zip(columns["short"], self.ids))
+        self.price = columns["price"]
+        self.terms = columns["terms"]
+        self.topics = columns["topics"]
+
+        self.stats_version = -1
+        self.update_stats(stats)
+
+    def update_stats(self, stats: AgentStats):
+        hires = np.zeros(len(self.ids))
+        successes = np.zeros(len(self.ids))
+        latency = np.full(len(self.ids), np.nan)
+        for agent_id, (count, ok, mean_latency) in stats.stats.items():
+            i = self.position.get(agent_id)
+            if i is not None:
+                hires[i], successes[i], latency[i] = count, ok, mean_latency
+        # Laplace-smoothed, so agents nobody has hired yet sit at 0.5
+        self.success = (successes + 1) / (hires + 2)
+        self.latency = latency
+        self.stats_version = stats.version
+
+    def _expand(self, word: str) -> List[str]:
+        """The word itself if indexed, else indexed words it is a prefix of.
+
+        Failing that, words sharing its stem, so "translate" finds "translator".
+        """
+        if word in self.terms:
+            return [word]
+        matches = self.terms.with_prefix(word)
+        if not matches and len(word) > _MIN_STEM:
+            matches = self.terms.with_prefix(word[:max(_MIN_STEM, len(word) - 3)])
+        return matches
+
+    def prefix_match(self, words: List[str], within: Optional[np.ndarray] = None) -> np.ndarray:
+        """Positions, in registry order, of agents with a term starting with each word.
+
+        `within` limits the search to these positions (ascending), e.g. the
+        matches of a query this one extends.
+        """
+        if within is not None:
+            for word in words:
+                within = within[np.isin(within, self.terms.prefix_positions(word))]
+            return within
+        mask = np.ones(len(self.ids), dtype=bool)
+        for word in words:
+            hit = np.zeros(len(self.ids), dtype=bool)
+            hit[self.terms.prefix_positions(word)] = True
+            mask &= hit
+        return np.flatnonzero(mask)
+
+    def rank(self, query: str, k: int) -> List[Tuple[Dict[str, Any], float]]:
+        """Top `k` agents for a task description, best first, with their scores"""
+        words = [w for w in tokenize(query) if w not in _STOPWORDS] or tokenize(query)
+        if not words or not self.ids:
+            return []
+        match = np.zeros(len(self.ids))
+        for word in words:
+            # A word counts once per agent however many of its expansions that agent has
+            term_hit = np.zeros(len(self.ids), dtype=bool)
+            topic_hit = np.zeros(len(self.ids), dtype=bool)
+            for term in self._expand(word):
+                term_hit[self.terms[term]] = True
+                if term in self.topics:
+                    topic_hit[self.topics[term]] = True
+            match += _TERM_WEIGHT * term_hit + _TOPIC_WEIGHT * topic_hit
+        candidates = np.flatnonzero(match)
+        if not len(candidates):
+            return []
+        match = match[candidates] / (len(words) * (_TERM_WEIGHT + _TOPIC_WEIGHT))
+
+        score = RANK_WEIGHT_MATCH * match
+        score += RANK_WEIGHT_PRICE * (1 - _normalize(self.price[candidates]))
+        score += RANK_WEIGHT_SUCCESS * self.success[candidates]
+        score += RANK_WEIGHT_LATENCY * (1 - _normalize(self.latency[candidates]))
+
+        k = min(k, len(candidates))
+        top = np.argpartition(-score, k - 1)[:k]
+        top = top[np.argsort(-score[top], kind="stable")]
+        return [(self.agents[candidates[i]], float(score[i])) for i in top]
+
+
+class Postings:
+    """term -> ascending agent positions, stored as one flat array.
+
+    Terms are numbered in sorted order, so all terms sharing a prefix are
+    one contiguous run of the array. A dict of small arrays would cost a
+    Python object per term to build and to unpickle; slicing does not.
+    """
+
+    __slots__ = ("vocabulary", "index", "bounds", "positions")
+
+    def __init__(self, rows):
+        """From (position, distinct terms) rows"""
+        seen: Dict[str, int] = {}
+        term_ids: List[int] = []
+        positions: List[int] = []
+        for i, tokens in rows:
+            for token in tokens:
+                term_ids.append(seen.setdefault(token, len(seen)))
+                positions.append(i)
+        self.vocabulary = sorted(seen)
+        self.index = {term: t for t, term in enumerate(self.vocabulary)}
+        renumber = np.empty(len(seen), dtype=np.int32)
+        renumber[[seen[term] for term in self.vocabulary]] = np.arange(len(seen), dtype=np.int32)
+        term_ids = renumber[np.array(term_ids, dtype=np.int32)]
+        order = np.argsort(term_ids, kind="stable")
+        self.bounds = np.searchsorted(term_ids[order], np.arange(len(seen) + 1))
+        self.positions = np.array(positions, dtype=np.int32)[order]
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.index
+
+    def __getitem__(self, term: str) -> np.ndarray:
+        t = self.index[term]
+        return self.positions[self.bounds[t]:self.bounds[t + 1]]
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        return (bisect.bisect_left(self.vocabulary, prefix),
+                bisect.bisect_left(self.vocabulary, prefix + "\uffff"))
+
+    def with_prefix(self, prefix: str) -> List[str]:
+        low, high = self._range(prefix)
+        return self.vocabulary[low:high]
+
+    def prefix_positions(self, prefix: str) -> np.ndarray:
+        """Positions of agents with any term starting with `prefix`, possibly repeated"""
+        low, high = self._range(prefix)
+        return self.positions[self.bounds[low]:self.bounds[high]]
+
+    def __getstate__(self):
+        return self.vocabulary, self.bounds, self.positions
+
+    def __setstate__(self, state):
+        self.vocabulary, self.bounds, self.positions = state
+        self.index = {term: t for t, term in enumerate(self.vocabulary)}
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    """Scale to 0..1 across the candidates; unknown values (NaN) count as average"""
+    known = ~np.isnan(values)
+    if not known.any():
+        return np.full(len(values), 0.5)
+    low, high = values[known].min(), values[known].max()
+    scaled = np.full(len(values), 0.5)
+    if high > low:
+        scaled[known] = (values[known] - low) / (high - low)
+    return scaled
+
+
+class Ranker:
+    """Keeps an AgentMatrix in step with the agent index and hire stats"""
+
+    def __init__(self, stats: AgentStats):
+        self.stats = stats
+        self.matrix: Optional[AgentMatrix] = None
+
+    def rebuild(self):
+        """AgentIndex replace hook: wrap the columns built alongside the new entries"""
+        self.matrix = AgentMatrix(agent_index.entries(), agent_index.derived["ranking"], self.stats)
+
+    def current(self) -> AgentMatrix:
+        if self.matrix is None:
+            self.rebuild()
+        elif self.matrix.stats_version != self.stats.version:
+            self.matrix.update_stats(self.stats)
+        return self.matrix
+
+    def recommend(self, query: str, k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        return self.current().rank(query, k)
+
+    def resolve(self, key: str) -> Optional[str]:
+        """Agent id for a short_id() key"""
+        return self.current().by_short.get(key)
+
+
+agent_stats = AgentStats()
+ranker = Ranker(agent_stats)
+agent_index.derivers["ranking"] = build_columns
+agent_index.on_replace.append(ranker.rebuild)
@@ -0,0 +1,69 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Scheduling classes for MCP capacity, most urgent first
+INTERACTIVE = "interactive"
+NOTIFICATION = "notification"
+BACKGROUND = "background"
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's time budget ran out before work could finish"""
+
+
+class RequestContext:
+    """Per-update state that travels with a handler into the MCP client"""
+
+    def __init__(self, name: str, budget: float, priority: str = INTERACTIVE):
+        self.name = name
+        self.priority = priority
+        self.started = time.monotonic()
+        self.deadline = self.started + budget
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self):
+        """Raise DeadlineExceeded if the budget is already spent"""
+        if self.expired():
+            raise DeadlineExceeded(f"{self.name} exceeded its deadline")
+
+
+current_request: ContextVar[Optional[RequestContext]] = ContextVar("current_request", default=None)
+
+
+@contextmanager
+def request_scope(name: str, budget: float, priority: str = INTERACTIVE):
+    """Run a block with a fresh deadline; tasks created inside inherit it"""
+    token = current_request.set(RequestContext(name, budget, priority))
+    try:
+        yield current_request.get()
+    finally:
+        current_request.reset(token)
+
+
+def bounded_timeout(timeout: float) -> float:
+    """Clamp a timeout to the current request's remaining budget"""
+    ctx = current_request.get()
+    if ctx is None:
+        return timeout
+    ctx.check()
+    return min(timeout, ctx.remaining())
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current request is out of time"""
+    ctx = current_request.get()
+    if ctx is not None:
+        ctx.check()
+
+
+def current_priority() -> str:
+    """Scheduling class of the current request (interactive by default)"""
+    ctx = current_request.get()
+    return ctx.priority if ctx is not None else INTERACTIVE
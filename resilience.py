@@ -0,0 +1,178 @@
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, Deque, Tuple
+
+from config import (
+    MCP_REQUEST_TIMEOUT,
+    MCP_MIN_TIMEOUT,
+    MCP_TIMEOUT_PERCENTILE,
+    MCP_TIMEOUT_MULTIPLIER,
+    MCP_LATENCY_WINDOW,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    BREAKER_FALLBACK_ENTRIES,
+)
+from metrics import percentile
+
+# Which upstream service backs each tool. Agent tools are keyed by their
+# api_base_url instead, see upstream_for(). Writes get a breaker of their
+# own, so a failing bulk registration run cannot block registry reads.
+TOOL_UPSTREAMS = {
+    "list_agents": "registry",
+    "query_registry": "registry",
+    "register_agent": "registry_write",
+    "query_payments": "payment",
+}
+
+# Call outcomes. Only failures (no usable answer: timeout, dead server,
+# broken connection) count against breakers; an error the tool answered
+# with, e.g. for bad input, says the upstream is reachable.
+OK = "ok"
+ERROR = "error"
+FAILURE = "failure"
+
+# Tools that only read state, so a previous answer is a safe degraded reply
+IDEMPOTENT_TOOLS = {"list_agents", "query_registry", "query_payments", "get_agent_input_schema"}
+
+
+def upstream_for(tool_name: str, arguments: Dict[str, Any]) -> str:
+    """Return the upstream key a tool call depends on"""
+    if "api_base_url" in arguments and tool_name not in TOOL_UPSTREAMS:
+        return f"agent:{arguments['api_base_url']}"
+    return TOOL_UPSTREAMS.get(tool_name, "mcp")
+
+
+class LatencyTracker:
+    """Sliding window of observed latencies for a single tool"""
+
+    def __init__(self, window: int = MCP_LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Return the p-th percentile (0-100) or None without samples"""
+        return percentile(self.samples, p) if self.samples else None
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker guarding a tool or upstream"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Return True if a call may go through right now"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+        # Half-open: let exactly one probe through
+        if self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class ResilienceRegistry:
+    """Process-wide latency, breaker and fallback state shared by all clients"""
+
+    def __init__(self, max_fallbacks: int = BREAKER_FALLBACK_ENTRIES):
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # Keyed by the call's arguments, which users supply, so kept as a bounded LRU
+        self.max_fallbacks = max_fallbacks
+        self.last_good: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+    def tracker(self, tool_name: str) -> LatencyTracker:
+        if tool_name not in self.latencies:
+            self.latencies[tool_name] = LatencyTracker()
+        return self.latencies[tool_name]
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name)
+        return self.breakers[name]
+
+    def timeout_for(self, tool_name: str) -> float:
+        """Adaptive timeout from the observed latency percentile of a tool"""
+        tracker = self.tracker(tool_name)
+        if len(tracker.samples) < 10:
+            return MCP_REQUEST_TIMEOUT
+        observed = tracker.percentile(MCP_TIMEOUT_PERCENTILE)
+        return max(MCP_MIN_TIMEOUT, min(MCP_REQUEST_TIMEOUT, observed * MCP_TIMEOUT_MULTIPLIER))
+
+    def open_breaker(self, tool_name: str, upstream: str) -> Optional[CircuitBreaker]:
+        """Return the first breaker that rejects this call, if any"""
+        upstream_breaker = self.breaker(f"upstream:{upstream}")
+        tool_breaker = self.breaker(f"tool:{tool_name}")
+        if not upstream_breaker.allow_request():
+            return upstream_breaker
+        if not tool_breaker.allow_request():
+            # Don't let a rejected call hold the upstream's half-open probe slot
+            upstream_breaker.probe_in_flight = False
+            return tool_breaker
+        return None
+
+    def record(self, tool_name: str, upstream: str, seconds: float, outcome: str):
+        for name in (f"upstream:{upstream}", f"tool:{tool_name}"):
+            if outcome == OK:
+                self.breaker(name).record_success()
+            elif outcome == FAILURE:
+                self.breaker(name).record_failure()
+            else:
+                # Neither proves the upstream healthy nor down; free a probe slot
+                self.breaker(name).probe_in_flight = False
+        # Timeouts are recorded too so a slowing upstream widens the timeout
+        self.tracker(tool_name).record(seconds)
+
+    def abandon(self, tool_name: str, upstream: str):
+        """Release half-open probe slots held by a call that was given up on"""
+        for name in (f"upstream:{upstream}", f"tool:{tool_name}"):
+            self.breaker(name).probe_in_flight = False
+
+    def remember(self, tool_name: str, cache_key: str, result: str):
+        if tool_name not in IDEMPOTENT_TOOLS:
+            return
+        key = (tool_name, cache_key)
+        self.last_good[key] = result
+        self.last_good.move_to_end(key)
+        while len(self.last_good) > self.max_fallbacks:
+            self.last_good.popitem(last=False)
+
+    def fallback(self, tool_name: str, cache_key: str) -> Optional[str]:
+        key = (tool_name, cache_key)
+        result = self.last_good.get(key)
+        if result is not None:
+            self.last_good.move_to_end(key)
+        return result
+
+
+resilience = ResilienceRegistry()
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from atomic_file import atomic_write
+from config import RESULT_STORE_DIR, RESULT_STORE_MAX_BYTES
+from metrics import CACHE_REQUESTS_TOTAL, registry
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_BYTES = registry.gauge("masumi_bot_result_store_bytes", "Bytes of job results stored on disk")
+RESULT_STORE_EVICTIONS_TOTAL = registry.counter("masumi_bot_result_store_evictions_total",
+                                                "Job results evicted to stay under RESULT_STORE_MAX_BYTES")
+
+
+class StoredResult:
+    __slots__ = ("agent", "job_id", "digest", "size", "path", "file_id", "status")
+
+    def __init__(self, agent: str, job_id: str, digest: str, size: int, path: str, file_id: Optional[str] = None,
+                 status: str = "completed"):
+        self.agent = agent
+        self.job_id = job_id
+        self.digest = digest
+        self.size = size
+        self.path = path
+        # Telegram file id of an earlier upload of this content, reusable by the bot
+        self.file_id = file_id
+        # The job's final state, "completed" or "failed"
+        self.status = status
+
+
+def _write_atomic(path: str, data: bytes):
+    with atomic_write(path) as f:
+        f.write(data)
+
+
+class ResultStore:
+    """On-disk store for finished job results, content addressed.
+
+    Results live under objects/ named by their SHA-256, so identical results
+    from different jobs share one file. refs/ maps (agent, job_id) to a
+    digest. Least recently read objects are evicted once the store grows
+    past `max_bytes`; a ref whose object is gone is treated as a miss.
+    """
+
+    def __init__(self, root: str = RESULT_STORE_DIR, max_bytes: int = RESULT_STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._total: Optional[int] = None
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def _ref_path(self, agent: str, job_id: str) -> str:
+        key = hashlib.sha256(f"{agent}\0{job_id}".encode()).hexdigest()
+        return os.path.join(self.root, "refs", key[:2], key + ".json")
+
+    # -- blocking helpers, run on a worker thread --
+
+    def _scan(self) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "objects")):
+            total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames
+                         if not name.startswith(".") and not name.endswith(".file_id"))
+        return total
+
+    def _lookup(self, agent: str, job_id: str) -> Optional[StoredResult]:
+        ref_path = self._ref_path(agent, job_id)
+        try:
+            with open(ref_path) as f:
+                ref = json.load(f)
+            digest = ref["digest"]
+        except (OSError, ValueError, KeyError):
+            return None
+        path = self._object_path(digest)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            # The object was evicted; drop the dangling ref too
+            try:
+                os.unlink(ref_path)
+            except FileNotFoundError:
+                pass
+            return None
+        # Reads refresh the mtime that eviction orders by
+        os.utime(path)
+        try:
+            with open(path + ".file_id") as f:
+                file_id = f.read().strip() or None
+        except OSError:
+            file_id = None
+        return StoredResult(agent, job_id, digest, size, path, file_id, ref.get("status", "completed"))
+
+    def _store(self, agent: str, job_id: str, data: bytes, status: str) -> StoredResult:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self._total is None:
+            self._total = self._scan()
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+            self._total += len(data)
+        else:
+            os.utime(path)
+        ref_path = self._ref_path(agent, job_id)
+        os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+        _write_atomic(ref_path, json.dumps({"agent": agent, "job_id": job_id, "digest": digest,
+                                           "status": status}).encode())
+        if self._total > self.max_bytes:
+            self._evict(keep=path)
+        RESULT_STORE_BYTES.set(self._total)
+        return StoredResult(agent, job_id, digest, len(data), path, status=status)
+
+    def _evict(self, keep: str):
+        """Delete least recently read objects until the store is at 90% of its limit"""
+        objects = []
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "objects")):
+            for name in filenames:
+                if name.startswith(".") or name.endswith(".file_id"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                objects.append((stat.st_mtime, stat.st_size, path))
+        self._total = sum(size for _, size, _ in objects)
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(objects):
+            if self._total <= target:
+                break
+            if path == keep:
+                continue
+            for stale in (path, path + ".file_id"):
+                try:
+                    os.unlink(stale)
+                except FileNotFoundError:
+                    pass
+            self._total -= size
+            RESULT_STORE_EVICTIONS_TOTAL.inc()
+
+    # -- async API --
+
+    async def get(self, agent: str, job_id: str) -> Optional[StoredResult]:
+        result = await asyncio.to_thread(self._lookup, agent, job_id)
+        CACHE_REQUESTS_TOTAL.labels("job_result", "hit" if result else "miss").inc()
+        return result
+
+    async def put(self, agent: str, job_id: str, text: str, status: str = "completed") -> StoredResult:
+        return await asyncio.to_thread(self._store, agent, job_id, text.encode("utf-8"), status)
+
+    async def get_or_fetch(self, agent: str, job_id: str,
+                           fetch: Callable[[], Awaitable[Tuple[Optional[str], str]]]
+                           ) -> Tuple[Optional[StoredResult], str]:
+        """Stored result for a job, fetching it at most once however many users ask.
+
+        `fetch` returns (final status or None, text); only final results are
+        stored. Returns the stored result, or None and the text when it was not stored.
+        """
+        stored = await self.get(agent, job_id)
+        if stored:
+            return stored, ""
+        key = (agent, job_id)
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = self._inflight[key] = asyncio.ensure_future(self._fetch_and_store(agent, job_id, fetch))
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A cancelled caller must not cancel the download other users wait on
+        return await asyncio.shield(pending)
+
+    async def _fetch_and_store(self, agent, job_id, fetch) -> Tuple[Optional[StoredResult], str]:
+        status, text = await fetch()
+        if not status:
+            return None, text
+        return await self.put(agent, job_id, text, status), ""
+
+    async def open(self, stored: StoredResult) -> mmap.mmap:
+        """Memory-map a stored result, for sending without holding it as a str"""
+        def _map():
+            with open(stored.path, "rb") as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return await asyncio.to_thread(_map)
+
+    async def read_text(self, stored: StoredResult) -> str:
+        def _read():
+            with open(stored.path, "rb") as f:
+                return f.read().decode("utf-8", errors="replace")
+        return await asyncio.to_thread(_read)
+
+    async def set_file_id(self, stored: StoredResult, file_id: str):
+        """Remember Telegram's id for an upload so the content is never uploaded again"""
+        stored.file_id = file_id
+        await asyncio.to_thread(_write_atomic, stored.path + ".file_id", file_id.encode())
+
+
+result_store = ResultStore()
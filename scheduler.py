@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    SCHED_WEIGHT_INTERACTIVE,
+    SCHED_WEIGHT_NOTIFICATION,
+    SCHED_WEIGHT_BACKGROUND,
+    BACKGROUND_RESERVED_SLOTS,
+    INTERACTIVE_LATENCY_TARGET,
+)
+from request_context import INTERACTIVE, NOTIFICATION, BACKGROUND
+
+DEFAULT_WEIGHTS = {
+    INTERACTIVE: SCHED_WEIGHT_INTERACTIVE,
+    NOTIFICATION: SCHED_WEIGHT_NOTIFICATION,
+    BACKGROUND: SCHED_WEIGHT_BACKGROUND,
+}
+
+# Interactive queue wait is smoothed and decays with this half-life (seconds)
+WAIT_HALF_LIFE = 5.0
+
+
+class PriorityScheduler:
+    """Weighted fair queuing of MCP server slots between priority classes"""
+
+    def __init__(self, slots: int, weights: Optional[Dict[str, float]] = None,
+                 reserved: int = BACKGROUND_RESERVED_SLOTS, target: float = INTERACTIVE_LATENCY_TARGET):
+        self.slots = slots
+        self.weights = weights or DEFAULT_WEIGHTS
+        self.reserved = min(reserved, max(0, slots - 1))
+        self.target = target
+        self.in_use = 0
+        self.running = {priority: 0 for priority in self.weights}
+        self.waiting: List[list] = []  # heap of [tag, seq, priority, future, enqueued_at]
+        self.virtual_time = 0.0
+        self.last_tag = {priority: 0.0 for priority in self.weights}
+        self._seq = itertools.count()
+        self._wait_ewma = 0.0
+        self._wait_updated = time.monotonic()
+        self._recheck: Optional[asyncio.TimerHandle] = None
+
+    def interactive_wait(self) -> float:
+        """Smoothed interactive queue wait, decayed while nothing is queued"""
+        age = time.monotonic() - self._wait_updated
+        return self._wait_ewma * math.pow(0.5, age / WAIT_HALF_LIFE)
+
+    def _record_wait(self, seconds: float):
+        self._wait_ewma = 0.8 * self.interactive_wait() + 0.2 * seconds
+        self._wait_updated = time.monotonic()
+
+    def queue_depth(self, priority: Optional[str] = None) -> int:
+        return sum(1 for entry in self.waiting
+                   if not entry[3].done() and (priority is None or entry[2] == priority))
+
+    def _admissible(self, priority: str) -> bool:
+        free = self.slots - self.in_use
+        if free <= 0:
+            return False
+        if priority == BACKGROUND:
+            # Background never eats the reserve, and backs off while users wait
+            if free <= self.reserved or self.interactive_wait() > self.target:
+                return False
+            if self.queue_depth(INTERACTIVE):
+                return False
+        return True
+
+    def _grant(self, priority: str, waited: float):
+        self.in_use += 1
+        self.running[priority] += 1
+        if priority == INTERACTIVE:
+            self._record_wait(waited)
+
+    def try_acquire(self, priority: str = INTERACTIVE) -> bool:
+        """Take a slot only if one is free now and nobody is queued for it"""
+        if self.queue_depth() or not self._admissible(priority):
+            return False
+        self._grant(priority, 0.0)
+        return True
+
+    async def acquire(self, priority: str = INTERACTIVE, timeout: Optional[float] = None):
+        """Wait for a slot in the given priority class"""
+        if self.try_acquire(priority):
+            return
+
+        tag = max(self.virtual_time, self.last_tag[priority]) + 1.0 / self.weights[priority]
+        self.last_tag[priority] = tag
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, [tag, next(self._seq), priority, future, time.monotonic()])
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, timeout=timeout)
+        except BaseException:
+            # Granted just as we gave up: hand the slot straight back
+            if future.done() and not future.cancelled():
+                self.release(priority)
+            raise
+
+    def release(self, priority: str = INTERACTIVE):
+        """Free a slot and hand it to the next eligible waiter"""
+        self.in_use -= 1
+        self.running[priority] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant free slots in virtual finish-tag order, skipping ineligible classes"""
+        self.waiting = [entry for entry in self.waiting if not entry[3].done()]
+        heapq.heapify(self.waiting)
+        while self.waiting and self.in_use < self.slots:
+            chosen = None
+            for entry in sorted(self.waiting):
+                if self._admissible(entry[2]):
+                    chosen = entry
+                    break
+            if chosen is None:
+                # Only throttled background work is left; look again once the
+                # interactive wait has had time to decay
+                if self._recheck is None:
+                    self._recheck = asyncio.get_running_loop().call_later(1.0, self._on_recheck)
+                return
+            self.waiting.remove(chosen)
+            heapq.heapify(self.waiting)
+            tag, _, priority, future, enqueued_at = chosen
+            self.virtual_time = max(self.virtual_time, tag)
+            self._grant(priority, time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    def _on_recheck(self):
+        self._recheck = None
+        self._dispatch()
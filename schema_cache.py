@@ -0,0 +1,239 @@
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import SCHEMA_CACHE_SIZE, SCHEMA_CACHE_TTL
+from metrics import CACHE_REQUESTS_TOTAL
+
+# Returns a list of human-readable problems; empty when the input is valid
+Validator = Callable[[Any], List[str]]
+Check = Callable[[Any], Optional[str]]
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_URL = re.compile(r"^https?://\S+$")
+
+_STRING_TYPES = {"string", "text", "textarea", "email", "url", "password"}
+_NUMBER_TYPES = {"number", "integer", "float"}
+_BOOLEAN_TYPES = {"boolean", "checkbox"}
+_OPTION_TYPES = {"option", "radio", "select", "multiselect"}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _type_check(kind: str) -> Optional[Check]:
+    if kind in _STRING_TYPES:
+        return lambda v: None if isinstance(v, str) else "must be a string"
+    if kind in _NUMBER_TYPES:
+        if kind == "integer":
+            return lambda v: None if isinstance(v, int) and not isinstance(v, bool) else "must be an integer"
+        return lambda v: None if _is_number(v) else "must be a number"
+    if kind in _BOOLEAN_TYPES:
+        return lambda v: None if isinstance(v, bool) else "must be true or false"
+    if kind == "array":
+        return lambda v: None if isinstance(v, list) else "must be a list"
+    if kind == "object":
+        return lambda v: None if isinstance(v, dict) else "must be an object"
+    return None
+
+
+def _bound_check(kind: str, bound: str, limit: float) -> Check:
+    """min/max on length for strings and lists, on value for numbers"""
+    below = bound == "min"
+    if kind in _NUMBER_TYPES:
+        if below:
+            return lambda v: None if not _is_number(v) or v >= limit else f"must be at least {limit:g}"
+        return lambda v: None if not _is_number(v) or v <= limit else f"must be at most {limit:g}"
+    noun = "selections" if kind in _OPTION_TYPES or kind == "array" else "characters"
+    if below:
+        return lambda v: None if not hasattr(v, "__len__") or len(v) >= limit else f"needs at least {limit:g} {noun}"
+    return lambda v: None if not hasattr(v, "__len__") or len(v) <= limit else f"allows at most {limit:g} {noun}"
+
+
+def _format_check(fmt: str) -> Optional[Check]:
+    if fmt == "email":
+        return lambda v: None if isinstance(v, str) and _EMAIL.match(v) else "must be an email address"
+    if fmt == "url":
+        return lambda v: None if isinstance(v, str) and _URL.match(v) else "must be an http(s) URL"
+    if fmt == "nonempty":
+        return lambda v: None if v not in ("", None, [], {}) else "must not be empty"
+    if fmt == "integer":
+        return lambda v: None if isinstance(v, int) and not isinstance(v, bool) else "must be an integer"
+    return None
+
+
+def _option_check(values: List[Any]) -> Check:
+    allowed = set(map(str, values))
+    indices = range(len(values))
+
+    def check(v):
+        for item in v if isinstance(v, list) else [v]:
+            # MIP-003 selects by index; plain values are accepted too
+            if not (isinstance(item, int) and item in indices) and str(item) not in allowed:
+                return f"must be one of: {', '.join(map(str, values))}"
+        return None
+    return check
+
+
+def _compile_mip003_field(field: Dict[str, Any]) -> Tuple[str, bool, List[Check]]:
+    kind = str(field.get("type", "string")).lower()
+    checks: List[Check] = []
+    type_check = _type_check(kind)
+    if type_check:
+        checks.append(type_check)
+    if kind in _OPTION_TYPES:
+        values = (field.get("data") or {}).get("values") or []
+        if values:
+            checks.append(_option_check(values))
+
+    required = kind != "none"
+    for rule in field.get("validations") or []:
+        name, value = rule.get("validation"), rule.get("value")
+        if name == "optional" and str(value).lower() != "false":
+            required = False
+        elif name in ("min", "max"):
+            try:
+                checks.append(_bound_check(kind, name, float(value)))
+            except (TypeError, ValueError):
+                pass
+        elif name == "format":
+            check = _format_check(str(value))
+            if check:
+                checks.append(check)
+    if kind in ("email", "url"):
+        checks.append(_format_check(kind))
+    return field["id"], required, checks
+
+
+def _compile_json_schema_field(spec: Dict[str, Any]) -> List[Check]:
+    kind = spec.get("type", "")
+    checks: List[Check] = []
+    type_check = _type_check(kind)
+    if type_check:
+        checks.append(type_check)
+    if "enum" in spec:
+        allowed = spec["enum"]
+        checks.append(lambda v: None if v in allowed else f"must be one of: {', '.join(map(str, allowed))}")
+    for key, bound in (("minLength", "min"), ("minItems", "min"), ("minimum", "min"),
+                       ("maxLength", "max"), ("maxItems", "max"), ("maximum", "max")):
+        if key in spec:
+            checks.append(_bound_check("number" if key in ("minimum", "maximum") else kind, bound, float(spec[key])))
+    if "pattern" in spec:
+        pattern = re.compile(spec["pattern"])
+        checks.append(lambda v: None if not isinstance(v, str) or pattern.search(v) else f"must match {pattern.pattern}")
+    if spec.get("format") in ("email", "uri", "url"):
+        checks.append(_format_check("email" if spec["format"] == "email" else "url"))
+    return checks
+
+
+def compile_schema(schema: Any) -> Optional[Validator]:
+    """Build a validator from a MIP-003 input schema or a JSON Schema object.
+
+    All type, bound, option and pattern checks are resolved here, so
+    validating an input is a flat loop over prebuilt closures. Returns None
+    for schemas in a shape we do not understand (input is then not checked).
+    """
+    if not isinstance(schema, dict):
+        return None
+    if isinstance(schema.get("input_data"), list):
+        fields = [_compile_mip003_field(f) for f in schema["input_data"] if isinstance(f, dict) and "id" in f]
+    elif isinstance(schema.get("properties"), dict):
+        required = set(schema.get("required") or [])
+        fields = [(name, name in required, _compile_json_schema_field(spec))
+                  for name, spec in schema["properties"].items() if isinstance(spec, dict)]
+    else:
+        return None
+
+    def validate(data: Any) -> List[str]:
+        if not isinstance(data, dict):
+            return ["input must be a JSON object"]
+        errors = []
+        for name, required, checks in fields:
+            if name not in data:
+                if required:
+                    errors.append(f"{name}: is required")
+                continue
+            value = data[name]
+            for check in checks:
+                problem = check(value)
+                if problem:
+                    errors.append(f"{name}: {problem}")
+                    break
+        return errors
+    return validate
+
+
+class SchemaEntry:
+    __slots__ = ("raw", "validate", "expires")
+
+    def __init__(self, raw: str, validate: Optional[Validator], expires: float):
+        self.raw = raw
+        self.validate = validate
+        self.expires = expires
+
+
+class SchemaCache:
+    """LRU cache of agent input schemas, compiled once, keyed by (agent id, API base URL)"""
+
+    def __init__(self, max_entries: int = SCHEMA_CACHE_SIZE, ttl: float = SCHEMA_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[str, str], SchemaEntry]" = OrderedDict()
+        self.version = 0  # bumped on every change, for checkpointing
+
+    def get(self, agent_id: str, api_base_url: str) -> Optional[SchemaEntry]:
+        key = (agent_id, api_base_url)
+        entry = self.entries.get(key)
+        if entry is None:
+            CACHE_REQUESTS_TOTAL.labels("schema", "miss").inc()
+            return None
+        if entry.expires <= time.monotonic():
+            del self.entries[key]
+            CACHE_REQUESTS_TOTAL.labels("schema", "expired").inc()
+            return None
+        self.entries.move_to_end(key)
+        CACHE_REQUESTS_TOTAL.labels("schema", "hit").inc()
+        return entry
+
+    def put(self, agent_id: str, api_base_url: str, raw: str) -> SchemaEntry:
+        try:
+            validate = compile_schema(json.loads(raw))
+        except (json.JSONDecodeError, re.error, KeyError, TypeError):
+            validate = None
+        entry = SchemaEntry(raw, validate, time.monotonic() + self.ttl)
+        self.entries[(agent_id, api_base_url)] = entry
+        self.entries.move_to_end((agent_id, api_base_url))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.version += 1
+        return entry
+
+    def invalidate(self, agent_id: Optional[str] = None, api_base_url: Optional[str] = None) -> int:
+        """Drop entries matching the given agent and/or URL (all entries if neither)"""
+        stale = [key for key in self.entries
+                 if (agent_id is None or key[0] == agent_id) and (api_base_url is None or key[1] == api_base_url)]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self.version += 1
+        return len(stale)
+
+    def export(self) -> List[Tuple[str, str, str, float]]:
+        """(agent id, API base URL, raw schema, seconds left) for each live entry, oldest first"""
+        now = time.monotonic()
+        return [(agent_id, url, entry.raw, entry.expires - now)
+                for (agent_id, url), entry in self.entries.items() if entry.expires > now]
+
+    def restore(self, items: List[Tuple[str, str, str, float]], elapsed: float = 0.0):
+        """Re-add exported entries, `elapsed` seconds after they were exported"""
+        now = time.monotonic()
+        for agent_id, url, raw, left in items:
+            if left - elapsed > 0 and (agent_id, url) not in self.entries:
+                entry = self.put(agent_id, url, raw)
+                entry.expires = now + min(left - elapsed, self.ttl)
+
+
+schema_cache = SchemaCache()
@@ -0,0 +1,36 @@
+import bisect
+import hashlib
+
+from config import WORKER_COUNT, WORKER_ID
+
+# Points per worker on the ring; more points spread chats more evenly
+_REPLICAS = 128
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring over workers 0..n-1.
+
+    Each chat maps to one worker, and changing the worker count moves only
+    about 1/n of the chats, so per-chat state mostly stays where it was.
+    """
+
+    def __init__(self, nodes: int, replicas: int = _REPLICAS):
+        points = sorted((_hash(f"worker-{node}:{r}"), node) for node in range(max(1, nodes)) for r in range(replicas))
+        self.points = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def node_for(self, key) -> int:
+        i = bisect.bisect(self.points, _hash(str(key)))
+        return self.nodes[i % len(self.nodes)]
+
+
+ring = HashRing(WORKER_COUNT)
+
+
+def owns(chat_id: int) -> bool:
+    """Whether this process handles the chat (always, outside multi-process mode)"""
+    return WORKER_COUNT <= 1 or ring.node_for(chat_id) == WORKER_ID
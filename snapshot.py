@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from agent_index import agent_index
+from atomic_file import atomic_write
+from config import SNAPSHOT_PATH, SNAPSHOT_INTERVAL
+from ranking import Postings, agent_stats
+from schema_cache import schema_cache
+
+logger = logging.getLogger(__name__)
+
+# Bump the last byte when the layout of the snapshot state changes, derived
+# index data (cards, ranking columns) included; files with another header
+# are ignored and the bot starts cold
+_MAGIC = b"MASUMI-SNAPSHOT\x03"
+_HEADER = struct.Struct("<Q")
+_ALIGN = 8
+# Markers for values JSON cannot hold; NUL never starts a registry key
+_ARRAY = "\x00array"
+_OBJECT = "\x00object"
+# Classes a snapshot may rebuild, from the plain state their __getstate__ returned
+_CLASSES = {"Postings": Postings}
+_CLASS_NAMES = {cls: name for name, cls in _CLASSES.items()}
+# How often a worker that does not refresh the index checks for a newer snapshot
+_FOLLOW_INTERVAL = 5.0
+
+
+def _padding(size: int) -> int:
+    return -size % _ALIGN
+
+
+class _Encoder:
+    """json.dumps `default`: numpy arrays go to the data section, known classes by their state"""
+
+    def __init__(self):
+        self.arrays: List[np.ndarray] = []
+        self.size = 0
+
+    def __call__(self, value: Any) -> Any:
+        if isinstance(value, np.ndarray):
+            if value.dtype.hasobject:
+                raise TypeError("object arrays cannot be snapshotted")
+            array = np.ascontiguousarray(value)
+            self.arrays.append(array)
+            offset, self.size = self.size, self.size + array.nbytes + _padding(array.nbytes)
+            return {_ARRAY: [array.dtype.str, list(array.shape), offset]}
+        if type(value) in _CLASS_NAMES:
+            return {_OBJECT: _CLASS_NAMES[type(value)], "state": value.__getstate__()}
+        raise TypeError(f"cannot snapshot {type(value).__name__}")
+
+
+def _decoder(data: mmap.mmap, base: int):
+    """json.loads `object_hook` reversing _Encoder; arrays are views of `data`"""
+    def hook(value: Dict[str, Any]) -> Any:
+        if _ARRAY in value:
+            dtype, shape, offset = value[_ARRAY]
+            count = int(np.prod(shape, dtype=np.int64))
+            return np.frombuffer(data, dtype=np.dtype(dtype), count=count, offset=base + offset).reshape(shape)
+        if _OBJECT in value:
+            cls = _CLASSES[value[_OBJECT]]
+            obj = cls.__new__(cls)
+            obj.__setstate__(value["state"])
+            return obj
+        return value
+    return hook
+
+
+def write_snapshot(path: str, state: Dict[str, Any]):
+    """Write the state atomically, so a crash mid-write keeps the previous snapshot.
+
+    Layout: magic, header length, the state as JSON, then the raw bytes of
+    each numpy array in it, 8-byte aligned. Nothing in the file is executed
+    on load.
+    """
+    encoder = _Encoder()
+    header = json.dumps(state, default=encoder, separators=(",", ":")).encode()
+    header += b" " * _padding(len(_MAGIC) + _HEADER.size + len(header))
+
+    with atomic_write(path) as f:
+        f.write(_MAGIC)
+        f.write(_HEADER.pack(len(header)))
+        f.write(header)
+        for array in encoder.arrays:
+            f.write(array.tobytes())
+            f.write(b"\0" * _padding(array.nbytes))
+
+
+def read_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """Snapshot state, or None if there is no usable snapshot at `path`.
+
+    Arrays are read-only views of the memory-mapped file, so the posting
+    lists are not copied; the mapping lives as long as they do.
+    """
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < len(_MAGIC) + _HEADER.size:
+                return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError:
+        # Missing or unreadable
+        return None
+    if data[:len(_MAGIC)] != _MAGIC:
+        logger.warning(f"⚠️ Ignoring snapshot {path} written by another version")
+        return None
+    try:
+        start = len(_MAGIC) + _HEADER.size
+        (length,) = _HEADER.unpack_from(data, len(_MAGIC))
+        return json.loads(data[start:start + length], object_hook=_decoder(data, start + length))
+    except (ValueError, TypeError, KeyError, IndexError, struct.error) as e:
+        logger.warning(f"⚠️ Ignoring corrupt snapshot {path}: {e}")
+        return None
+
+
+class Snapshotter:
+    """Checkpoints the agent index, schema cache, hire stats and last status for warm starts.
+
+    The snapshot is loaded off the event loop right after startup; commands
+    that need the index wait for it briefly instead of fetching the registry
+    (see AgentIndex.ensure_ready). It is rewritten every SNAPSHOT_INTERVAL
+    seconds when something changed.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self._saved_versions = None
+
+    def _versions(self):
+        return agent_index.version, schema_cache.version, agent_stats.version
+
+    async def load(self) -> bool:
+        started = time.monotonic()
+        try:
+            state = await asyncio.to_thread(read_snapshot, self.path)
+            if state is None:
+                return False
+            try:
+                self._restore(state)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"⚠️ Ignoring malformed snapshot {self.path}: {e}")
+                return False
+            self._saved_versions = self._versions()
+            logger.info(f"📸 Warm start from {self.path}: {len(agent_index.agents)} agents, "
+                        f"{len(schema_cache.entries)} schemas in {(time.monotonic() - started) * 1000:.0f}ms")
+            return True
+        finally:
+            agent_index.loaded.set()
+
+    def _restore(self, state: Dict[str, Any]):
+        # A refresh that finished first has newer data than the snapshot
+        if not agent_index.ready:
+            index = state["index"]
+            entries = [(agent, tuple(tokens), digest) for agent, tokens, digest in index["entries"]]
+            agent_index.replace(entries, index["updated_at"], index.get("derived"))
+            agent_index.status = state.get("status", {})
+        schema_cache.restore(state.get("schemas", []), elapsed=time.time() - state["saved_at"])
+        agent_stats.restore(state.get("agent_stats", {}))
+
+    async def save(self, force: bool = False) -> bool:
+        versions = self._versions()
+        if not agent_index.ready or (versions == self._saved_versions and not force):
+            return False
+        state = {
+            "saved_at": time.time(),
+            "index": {"entries": agent_index.entries(), "updated_at": agent_index.updated_at,
+                      "derived": agent_index.derived},
+            "status": agent_index.status,
+            "schemas": schema_cache.export(),
+            "agent_stats": agent_stats.export(),
+        }
+        await asyncio.to_thread(write_snapshot, self.path, state)
+        self._saved_versions = versions
+        return True
+
+    async def follow(self):
+        """Pick up the index from snapshots another process writes.
+
+        For workers that do not refresh the index themselves; they lag the
+        writer by up to SNAPSHOT_INTERVAL plus _FOLLOW_INTERVAL seconds.
+        """
+        seen = None
+        while True:
+            await asyncio.sleep(_FOLLOW_INTERVAL)
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == seen:
+                    continue
+                seen = mtime
+                state = await asyncio.to_thread(read_snapshot, self.path)
+                if state is None or state["index"]["updated_at"] <= agent_index.updated_at:
+                    continue
+                index = state["index"]
+                entries = [(agent, tuple(tokens), digest) for agent, tokens, digest in index["entries"]]
+                agent_index.publish(agent_index.replace(entries, index["updated_at"], index.get("derived")))
+                agent_index.status = state.get("status", {})
+                agent_index.loaded.set()
+            except FileNotFoundError:
+                pass
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"⚠️ Ignoring malformed snapshot {self.path}: {e}")
+
+    async def run(self):
+        """Checkpoint every SNAPSHOT_INTERVAL seconds"""
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.warning(f"⚠️ Snapshot checkpoint failed: {e}")
+
+
+snapshotter = Snapshotter()
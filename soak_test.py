@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Soak test with leak detection.
+
+Drives a mixed command workload (including abandoned /hire_agent flows)
+through the bot handlers against fake_mcp_server.py for a long period,
+sampling child process count, zombies, open fds, RSS, tracemalloc usage,
+bot session/in-flight table sizes and idle pool size. After a warm-up
+period the growth trend of each metric (least-squares slope per hour) is
+compared with a threshold; the run fails (exit code 1) if any exceed it.
+
+Example:
+    python soak_test.py --hours 4 --rate 5
+    FAKE_MCP_CRASH_RATE=0.001 python soak_test.py --hours 0.25 --samples soak.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Dict, Any, List
+
+# Expire abandoned hire sessions within the run so their count can level off
+os.environ.setdefault("SESSION_TTL", "300")
+
+# Sets up the fake server environment before the bot is imported
+from bench_load import COMMANDS, build_application, make_update
+from config import SESSION_TTL
+from procstats import child_pids, open_fds, rss_bytes, zombie_children
+
+# Allowed growth per hour once warmed up
+THRESHOLDS = {
+    "children": 1.0,
+    "zombies": 0.5,
+    "fds": 10.0,
+    "rss_mb": 20.0,
+    "traced_mb": 10.0,
+    "sessions": 50.0,
+    "inflight": 5.0,
+}
+
+
+def slope_per_hour(samples: List[Dict[str, Any]], key: str) -> float:
+    """Least-squares slope of a metric over time, in units per hour"""
+    n = len(samples)
+    if n < 3:
+        return 0.0
+    xs = [s["t"] for s in samples]
+    ys = [s[key] for s in samples]
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if var == 0:
+        return 0.0
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    return cov / var * 3600
+
+
+def take_sample(started: float, masumi_bot) -> Dict[str, Any]:
+    current, _ = tracemalloc.get_traced_memory()
+    return {
+        "t": time.monotonic() - started,
+        "children": len(child_pids()),
+        "zombies": zombie_children(),
+        "fds": open_fds(),
+        "rss_mb": rss_bytes() / (1024 * 1024),
+        "traced_mb": current / (1024 * 1024),
+        "sessions": len(masumi_bot.user_sessions),
+        "inflight": len(masumi_bot.inflight),
+        "pool_idle": len(masumi_bot.mcp_pool.idle),
+    }
+
+
+def top_allocations(limit: int = 5) -> List[str]:
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    return [str(stat) for stat in snapshot.statistics("lineno")[:limit]]
+
+
+async def drive(application, duration: float, rate: float, abandon_ratio: float, stop: asyncio.Event):
+    """Open-loop mixed traffic; some users start a hire and never finish it"""
+    tasks = set()
+    update_id = 0
+    started = time.monotonic()
+    texts = list(COMMANDS.values())
+
+    async def conversation(chat_id: int):
+        nonlocal update_id
+        update_id += 1
+        text = random.choice(texts)
+        await application.process_update(make_update(application, update_id, chat_id, text))
+        if text.startswith("/hire_agent") and random.random() > abandon_ratio:
+            update_id += 1
+            await application.process_update(make_update(application, update_id, chat_id, '{"text": "soak"}'))
+
+    while time.monotonic() - started < duration and not stop.is_set():
+        task = asyncio.create_task(conversation(random.randrange(1, 10 ** 9)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        await asyncio.sleep(random.expovariate(rate))
+    await asyncio.gather(*tasks)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=1.0, help="how long to run")
+    parser.add_argument("--rate", type=float, default=5.0, help="conversations started per second")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between samples")
+    parser.add_argument("--warmup", type=float, default=0.2, help="fraction of the run ignored for trends")
+    parser.add_argument("--abandon", type=float, default=0.3, help="fraction of hire flows left unfinished")
+    parser.add_argument("--samples", help="write every sample to this JSONL file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    tracemalloc.start(10)
+    application, masumi_bot, _ = await build_application(0.0)
+
+    samples: List[Dict[str, Any]] = []
+    stop = asyncio.Event()
+    started = time.monotonic()
+    traffic = asyncio.create_task(drive(application, args.hours * 3600, args.rate, args.abandon, stop))
+    out = open(args.samples, "w") if args.samples else None
+    try:
+        while not traffic.done():
+            await asyncio.wait({traffic}, timeout=args.interval)
+            sample = take_sample(started, masumi_bot)
+            samples.append(sample)
+            if out:
+                out.write(json.dumps(sample) + "\n")
+                out.flush()
+            print(" ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in sample.items()))
+        traffic.result()
+    except KeyboardInterrupt:
+        stop.set()
+    finally:
+        top = top_allocations()
+        await masumi_bot.mcp_pool.close()
+        await application.shutdown()
+        if out:
+            out.close()
+
+    steady = samples[int(len(samples) * args.warmup):]
+    print("\nGrowth per hour after warm-up:")
+    failed = []
+    for key, limit in THRESHOLDS.items():
+        slope = slope_per_hour(steady, key)
+        verdict = "OK" if slope <= limit else "LEAK?"
+        if slope > limit:
+            failed.append(key)
+        print(f"  {key:<10} {slope:>10.2f}  (limit {limit})  {verdict}")
+    if args.hours * 3600 < SESSION_TTL:
+        print(f"  note: run is shorter than SESSION_TTL ({SESSION_TTL:.0f}s), abandoned sessions are not yet expired")
+
+    print("\nTop allocations:")
+    for line in top:
+        print(f"  {line}")
+
+    if failed:
+        print(f"\n❌ Soak test failed: {', '.join(failed)} kept growing")
+        sys.exit(1)
+    print("\n✅ No sustained growth detected")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,210 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from agent_index import RegistryDiff
+from atomic_file import atomic_write
+from config import SUBSCRIPTIONS_PATH, SUBSCRIPTIONS_PER_CHAT, NOTIFY_RATE, WORKER_COUNT, WORKER_ID
+from formatting import agent_topics, render_registry_changes
+from metrics import registry
+from sharding import owns
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_TOTAL = registry.counter("masumi_bot_notifications_total", "Registry change notifications",
+                                       ("outcome",))
+registry.callback_gauge("masumi_bot_notification_queue_depth", "Notifications waiting to be sent", (),
+                        lambda: {(): notifier.queue.qsize()})
+
+
+def _read_json(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _by_mtime(paths: List[str]) -> List[str]:
+    """Existing paths, oldest first"""
+    stamped = []
+    for path in set(paths):
+        try:
+            stamped.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    return [path for _, path in sorted(stamped)]
+
+
+def _write_json(path: str, data):
+    with atomic_write(path, "w") as f:
+        json.dump(data, f)
+
+
+class SubscriptionStore:
+    """Which chats follow which topics (capability names and tags).
+
+    Kept as an inverted index from topic to chats, so matching a registry
+    diff costs one lookup per topic of each changed agent, however many
+    chats are subscribed. Persisted to SUBSCRIPTIONS_PATH as JSON.
+    """
+
+    def __init__(self, path: str = SUBSCRIPTIONS_PATH):
+        self.base = path
+        root, ext = os.path.splitext(path)
+        self.path = path if WORKER_COUNT <= 1 else f"{root}.w{WORKER_ID}{ext}"
+        self.by_topic: Dict[str, Set[int]] = defaultdict(set)
+        self.by_chat: Dict[int, Set[str]] = defaultdict(set)
+        self._save_task: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    async def load(self):
+        # In multi-process mode each worker keeps the chats it owns in its own
+        # file. Every worker's file is read, so chats follow a change in the
+        # worker count; a newer file's copy of a chat wins over an older one.
+        root, ext = os.path.splitext(self.base)
+        paths = await asyncio.to_thread(_by_mtime, [self.base] + glob.glob(f"{glob.escape(root)}.w*{ext}"))
+        loaded: Dict[int, List[str]] = {}
+        changed = False
+        for path in paths:
+            try:
+                data = await asyncio.to_thread(_read_json, path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Could not read subscriptions from {path}: {e}")
+                continue
+            for chat_id, topics in data.items():
+                if not owns(int(chat_id)):
+                    continue
+                # Adopted chats are saved here; the previous owner drops them
+                # the next time it saves, so nobody reads a half-moved chat
+                changed |= path != self.path
+                loaded[int(chat_id)] = topics
+        for chat_id, topics in loaded.items():
+            for topic in topics:
+                self.by_topic[topic].add(chat_id)
+                self.by_chat[chat_id].add(topic)
+        if changed:
+            self._schedule_save()
+        logger.info(f"🔔 Loaded {sum(map(len, self.by_chat.values()))} subscriptions for {len(self.by_chat)} chats")
+
+    def _schedule_save(self):
+        # Changes made while a write is running are picked up by its next pass
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.get_running_loop().create_task(self._save())
+
+    async def _save(self):
+        while self._dirty:
+            self._dirty = False
+            data = {str(chat_id): sorted(topics) for chat_id, topics in self.by_chat.items() if topics}
+            try:
+                await asyncio.to_thread(_write_json, self.path, data)
+            except OSError as e:
+                logger.warning(f"⚠️ Could not save subscriptions: {e}")
+                return
+
+    def topics(self, chat_id: int) -> List[str]:
+        return sorted(self.by_chat.get(chat_id, ()))
+
+    def subscribe(self, chat_id: int, topic: str) -> bool:
+        """Add a subscription; False if the chat already has SUBSCRIPTIONS_PER_CHAT"""
+        topics = self.by_chat[chat_id]
+        if topic not in topics and len(topics) >= SUBSCRIPTIONS_PER_CHAT:
+            return False
+        topics.add(topic)
+        self.by_topic[topic].add(chat_id)
+        self._schedule_save()
+        return True
+
+    def unsubscribe(self, chat_id: int, topic: Optional[str] = None) -> int:
+        """Remove one topic, or all of the chat's topics; returns how many were removed"""
+        topics = self.by_chat.pop(chat_id, set()) if topic is None else {topic} & self.by_chat.get(chat_id, set())
+        for name in topics:
+            self.by_chat.get(chat_id, set()).discard(name)
+            chats = self.by_topic.get(name)
+            if chats is not None:
+                chats.discard(chat_id)
+                if not chats:
+                    del self.by_topic[name]
+        if topics:
+            self._schedule_save()
+        return len(topics)
+
+    def match(self, diff: RegistryDiff) -> Dict[int, Tuple[Set[str], Dict[str, list]]]:
+        """Per chat: the topics that matched and the added/changed/removed agents"""
+        matches: Dict[int, Tuple[Set[str], Dict[str, list]]] = {}
+        for kind in ("added", "changed", "removed"):
+            for agent in getattr(diff, kind):
+                chats_seen: Set[int] = set()
+                for topic in agent_topics(agent):
+                    for chat_id in self.by_topic.get(topic, ()):
+                        topics, changes = matches.setdefault(chat_id, (set(), defaultdict(list)))
+                        topics.add(topic)
+                        # An agent matching several of a chat's topics is listed once
+                        if chat_id not in chats_seen:
+                            changes[kind].append(agent)
+                            chats_seen.add(chat_id)
+        return matches
+
+
+class Notifier:
+    """Sends registry change notifications through one rate-limited queue.
+
+    Each refresh's diff becomes at most one message per subscribed chat, and
+    messages go out no faster than NOTIFY_RATE per second so a large diff
+    cannot trip Telegram's flood limits.
+    """
+
+    def __init__(self, store: SubscriptionStore, rate: float = NOTIFY_RATE):
+        self.store = store
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.queue: "asyncio.Queue[Tuple[int, str]]" = asyncio.Queue()
+
+    def publish(self, diff: RegistryDiff):
+        """AgentIndex listener: queue one notification per matching chat"""
+        matches = self.store.match(diff)
+        for chat_id, (topics, changes) in matches.items():
+            self.queue.put_nowait((chat_id, render_registry_changes(sorted(topics), changes)))
+        if matches:
+            logger.info(f"🔔 Queued {len(matches)} notifications for {diff!r}")
+
+    async def run(self, bot: Bot):
+        while True:
+            chat_id, text = await self.queue.get()
+            try:
+                await self._send(bot, chat_id, text)
+            except Exception as e:
+                NOTIFICATIONS_TOTAL.labels("error").inc()
+                logger.warning(f"⚠️ Notification to chat {chat_id} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _send(self, bot: Bot, chat_id: int, text: str):
+        for _ in range(3):
+            try:
+                try:
+                    await bot.send_message(chat_id, text, parse_mode=ParseMode.MARKDOWN)
+                except BadRequest as e:
+                    # Agent names may contain Markdown characters
+                    if "parse entities" not in str(e).lower():
+                        raise
+                    await bot.send_message(chat_id, text)
+                NOTIFICATIONS_TOTAL.labels("sent").inc()
+                return
+            except RetryAfter as e:
+                NOTIFICATIONS_TOTAL.labels("throttled").inc()
+                await asyncio.sleep(e.retry_after)
+            except Forbidden:
+                # The user blocked the bot or left the chat
+                NOTIFICATIONS_TOTAL.labels("forbidden").inc()
+                self.store.unsubscribe(chat_id)
+                return
+        NOTIFICATIONS_TOTAL.labels("dropped").inc()
+
+
+subscriptions = SubscriptionStore()
+notifier = Notifier(subscriptions)
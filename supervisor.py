@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Multi-process mode: one Telegram poller feeding N bot worker processes.
+
+The supervisor polls Telegram and routes each update to a worker chosen by
+consistent hashing of its chat id (sharding.HashRing). Updates of one chat
+therefore reach the same worker, in order, and the chat's hire session
+stays in that worker's memory. Workers are bot.py processes that read their
+updates from a Unix socket (SUPERVISOR_SOCKET) instead of polling. A worker
+that exits is restarted; updates routed to it in the meantime are held and
+delivered once it reconnects. Updates are acknowledged to Telegram when they
+are fetched, so those still held here are lost if the supervisor crashes.
+
+Example:
+    python supervisor.py --workers 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+from config import TELEGRAM_BOT_TOKEN, METRICS_PORT, SUPERVISOR_SOCKET, SUPERVISOR_WORKERS, WORKER_ID
+from sharding import HashRing
+
+logger = logging.getLogger("supervisor")
+
+# Updates held for a worker that is down; the oldest are dropped beyond this
+_BACKLOG = 10_000
+# Restart delay for a crashing worker, doubling up to the maximum
+_RESTART_DELAY = 1.0
+_RESTART_DELAY_MAX = 30.0
+# How long a slow worker may hold up the poller before its updates are left buffered
+_DRAIN_TIMEOUT = 1.0
+_STOP_TIMEOUT = 30.0
+_LINE_LIMIT = 16 * 1024 * 1024
+
+
+def update_key(data: Dict[str, Any]) -> int:
+    """The chat an update belongs to, or its sender for updates without one (inline queries)"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        if "chat" in value:
+            return value["chat"]["id"]
+        message = value.get("message")
+        if isinstance(message, dict) and "chat" in message:
+            return message["chat"]["id"]
+        if "from" in value:
+            return value["from"]["id"]
+    return data.get("update_id", 0)
+
+
+class WorkerHandle:
+    """The supervisor's side of one worker: its process, connection and backlog"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.backlog: Deque[bytes] = deque(maxlen=_BACKLOG)
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    def send(self, line: bytes):
+        if self.connected:
+            self.writer.write(line)
+            return
+        if len(self.backlog) == self.backlog.maxlen:
+            logger.warning(f"⚠️ Worker {self.index} backlog full, dropping its oldest update")
+        self.backlog.append(line)
+
+    def attach(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        while self.backlog:
+            writer.write(self.backlog.popleft())
+
+
+class Supervisor:
+    def __init__(self, workers: int = SUPERVISOR_WORKERS, socket_path: str = SUPERVISOR_SOCKET):
+        self.socket_path = os.path.abspath(socket_path)
+        self.ring = HashRing(workers)
+        self.workers = [WorkerHandle(i) for i in range(workers)]
+        self.stopping = False
+        self.worker_command = [sys.executable, os.path.abspath(__file__), "--worker"]
+
+    def route(self, data: Dict[str, Any]):
+        worker = self.workers[self.ring.node_for(update_key(data))]
+        worker.send(json.dumps(data, separators=(",", ":")).encode() + b"\n")
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            hello = json.loads(await reader.readline())
+            worker = self.workers[hello["worker"]]
+        except (ValueError, KeyError, IndexError, TypeError):
+            writer.close()
+            return
+        worker.attach(writer)
+        logger.info(f"🔌 Worker {worker.index} connected")
+        # Workers never write after the hello; EOF means the worker went away
+        await reader.read()
+        if worker.writer is writer:
+            worker.writer = None
+        writer.close()
+
+    async def _drain(self):
+        for worker in self.workers:
+            if worker.connected:
+                try:
+                    await asyncio.wait_for(worker.writer.drain(), _DRAIN_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.warning(f"⚠️ Worker {worker.index} is falling behind")
+                except ConnectionError:
+                    worker.writer = None
+
+    async def _run_worker(self, worker: WorkerHandle):
+        """Keep one worker process running until the supervisor stops"""
+        delay = _RESTART_DELAY
+        env = dict(os.environ, WORKER_ID=str(worker.index), WORKER_COUNT=str(len(self.workers)),
+                   SUPERVISOR_SOCKET=self.socket_path)
+        if METRICS_PORT:
+            env["METRICS_PORT"] = str(METRICS_PORT + worker.index)
+        while not self.stopping:
+            started = time.monotonic()
+            worker.process = await asyncio.create_subprocess_exec(*self.worker_command, env=env)
+            code = await worker.process.wait()
+            if self.stopping:
+                return
+            # A worker that ran for a while gets restarted quickly again
+            delay = _RESTART_DELAY if time.monotonic() - started > 60 else min(delay * 2, _RESTART_DELAY_MAX)
+            logger.warning(f"⚠️ Worker {worker.index} exited with {code}, restarting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+    async def poll(self):
+        """Long-poll Telegram and route every update; acknowledged by the next poll's offset"""
+        bot = Bot(TELEGRAM_BOT_TOKEN)
+        async with bot:
+            await bot.delete_webhook()
+            offset = None
+            while True:
+                try:
+                    updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+                except RetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except (TimedOut, NetworkError) as e:
+                    logger.warning(f"⚠️ getUpdates failed: {e}")
+                    await asyncio.sleep(1.0)
+                    continue
+                for update in updates:
+                    self.route(update.to_dict())
+                    offset = update.update_id + 1
+                await self._drain()
+
+    async def run(self, poll: bool = True):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._accept, path=self.socket_path, limit=_LINE_LIMIT)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        runners = [asyncio.create_task(self._run_worker(worker)) for worker in self.workers]
+        poller = asyncio.create_task(self.poll()) if poll else None
+        logger.info(f"🚦 Supervising {len(self.workers)} workers on {self.socket_path}")
+        try:
+            await stop.wait()
+        finally:
+            await self.stop(poller, runners)
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def stop(self, poller: Optional[asyncio.Task], runners: List[asyncio.Task]):
+        """Stop polling, then let workers finish: closing their socket ends their ingress"""
+        self.stopping = True
+        if poller is not None:
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+        await self._drain()
+        for worker in self.workers:
+            if worker.writer is not None:
+                worker.writer.close()
+        processes = [w.process for w in self.workers if w.process is not None and w.process.returncode is None]
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in processes)), _STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            for process in processes:
+                if process.returncode is None:
+                    process.kill()
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+
+
+async def worker_ingress(application):
+    """bot.main() ingress for a worker: updates routed by the supervisor, until it disconnects"""
+    reader, writer = await asyncio.open_unix_connection(SUPERVISOR_SOCKET, limit=_LINE_LIMIT)
+    writer.write(json.dumps({"worker": WORKER_ID}).encode() + b"\n")
+    await writer.drain()
+    try:
+        while line := await reader.readline():
+            await application.update_queue.put(Update.de_json(json.loads(line), application.bot))
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=SUPERVISOR_WORKERS, help="bot worker processes")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        import bot
+        asyncio.run(bot.main(ingress=worker_ingress))
+        return
+
+    from log_pipeline import setup_logging
+    setup_logging()
+    asyncio.run(Supervisor(max(1, args.workers)).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import os
+
+# config.py refuses to load without a token; tests never reach Telegram
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TEST")
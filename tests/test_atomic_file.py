@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from atomic_file import atomic_write
+
+
+def test_replaces_contents(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("old")
+    with atomic_write(str(path), "w") as f:
+        f.write("new")
+    assert path.read_text() == "new"
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_failure_keeps_old_contents(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("old")
+    with pytest.raises(RuntimeError):
+        with atomic_write(str(path), "w") as f:
+            f.write("partial")
+            raise RuntimeError("interrupted")
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["state.json"]
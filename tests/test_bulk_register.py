@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from bulk_register import BulkRegistration, RateLimiter, render_report, synthetic_agent
+
+
+class FakeRegistry:
+    """Pool and client in one: register_agent fails for the names in `failing`"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.registered = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def acquire(self):
+        return self
+
+    async def release(self, client):
+        pass
+
+    async def register_agent(self, network, **agent):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        if agent["name"] in self.failing:
+            return "❌ Error: wallet has no funds"
+        self.registered.append(agent["name"])
+        return json.dumps({"status": "registered"})
+
+
+def _run(registry, path, run_id="t1", count=12):
+    run = BulkRegistration(registry, count, run_id, concurrency=3, rate=0, checkpoint=str(path))
+    return asyncio.run(run.run())
+
+
+def test_run_resumes_from_the_checkpoint_and_retries_failures(tmp_path):
+    path = tmp_path / "bulk.json"
+    failing = {synthetic_agent("t1", n)["name"] for n in (4, 7)}
+    registry = FakeRegistry(failing)
+    first = _run(registry, path)
+    assert (first["ok"], first["failed"], first["registered"]) == (10, 2, 10)
+    assert first["errors"] == {"❌ Error: wallet has no funds": 2}
+    assert first["error_rate"] == round(2 / 12, 4)
+    assert registry.peak <= 3
+    assert json.loads(path.read_text())["done"] == [n for n in range(12) if n not in (4, 7)]
+
+    registry.failing.clear()
+    second = _run(registry, path)
+    assert (second["resumed"], second["attempted"], second["registered"]) == (10, 2, 12)
+    assert sorted(registry.registered[-2:]) == sorted(failing)
+    assert "12/12 registered (10 from an earlier run)" in render_report(second)
+
+    # Another run id starts over
+    assert _run(FakeRegistry(), path, run_id="t2", count=3)["resumed"] == 0
+
+
+def test_synthetic_agents_are_deterministic():
+    assert synthetic_agent("t1", 5) == synthetic_agent("t1", 5)
+    assert synthetic_agent("t1", 5)["name"] == "masumi-load-t1-000005"
+    assert len(synthetic_agent("t1", 5)["selling_wallet_vkey"]) == 56
+
+
+def test_rate_limiter_spaces_calls():
+    async def scenario():
+        limiter = RateLimiter(100)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(6):
+            await limiter.wait()
+        return loop.time() - started
+
+    assert asyncio.run(scenario()) >= 0.045
@@ -0,0 +1,62 @@
+import asyncio
+import mmap
+
+from telegram.constants import MessageLimit
+
+from delivery import deliver, send_document, split_chunks
+from formatting import utf16_len
+
+
+class FakeMessage:
+    def __init__(self):
+        self.texts = []
+        self.documents = []
+
+    async def reply_text(self, text, **kwargs):
+        self.texts.append(text)
+
+    async def reply_document(self, document, **kwargs):
+        self.documents.append(document)
+
+
+def test_split_chunks_ascii_prefers_newlines():
+    text = "".join(f"line {i}\n" for i in range(1000))
+    chunks = list(split_chunks(text, 100))
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 100 and chunk.endswith("\n") for chunk in chunks)
+
+
+def test_split_chunks_counts_utf16_units():
+    text = "😀" * 5000 + "\n" + "a😀" * 3000
+    chunks = list(split_chunks(text, 1000))
+    assert "".join(chunks) == text
+    assert all(utf16_len(chunk) <= 1000 for chunk in chunks)
+
+
+def test_split_chunks_odd_budget_never_splits_a_character():
+    chunks = list(split_chunks("😀" * 10, 3))
+    assert chunks == ["😀"] * 10
+
+
+def test_deliver_non_bmp_body_stays_under_limit():
+    for body in ("😀" * 3500, "😀" * 7000, "😀 ok\n" * 2000):
+        message = FakeMessage()
+        asyncio.run(deliver(message, "✅ *Result*\n\n", body))
+        assert message.texts
+        assert all(utf16_len(text) <= MessageLimit.MAX_TEXT_LENGTH for text in message.texts)
+
+
+def test_deliver_escapes_fences_within_limit():
+    message = FakeMessage()
+    asyncio.run(deliver(message, "", "```\n" * 1500))
+    assert all(utf16_len(text) <= MessageLimit.MAX_TEXT_LENGTH for text in message.texts)
+    assert all(text.count("```") == 2 for text in message.texts[1:])
+
+
+def test_send_document_uploads_bytes_for_buffer_bodies():
+    with mmap.mmap(-1, 16) as mapped:
+        mapped.write(b"0123456789abcdef")
+        for body in (bytearray(b"abc"), memoryview(b"abc"), mapped):
+            message = FakeMessage()
+            asyncio.run(send_document(message, body, "result.txt", compress=False))
+            assert type(message.documents[0]) is bytes
@@ -0,0 +1,53 @@
+import json
+
+from formatting import clip_utf8, decode_response, escape_markdown, parse_payments_callback, payments_callback_data, render_payments_page
+
+
+def test_clip_utf8_never_splits_a_character():
+    assert clip_utf8("ascii", 3) == "asc"
+    assert clip_utf8("éé", 3) == "é"
+    assert clip_utf8("😀x", 3) == ""
+    assert len(clip_utf8("статус" * 10, 20).encode("utf-8")) <= 20
+
+
+def test_escape_markdown():
+    assert escape_markdown("foo_bar *x* [y] `z`") == "foo\\_bar \\*x\\* \\[y] \\`z\\`"
+
+
+def test_payments_page_escapes_user_filters():
+    page = {"totals": [{"status": "Funds_Locked", "count": 1, "total": 1_000_000}], "matched": 0, "payments": []}
+    text = render_payments_page(page, 1, 1, status="foo_bar", agent_prefix="ab`c")
+    assert "foo\\_bar" in text
+    assert "Funds\\_Locked" in text
+    assert "`ab'c…`" in text
+
+
+def test_payments_callback_data_round_trips():
+    for status, prefix in (("", ""), ("-", "ab12"), ("FundsLocked", ""), ("Ожидание", "é" * 10)):
+        data = payments_callback_data(12, status, prefix)
+        assert len(data.encode("utf-8")) <= 64
+        assert parse_payments_callback(data) == (12, status, prefix)
+    longest = payments_callback_data(99999, clip_utf8("ы" * 20, 20), clip_utf8("ж" * 20, 20))
+    assert longest is not None and len(longest.encode("utf-8")) <= 64
+
+
+def test_payments_callback_data_rejects_separators_and_overflow():
+    assert payments_callback_data(1, "a:b", "") is None
+    assert payments_callback_data(1, "", "ab:") is None
+    assert payments_callback_data(1, "x" * 40, "y" * 20) is None
+    assert parse_payments_callback("pay:noop") is None
+    assert parse_payments_callback("pay:2:a:b:c") is None
+    assert parse_payments_callback("pay:x::") is None
+
+
+def test_decode_response_keeps_only_what_the_client_reads():
+    agents = json.dumps([{"agentIdentifier": "a" * 56}] * 100)
+    line = json.dumps({"jsonrpc": "2.0", "id": 7, "result": {
+        "content": [{"type": "text", "text": agents}, {"type": "text", "text": "extra"}],
+        "structuredContent": {"agents": [{"agentIdentifier": "a" * 56}] * 100}}}).encode()
+    assert decode_response(line) == {"id": 7, "result": {"content": [{"text": agents}], "isError": False}}
+    error = {"code": -32601, "message": "Method not found"}
+    assert decode_response(json.dumps({"id": 8, "error": error}).encode()) == {"id": 8, "error": error}
+    assert decode_response(b'{"method": "notifications/progress", "params": {}}') == {"id": None}
+    assert decode_response(b"server starting...\n") is None
+    assert decode_response(b"[1, 2]") is None
@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+import pytest
+
+import inline_search as inline_search_module
+from agent_index import agent_index, build_entries
+from formatting import render_agent_card, render_inline_card
+from inline_search import InlineSearch
+from ranking import AgentMatrix, AgentStats, Postings
+
+
+def _agent(i, name, capability, tags=()):
+    return {"agentIdentifier": f"agent{i:04d}", "name": name, "capability": capability, "tags": list(tags),
+            "description": "", "AgentPricing": {"pricingType": "Free"}}
+
+
+AGENTS = [
+    _agent(0, "Translator", {"name": "translation"}, ["language"]),
+    _agent(1, "Transcriber", "transcription", ["audio"]),
+    _agent(2, "Summarizer", {"name": "summaries"}, ["language", "text"]),
+    _agent(3, "Transport planner", {"name": "logistics"}, ["travel"]),
+]
+
+
+@pytest.fixture
+def matrix():
+    entries, derived = build_entries(json.dumps(AGENTS), tuple(agent_index.derivers.items()))
+    return AgentMatrix(entries, derived["ranking"], AgentStats())
+
+
+class _Ranker:
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def current(self):
+        return self.matrix
+
+
+def test_postings_prefix_positions():
+    postings = Postings([(0, ("translation", "translator")), (1, ("audio",)), (3, ("transport", "travel"))])
+    assert sorted(postings.prefix_positions("trans")) == [0, 0, 3]
+    assert list(postings.prefix_positions("transl")) == [0, 0]
+    assert list(postings.prefix_positions("translator")) == [0]
+    assert list(postings.prefix_positions("zzz")) == []
+    assert postings.with_prefix("tra") == ["translation", "translator", "transport", "travel"]
+    assert list(postings["audio"]) == [1] and "audio" in postings and "aud" not in postings
+
+
+def test_prefix_match_within_agrees_with_full_match(matrix):
+    for words in (["trans"], ["transl"], ["lang"], ["lang", "sum"], ["zzz"]):
+        full = matrix.prefix_match(words)
+        shorter = matrix.prefix_match([words[-1][:2]])
+        np.testing.assert_array_equal(matrix.prefix_match(words, within=shorter), full)
+
+
+def test_keystrokes_narrow_cached_matches(matrix, monkeypatch):
+    monkeypatch.setattr(inline_search_module, "ranker", _Ranker(matrix))
+    search = InlineSearch()
+    assert list(search.match("tra")) == [0, 1, 3]
+    calls = []
+    original = matrix.prefix_match
+    monkeypatch.setattr(matrix, "prefix_match", lambda words, within=None: calls.append(within) or original(words, within))
+    assert list(search.match("trans")) == [0, 1, 3]
+    assert list(search.match("transl")) == [0]
+    assert list(search.match("transl lang")) == [0]
+    assert [list(within) for within in calls] == [[0, 1, 3], [0, 1, 3], [0]]
+
+
+def test_cards_accept_string_capabilities():
+    agent = AGENTS[1]
+    title, summary, _ = render_inline_card(agent, render_agent_card(agent))
+    assert title == "Transcriber"
+    assert summary.startswith("transcription · ")
@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+from formatting import job_result_status
+from result_store import ResultStore
+
+
+def test_only_parsed_terminal_statuses_are_final():
+    assert job_result_status(json.dumps({"status": "completed", "result": "ok"})) == "completed"
+    assert job_result_status(json.dumps({"status": "Failed"})) == "failed"
+    assert job_result_status(json.dumps({"status": "running"})) is None
+    assert job_result_status(json.dumps({"result": "no status"})) is None
+    assert job_result_status("Job not found") is None
+    assert job_result_status("[1, 2]") is None
+
+
+def test_store_keeps_failed_status(tmp_path):
+    store = ResultStore(str(tmp_path), max_bytes=1 << 20)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        text = json.dumps({"status": "failed", "error": "boom"})
+        return job_result_status(text), text
+
+    async def scenario():
+        first, _ = await store.get_or_fetch("agent", "job", fetch)
+        again, _ = await store.get_or_fetch("agent", "job", fetch)
+        return first, again
+
+    first, again = asyncio.run(scenario())
+    assert first.status == again.status == "failed"
+    assert len(calls) == 1
+
+
+def test_store_does_not_keep_unfinished(tmp_path):
+    store = ResultStore(str(tmp_path), max_bytes=1 << 20)
+
+    async def fetch():
+        return job_result_status("Job not found"), "Job not found"
+
+    stored, text = asyncio.run(store.get_or_fetch("agent", "job", fetch))
+    assert stored is None and text == "Job not found"
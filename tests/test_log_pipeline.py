@@ -0,0 +1,53 @@
+import json
+import linecache
+import logging
+import queue
+import sys
+
+from log_pipeline import JsonFormatter, NonBlockingQueueHandler, TextFormatter
+
+
+def _prepared(msg, *args, exc_info=None):
+    # Built by hand so pytest's own log capture never formats the record first
+    record = logging.LogRecord("test_log_pipeline", logging.ERROR, __file__, 1, msg, args, exc_info)
+    return NonBlockingQueueHandler(queue.Queue()).prepare(record)
+
+
+def test_arguments_snapshotted_when_logged():
+    state = {"count": 1}
+    record = _prepared("state %s and %s", state, 3)
+    state["count"] = 2
+    assert record.args == ("{'count': 1}", 3)
+    assert record.getMessage() == "state {'count': 1} and 3"
+    assert json.loads(JsonFormatter().format(record))["msg"] == "state {'count': 1} and 3"
+
+
+def _raise_chained():
+    try:
+        try:
+            raise KeyError("inner")
+        except KeyError as e:
+            raise ValueError("boom") from e
+    except ValueError:
+        return _prepared("failed %d", 3, exc_info=sys.exc_info())
+
+
+def test_traceback_rendered_on_the_writer():
+    record = _raise_chained()
+    assert record.exc_info is None and record.exc_text is None
+    exc = json.loads(JsonFormatter().format(record))["exc"]
+    assert exc.index("KeyError: 'inner'") < exc.index("direct cause") < exc.index("ValueError: boom")
+    assert 'raise ValueError("boom") from e' in exc
+    assert "ValueError: boom" in TextFormatter().format(record)
+
+
+def test_prepare_reads_no_source(monkeypatch):
+    calls = []
+    for name in ("getline", "getlines", "updatecache", "checkcache", "lazycache"):
+        original = getattr(linecache, name)
+        monkeypatch.setattr(linecache, name,
+                            lambda *args, name=name, original=original: calls.append(name) or original(*args))
+    record = _raise_chained()
+    monkeypatch.undo()
+    assert calls == []
+    assert "ValueError: boom" in TextFormatter().format(record)
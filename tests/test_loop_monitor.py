@@ -0,0 +1,32 @@
+import asyncio
+import logging
+import time
+
+from loop_monitor import LoopMonitor
+
+
+def _render():
+    time.sleep(0.2)
+
+
+async def search_command():
+    await asyncio.sleep(0.05)
+    _render()
+
+
+def test_reports_the_blocking_handler(caplog):
+    async def scenario():
+        monitor = LoopMonitor(interval=1.0, slow_threshold=0.05)
+        monitor.start()
+        try:
+            await search_command()
+            await asyncio.sleep(0.1)
+        finally:
+            monitor.stop()
+
+    with caplog.at_level(logging.WARNING, logger="loop_monitor"):
+        asyncio.run(scenario())
+    [record] = [r for r in caplog.records if "blocked the event loop" in r.getMessage()]
+    assert record.getMessage().startswith("🐢 search_command blocked the event loop")
+    assert record.blocked_ms >= 150
+    assert record.blocked_at.endswith("in _render")
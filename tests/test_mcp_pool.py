@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from mcp_pool import HedgeBudget, MCPServerPool
+
+
+class StubClient:
+    """call_tool_direct that answers after a delay, or raises"""
+
+    def __init__(self, delay, result):
+        self.delay = delay
+        self.result = result
+        self.calls = 0
+        self.abandoned = False
+        self.server_process = None
+        self.pool = None
+        self.lease_priority = None
+
+    async def call_tool_direct(self, tool_name, arguments):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def _hedged(primary, backup, budget=None):
+    """Call through a pool that hedges after 10ms onto `backup`"""
+    async def scenario():
+        pool = MCPServerPool(size=2, hedging=True)
+        pool._hedge_delay = lambda tool_name: 0.01
+        if budget is not None:
+            pool.budget = budget
+        pool.idle.append(backup)
+        result = await pool.call_tool(primary, "list_agents", {})
+        return result, pool
+
+    return asyncio.run(scenario())
+
+
+def test_fast_backup_failure_waits_for_slow_primary():
+    primary = StubClient(0.05, '{"agents": []}')
+    backup = StubClient(0.0, "❌ Connection error: reset")
+    result, pool = _hedged(primary, backup)
+    assert result == '{"agents": []}'
+    assert (pool.hedges_sent, pool.hedges_won) == (1, 0)
+    assert backup.calls == 1
+
+
+def test_backup_success_beats_fast_primary_failure():
+    primary = StubClient(0.02, RuntimeError("server died"))
+    backup = StubClient(0.04, '{"agents": []}')
+    result, pool = _hedged(primary, backup)
+    assert result == '{"agents": []}'
+    assert pool.hedges_won == 1
+
+
+def test_both_failing_reports_the_primary_error():
+    primary = StubClient(0.03, "❌ Error: upstream 502")
+    backup = StubClient(0.0, "❌ Connection error: reset")
+    result, _ = _hedged(primary, backup)
+    assert result == "❌ Error: upstream 502"
+
+    primary = StubClient(0.03, RuntimeError("server died"))
+    with pytest.raises(RuntimeError):
+        _hedged(primary, StubClient(0.0, "❌ Connection error: reset"))
+
+
+def test_exhausted_budget_sends_no_hedge():
+    budget = HedgeBudget(ratio=0.0, burst=1.0)
+    budget.tokens = 0.0
+    primary = StubClient(0.03, '{"agents": []}')
+    backup = StubClient(0.0, '{"agents": []}')
+    result, pool = _hedged(primary, backup, budget)
+    assert result == '{"agents": []}'
+    assert pool.hedges_sent == 0 and backup.calls == 0
+
+
+def test_budget_refund_is_capped_at_burst():
+    budget = HedgeBudget(ratio=0.5, burst=2.0)
+    assert budget.spend() and budget.spend() and not budget.spend()
+    budget.earn()
+    assert budget.tokens == 0.5
+    for _ in range(3):
+        budget.refund()
+    assert budget.tokens == 2.0
+
@@ -0,0 +1,29 @@
+import pytest
+
+from mcp_recorder import MCPRecorder, read_log
+
+
+@pytest.mark.parametrize("name", ["calls.jsonl", "calls.jsonl.gz"])
+def test_entries_are_written_in_order(tmp_path, name):
+    path = str(tmp_path / name)
+    recorder = MCPRecorder(path, batch_size=4)
+    for i in range(10):
+        recorder.record({"method": "tools/call", "params": {"n": i}}, {"result": {"i": i}}, 1.0 + i, 0.01)
+    recorder.record({"method": "tools/call", "params": {}}, None, 20.0, 5.0, timed_out=True)
+    recorder.flush()
+    entries = list(read_log(path))
+    assert [e["params"].get("n") for e in entries] == list(range(10)) + [None]
+    assert entries[-1]["timeout"] is True
+
+    recorder.record({"method": "tools/call", "params": {"n": 10}}, {"error": "x"}, 30.0, 0.1)
+    recorder.close()
+    entries = list(read_log(path))
+    assert entries[-1]["error"] == "x"
+
+
+def test_record_drops_instead_of_blocking(tmp_path):
+    recorder = MCPRecorder(str(tmp_path / "calls.jsonl"), max_pending=1)
+    for i in range(1000):
+        recorder.record({"method": "m", "params": {"n": i}}, {"result": "r" * 1000}, 0.0, 0.0)
+    recorder.close()
+    assert recorder.dropped + len(list(read_log(str(tmp_path / "calls.jsonl")))) == 1000
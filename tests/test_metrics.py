@@ -0,0 +1,74 @@
+import asyncio
+
+import metrics
+from metrics import Counter, Registry, start_metrics_server
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("tool_seconds", "Tool latency", ("tool",), buckets=(1.0, 0.1))
+    for value in (0.05, 0.5, 1.0, 5.0):
+        histogram.labels("list_agents").observe(value)
+    assert registry.render().splitlines() == [
+        "# HELP tool_seconds Tool latency",
+        "# TYPE tool_seconds histogram",
+        'tool_seconds_bucket{tool="list_agents",le="0.1"} 1',
+        'tool_seconds_bucket{tool="list_agents",le="1.0"} 3',
+        'tool_seconds_bucket{tool="list_agents",le="+Inf"} 4',
+        'tool_seconds_sum{tool="list_agents"} 6.55',
+        'tool_seconds_count{tool="list_agents"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("calls_total", "Calls", ("command",)).labels('a"b\\c\nd').inc(2)
+    registry.gauge("depth", "Depth").set(3)
+    lines = registry.render().splitlines()
+    assert 'calls_total{command="a\\"b\\\\c\\nd"} 2.0' in lines
+    assert "depth 3" in lines
+
+
+def test_failing_callback_gauge_renders_no_samples():
+    registry = Registry()
+    registry.callback_gauge("pool", "Pool", ("state",), lambda: {("idle",): 2})
+    registry.callback_gauge("broken", "Broken", (), lambda: 1 / 0)
+    lines = registry.render().splitlines()
+    assert 'pool{state="idle"} 2' in lines
+    assert lines[-2:] == ["# HELP broken Broken", "# TYPE broken gauge"]
+
+
+async def _get(port: int, path: str) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def test_scrape_route(monkeypatch):
+    async def debug_route(query):
+        return 200, "text/plain", b"query=" + query
+
+    monkeypatch.setitem(metrics.routes, b"/debug/test", debug_route)
+    counter = Counter("masumi_bot_test_scrapes_total", "Test counter")
+    counter.inc()
+    monkeypatch.setitem(metrics.registry.metrics, counter.name, counter)
+
+    async def scenario():
+        server = await start_metrics_server("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return [await _get(port, path) for path in ("/metrics", "/debug/test?seconds=5", "/missing")]
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    scrape, route, missing = asyncio.run(scenario())
+    head, _, body = scrape.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 200 OK") and b"text/plain; version=0.0.4" in head
+    assert b"\nmasumi_bot_test_scrapes_total 1.0\n" in body
+    assert int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0]) == len(body)
+    assert route.endswith(b"\r\n\r\nquery=seconds=5")
+    assert missing.startswith(b"HTTP/1.1 404 Not Found")
@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import pytest
+
+import payment_ledger as ledger_module
+from payment_ledger import PaymentLedger, normalize_payment
+
+
+def _payment(i, status="Pending", amount=1_000_000, agent=None):
+    return {"id": f"pay{i:03d}", "status": status, "agentIdentifier": agent or f"agent{i % 3}",
+            "requestedFunds": [{"amount": str(amount), "unit": "lovelace"}], "createdAt": 1_700_000_000 + i}
+
+
+class FakePaymentService:
+    """query_payments over a newest-first list, paged by cursor"""
+
+    def __init__(self, payments):
+        self.payments = payments
+        self.calls = 0
+
+    async def acquire(self):
+        return self
+
+    async def release(self, client):
+        pass
+
+    async def query_payments(self, limit=10, cursor_id=None):
+        self.calls += 1
+        ordered = sorted(self.payments, key=lambda p: p["createdAt"], reverse=True)
+        start = 0
+        if cursor_id:
+            start = next(i for i, p in enumerate(ordered) if p["id"] == cursor_id) + 1
+        return json.dumps({"data": {"payments": ordered[start:start + limit]}})
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(ledger_module, "LEDGER_SYNC_PAGE", 10)
+    monkeypatch.setattr(ledger_module, "LEDGER_SYNC_MAX_PAGES", 2)
+    ledger = PaymentLedger(str(tmp_path / "ledger.sqlite3"))
+    yield ledger
+    ledger.close()
+
+
+def _on_ledger_thread(ledger, func, *args):
+    """The connection belongs to the ledger's own thread"""
+    return ledger._executor.submit(func, *args).result()
+
+
+def _query(ledger, sql):
+    return _on_ledger_thread(ledger, lambda: set(ledger._connect().execute(sql)))
+
+
+def _upsert(ledger, payments):
+    return _on_ledger_thread(ledger, ledger._upsert, [normalize_payment(p) for p in payments])
+
+
+def _totals_match_rows(ledger):
+    totals = _query(ledger, "SELECT status, count, total FROM payment_totals WHERE count > 0")
+    grouped = _query(ledger, "SELECT status, COUNT(*), SUM(amount) FROM payments GROUP BY status")
+    return totals == grouped
+
+
+def test_triggers_keep_totals_in_sync(ledger):
+    _upsert(ledger, [_payment(i, amount=i) for i in range(1, 6)])
+    assert _totals_match_rows(ledger)
+    assert _upsert(ledger, [_payment(2, status="Completed", amount=2), _payment(3, amount=30)]) == 2
+    assert _totals_match_rows(ledger)
+
+    def delete():
+        with ledger._connect() as conn:
+            conn.execute("DELETE FROM payments WHERE id = 'pay004'")
+    _on_ledger_thread(ledger, delete)
+    assert _totals_match_rows(ledger)
+    # Unchanged payments are not rewritten
+    assert _upsert(ledger, [_payment(1, amount=1)]) == 0
+
+
+def test_sync_backfills_across_rounds_then_stops_at_known_payments(ledger):
+    service = FakePaymentService([_payment(i) for i in range(25)])
+
+    async def scenario():
+        first = await ledger.sync(service)
+        second = await ledger.sync(service)
+        service.payments.append(_payment(25))
+        calls = service.calls
+        third = await ledger.sync(service)
+        return first, second, third, service.calls - calls, await ledger.count()
+
+    first, second, third, head_calls, count = asyncio.run(scenario())
+    assert (first, second, third) == (20, 5, 1)
+    assert head_calls == 1
+    assert count == 26
+
+
+def test_rescan_picks_up_status_changes(ledger, monkeypatch):
+    service = FakePaymentService([_payment(i) for i in range(15)])
+
+    async def scenario():
+        await ledger.sync(service)
+        service.payments[0] = _payment(0, status="Completed")
+        before = await ledger.sync(service)
+        monkeypatch.setattr(ledger_module, "LEDGER_RESCAN_INTERVAL", 0)
+        after = await ledger.sync(service)
+        return before, after, await ledger.page(status="completed")
+
+    before, after, page = asyncio.run(scenario())
+    assert (before, after) == (0, 1)
+    assert [p["id"] for p in page["payments"]] == ["pay000"] and page["matched"] == 1
+    assert _totals_match_rows(ledger)
+
+
+def test_page_filters_by_agent_prefix(ledger):
+    _upsert(ledger, [_payment(i) for i in range(9)])
+    page = asyncio.run(ledger.page(agent_prefix="agent1", limit=2))
+    assert page["matched"] == 3
+    assert [p["id"] for p in page["payments"]] == ["pay007", "pay004"]
+
+
+def test_statuses_lists_every_status_seen(ledger):
+    _upsert(ledger, [_payment(1), _payment(2, status="Funds:Locked")])
+    assert sorted(asyncio.run(ledger.statuses())) == ["Funds:Locked", "Pending"]
@@ -0,0 +1,37 @@
+import asyncio
+import sys
+import time
+
+import masumi_client as masumi_client_module
+from masumi_client import MasumiMCPClient
+from procstats import child_pids, open_fds, rss_bytes, zombie_children
+
+# A server that ignores SIGTERM, as a wedged one would
+STUBBORN_SERVER = "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print('up', flush=True); time.sleep(60)"
+
+
+def test_stop_server_kills_a_server_that_ignores_sigterm(monkeypatch):
+    monkeypatch.setattr(masumi_client_module, "MCP_STOP_TIMEOUT", 0.2)
+
+    async def scenario():
+        fds_before = open_fds()
+        client = MasumiMCPClient()
+        client.server_process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", STUBBORN_SERVER,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+        process = client.server_process
+        await process.stdout.readline()
+        running = process.pid in child_pids() and rss_bytes(process.pid) > 0
+        started = time.monotonic()
+        await client.stop_server()
+        elapsed = time.monotonic() - started
+        # Let the transport close its pipes
+        await asyncio.sleep(0.05)
+        return process, running, elapsed, fds_before, open_fds()
+
+    process, running, elapsed, fds_before, fds_after = asyncio.run(scenario())
+    assert running
+    assert process.returncode == -9
+    assert elapsed < 2.0
+    assert process.pid not in child_pids() and zombie_children() == 0
+    assert fds_after <= fds_before
@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from profiler import SamplingProfiler
+
+
+def _burn(seconds: float):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+async def search_command():
+    for _ in range(30):
+        _burn(0.01)
+        await asyncio.sleep(0)
+
+
+def _stacks(data: bytes):
+    return {line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1]) for line in data.decode().splitlines()}
+
+
+def test_samples_are_rooted_at_the_running_task():
+    async def scenario():
+        profiler = SamplingProfiler(interval=0.002)
+        work = asyncio.create_task(search_command(), name="update.search_agents")
+        data = await profiler.profile(0.2)
+        await work
+        return data
+
+    stacks = _stacks(asyncio.run(scenario()))
+    busy = {stack: n for stack, n in stacks.items() if stack.startswith("update.search_agents;")}
+    assert busy and all(n > 0 for n in stacks.values())
+    assert all("search_command (test_profiler.py:" in stack for stack in busy)
+    assert any(stack.endswith(f"_burn (test_profiler.py:{_burn.__code__.co_firstlineno})") for stack in busy)
+    # Other tasks are named by their coroutine; an idle loop by itself
+    assert {stack.split(";")[0] for stack in stacks} <= {"update.search_agents", "(event loop)", scenario.__qualname__}
+
+
+def test_one_profile_at_a_time():
+    async def scenario():
+        profiler = SamplingProfiler(interval=0.01)
+        first = asyncio.create_task(profiler.profile(0.2))
+        await asyncio.sleep(0.02)
+        busy = await profiler.http_route(b"seconds=1")
+        await first
+        bad = await profiler.http_route(b"seconds=soon")
+        return busy, bad, profiler.running
+
+    busy, bad, running = asyncio.run(scenario())
+    assert busy == (409, "text/plain", b"A profile is already running\n")
+    assert bad[0] == 400
+    assert not running
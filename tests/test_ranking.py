@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+
+import ranking as ranking_module
+from agent_index import agent_index, build_entries
+from ranking import AgentMatrix, AgentStats, Postings, _normalize
+
+
+def _agent(i, name, capability, tags=(), description="", price=None):
+    agent = {"agentIdentifier": f"agent{i:04d}", "name": name, "capability": capability, "tags": list(tags),
+             "description": description, "AgentPricing": {"pricingType": "Free"}}
+    if price is not None:
+        agent["agentPricing"] = {"fixedPricing": [{"amount": str(price), "unit": "lovelace"}]}
+    return agent
+
+
+AGENTS = [
+    _agent(0, "Translator", {"name": "translation"}, ["language"], "translates and transcribes, transports too"),
+    _agent(1, "Transcriber", "transcription", ["audio"]),
+    _agent(2, "Summarizer", {"name": "summaries"}, ["language", "text"]),
+    _agent(3, "Polyglot", "chat", description="a translator"),
+]
+
+
+def _matrix(agents, stats=None):
+    entries, derived = build_entries(json.dumps(agents), tuple(agent_index.derivers.items()))
+    return AgentMatrix(entries, derived["ranking"], stats or AgentStats())
+
+
+@pytest.fixture
+def match_only(monkeypatch):
+    """Scores reduced to the match fraction alone"""
+    monkeypatch.setattr(ranking_module, "RANK_WEIGHT_MATCH", 1.0)
+    for name in ("RANK_WEIGHT_PRICE", "RANK_WEIGHT_SUCCESS", "RANK_WEIGHT_LATENCY"):
+        monkeypatch.setattr(ranking_module, name, 0.0)
+
+
+def _scores(matrix, query):
+    return {agent["agentIdentifier"]: score for agent, score in matrix.rank(query, 10)}
+
+
+def test_expansions_count_once_per_word(match_only):
+    # "trans" expands to translation, translator, transcription, transports...; agent0 has several
+    scores = _scores(_matrix(AGENTS), "trans")
+    assert max(scores.values()) <= 1.0
+    assert scores["agent0000"] == pytest.approx(1.0)
+    assert scores["agent0003"] == pytest.approx(1 / 3)
+
+
+def test_match_score_sums_over_words(match_only):
+    scores = _scores(_matrix(AGENTS), "please translate language text")
+    # agent2 has "language" and "text" as topics; agent0 has "language" as a topic
+    # and "translate" only as the prefix of a description word
+    assert scores["agent0002"] == pytest.approx(2 / 3)
+    assert scores["agent0000"] == pytest.approx(4 / 9)
+    assert all(0 < score <= 1 for score in scores.values())
+
+
+def test_rank_orders_by_score_and_breaks_ties_by_position():
+    stats = AgentStats()
+    stats.record("agent0001", ok=True, latency=1.0)
+    agents = [_agent(0, "Scribe", "notes", price=5_000_000), _agent(1, "Scribe", "notes", price=1_000_000),
+              _agent(2, "Scribe", "notes", price=1_000_000), _agent(3, "Painter", "images")]
+    ranked = _matrix(agents, stats).rank("scribe", 10)
+    assert [agent["agentIdentifier"] for agent, _ in ranked] == ["agent0001", "agent0002", "agent0000"]
+    scores = [score for _, score in ranked]
+    assert scores == sorted(scores, reverse=True) and all(0 < score <= 1 for score in scores)
+    assert _matrix(agents).rank("scribe", 1)[0][0]["agentIdentifier"] == "agent0001"
+    assert _matrix(agents).rank("zebra", 10) == []
+
+
+def test_postings_survive_pickling():
+    postings = Postings([(2, {"beta", "alpha"}), (0, {"alpha"}), (5, {"alphabet"})])
+    assert postings.vocabulary == ["alpha", "alphabet", "beta"]
+    assert list(postings["alpha"]) == [2, 0] and list(postings["beta"]) == [2]
+    restored = Postings.__new__(Postings)
+    restored.__setstate__(postings.__getstate__())
+    assert sorted(restored.prefix_positions("alpha")) == [0, 2, 5]
+    assert restored.with_prefix("alphab") == ["alphabet"]
+
+
+def test_normalize():
+    np.testing.assert_allclose(_normalize(np.array([2.0, 4.0, np.nan, 3.0])), [0.0, 1.0, 0.5, 0.5])
+    np.testing.assert_allclose(_normalize(np.array([7.0, 7.0])), [0.5, 0.5])
+    np.testing.assert_allclose(_normalize(np.array([np.nan, np.nan])), [0.5, 0.5])
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from masumi_client import MasumiMCPClient
+from mcp_pool import MCPServerPool
+from request_context import (BACKGROUND, INTERACTIVE, DeadlineExceeded, bounded_timeout, check_deadline,
+                             current_priority, current_request, request_scope)
+
+
+class SilentServer:
+    """A server process stand-in that takes requests and never answers"""
+
+    returncode = None
+
+    def __init__(self):
+        self.stdin = self
+        self.stdout = self
+        self.sent = []
+
+    def write(self, data):
+        self.sent.append(json.loads(data))
+
+    async def drain(self):
+        pass
+
+    async def readline(self):
+        await asyncio.Event().wait()
+
+
+def _client():
+    client = MasumiMCPClient()
+    client.server_process = SilentServer()
+    return client
+
+
+def _request(request_id=5):
+    return {"jsonrpc": "2.0", "id": request_id, "method": "tools/call", "params": {"name": "list_agents"}}
+
+
+def test_timeout_is_clamped_to_the_remaining_deadline():
+    assert bounded_timeout(10.0) == 10.0
+    with request_scope("test", 1.0):
+        assert 0.9 < bounded_timeout(10.0) <= 1.0
+        assert bounded_timeout(0.5) == 0.5
+
+    async def scenario():
+        client = _client()
+        started = time.monotonic()
+        with request_scope("test", 0.05):
+            with pytest.raises(DeadlineExceeded):
+                await client._exchange(_request(), timeout=10.0)
+        return client, time.monotonic() - started
+
+    client, elapsed = asyncio.run(scenario())
+    # Gave up at the request deadline, not the 10s tool timeout
+    assert elapsed < 1.0
+    assert client.abandoned
+    assert client.server_process.sent[-1] == {"jsonrpc": "2.0", "method": "notifications/cancelled",
+                                              "params": {"requestId": 5, "reason": "timeout"}}
+
+
+def test_tool_timeout_within_the_deadline_is_not_a_deadline_error():
+    async def scenario():
+        with request_scope("test", 10.0):
+            return await _client()._exchange(_request(), timeout=0.05)
+
+    assert asyncio.run(scenario()) == {"error": "Request timeout"}
+
+
+def test_passed_deadline_raises_before_sending():
+    async def scenario():
+        client = _client()
+        with request_scope("test", 0.0):
+            with pytest.raises(DeadlineExceeded):
+                check_deadline()
+            with pytest.raises(DeadlineExceeded):
+                await client._exchange(_request(), timeout=10.0)
+        return client
+
+    assert asyncio.run(scenario()).server_process.sent == []
+
+
+def test_cancelled_request_notifies_the_server():
+    async def scenario():
+        client = _client()
+        task = asyncio.create_task(client._exchange(_request(9), timeout=10.0))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return client
+
+    client = asyncio.run(scenario())
+    assert client.abandoned
+    assert client.server_process.sent[-1]["method"] == "notifications/cancelled"
+    assert client.server_process.sent[-1]["params"] == {"requestId": 9, "reason": "cancelled"}
+
+
+def test_scope_follows_tasks_started_inside_it():
+    async def scenario():
+        with request_scope("status_command", 5.0, priority=BACKGROUND) as ctx:
+            inherited = await asyncio.create_task(asyncio.sleep(0, current_request.get()))
+            priority = await asyncio.create_task(asyncio.sleep(0, current_priority()))
+        return ctx, inherited, priority, current_request.get(), current_priority()
+
+    ctx, inherited, priority, after, priority_after = asyncio.run(scenario())
+    assert inherited is ctx and priority == BACKGROUND
+    assert after is None and priority_after == INTERACTIVE
+
+
+def test_handler_deadline_reaches_the_tool_call():
+    async def scenario():
+        client = _client()
+        started = time.monotonic()
+        with request_scope("status_command", 0.05):
+            result = await client.call_tool_direct("get_agent_input_schema",
+                                                   {"agent_identifier": "a", "api_base_url": "https://x"})
+        return client, result, time.monotonic() - started
+
+    client, result, elapsed = asyncio.run(scenario())
+    assert result == "❌ Error: Request deadline exceeded"
+    assert elapsed < 1.0
+    assert client.server_process.sent[-1]["method"] == "notifications/cancelled"
+
+
+def test_waiting_for_a_server_stops_at_the_deadline():
+    async def scenario():
+        pool = MCPServerPool(size=1)
+        assert pool.scheduler.try_acquire(INTERACTIVE)
+        started = time.monotonic()
+        with request_scope("status_command", 0.05):
+            with pytest.raises(DeadlineExceeded):
+                await pool.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 1.0
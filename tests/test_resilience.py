@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+import resilience as resilience_module
+from masumi_client import MasumiMCPClient, TIMEOUT_ERROR
+from metrics import percentile
+from resilience import CircuitBreaker, LatencyTracker, ResilienceRegistry, ERROR, FAILURE, OK
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker("b", failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_breaker_half_open_lets_one_probe(clock):
+    breaker = CircuitBreaker("b", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow_request()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("b", failure_threshold=5, reset_timeout=10)
+    for _ in range(5):
+        breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_answered_errors_never_open_breakers(clock):
+    registry = ResilienceRegistry()
+    for _ in range(50):
+        assert registry.open_breaker("query_registry", "registry") is None
+        registry.record("query_registry", "registry", 0.1, ERROR)
+    assert registry.open_breaker("query_registry", "registry") is None
+
+
+def test_write_failures_do_not_block_reads(clock):
+    registry = ResilienceRegistry()
+    for _ in range(20):
+        registry.record("register_agent", resilience_module.upstream_for("register_agent", {}), 0.1, FAILURE)
+    assert registry.open_breaker("register_agent", "registry_write") is not None
+    assert registry.open_breaker("list_agents", resilience_module.upstream_for("list_agents", {})) is None
+
+
+def test_neutral_outcome_frees_half_open_probe(clock):
+    registry = ResilienceRegistry()
+    for _ in range(5):
+        registry.record("list_agents", "registry", 0.1, FAILURE)
+    clock[0] += 60
+    assert registry.open_breaker("list_agents", "registry") is None
+    registry.record("list_agents", "registry", 0.1, ERROR)
+    assert registry.open_breaker("list_agents", "registry") is None
+
+
+def test_last_good_is_bounded():
+    registry = ResilienceRegistry(max_fallbacks=3)
+    for i in range(5):
+        registry.remember("query_registry", str(i), f"result {i}")
+    registry.fallback("query_registry", "2")
+    registry.remember("query_registry", "5", "result 5")
+    assert len(registry.last_good) == 3
+    assert registry.fallback("query_registry", "2") == "result 2"
+    assert registry.fallback("query_registry", "0") is None
+
+
+@pytest.mark.parametrize("response, outcome", [
+    ({"result": {"content": [{"text": "[]"}]}}, OK),
+    ({"result": {"content": [{"text": "Error: name already taken"}]}}, ERROR),
+    ({"result": {"isError": True, "content": [{"text": "bad input"}]}}, ERROR),
+    ({"error": {"code": -32602, "message": "Invalid params"}}, ERROR),
+    ({"error": TIMEOUT_ERROR}, FAILURE),
+    (None, FAILURE),
+    ({"result": {}}, FAILURE),
+])
+def test_call_outcomes(response, outcome):
+    client = MasumiMCPClient()
+
+    async def send(request, timeout=None):
+        return response
+
+    client._send_request = send
+    assert asyncio.run(client._call_tool("list_agents", {}, 1.0))[0] == outcome
+
+
+def test_percentile_nearest_rank():
+    assert percentile([], 95) == 0.0
+    assert percentile([3.0, 1.0, 2.0], 50) == 2.0
+    assert percentile(range(101), 99) == 99
+    tracker = LatencyTracker(window=3)
+    assert tracker.percentile(50) is None
+    for seconds in (5.0, 1.0, 2.0, 3.0):
+        tracker.record(seconds)
+    assert tracker.percentile(100) == 3.0
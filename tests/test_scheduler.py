@@ -0,0 +1,75 @@
+import asyncio
+
+from request_context import BACKGROUND, INTERACTIVE, NOTIFICATION
+from scheduler import PriorityScheduler
+
+WEIGHTS = {INTERACTIVE: 8.0, NOTIFICATION: 3.0, BACKGROUND: 1.0}
+
+
+def test_waiters_are_granted_in_finish_tag_order():
+    async def scenario():
+        scheduler = PriorityScheduler(1, WEIGHTS, reserved=0)
+        assert scheduler.try_acquire(INTERACTIVE)
+        granted = []
+
+        async def waiter(priority, name):
+            await scheduler.acquire(priority)
+            granted.append(name)
+
+        tasks = [asyncio.create_task(waiter(NOTIFICATION, f"N{i}")) for i in range(1, 4)]
+        tasks += [asyncio.create_task(waiter(INTERACTIVE, f"I{i}")) for i in range(1, 9)]
+        await asyncio.sleep(0)
+        for _ in tasks:
+            scheduler.release(INTERACTIVE if not granted or granted[-1][0] == "I" else NOTIFICATION)
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return granted
+
+    # Interactive (weight 8) gets ~8 grants for every 3 notifications; equal tags go to the earlier waiter
+    assert asyncio.run(scenario()) == ["I1", "I2", "N1", "I3", "I4", "I5", "N2", "I6", "I7", "N3", "I8"]
+
+
+def test_background_never_takes_the_reserve():
+    scheduler = PriorityScheduler(3, WEIGHTS, reserved=1)
+    assert scheduler.try_acquire(BACKGROUND)
+    assert scheduler.try_acquire(BACKGROUND)
+    assert not scheduler.try_acquire(BACKGROUND)
+    assert scheduler.try_acquire(INTERACTIVE)
+    assert not scheduler.try_acquire(INTERACTIVE)
+
+
+def test_reserve_leaves_a_single_slot_usable():
+    scheduler = PriorityScheduler(1, WEIGHTS, reserved=1)
+    assert scheduler.reserved == 0
+    assert scheduler.try_acquire(BACKGROUND)
+
+
+def test_background_waits_behind_queued_interactive():
+    async def scenario():
+        scheduler = PriorityScheduler(2, WEIGHTS, reserved=0)
+        assert scheduler.try_acquire(INTERACTIVE) and scheduler.try_acquire(INTERACTIVE)
+        order = []
+
+        async def waiter(priority):
+            await scheduler.acquire(priority)
+            order.append(priority)
+
+        background = asyncio.create_task(waiter(BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(waiter(INTERACTIVE))
+        await asyncio.sleep(0)
+        scheduler.release(INTERACTIVE)
+        await asyncio.sleep(0)
+        assert order == [INTERACTIVE]
+        scheduler.release(INTERACTIVE)
+        await asyncio.wait_for(asyncio.gather(background, interactive), 1)
+        return order
+
+    assert asyncio.run(scenario()) == [INTERACTIVE, BACKGROUND]
+
+
+def test_background_pauses_while_interactive_wait_is_high():
+    scheduler = PriorityScheduler(4, WEIGHTS, reserved=0, target=0.5)
+    scheduler._record_wait(10.0)
+    assert not scheduler.try_acquire(BACKGROUND)
+    assert scheduler.try_acquire(NOTIFICATION)
@@ -0,0 +1,82 @@
+import json
+
+import schema_cache as schema_cache_module
+from schema_cache import SchemaCache, compile_schema
+
+MIP003 = {"input_data": [
+    {"id": "text", "type": "string", "validations": [{"validation": "min", "value": "3"}]},
+    {"id": "email", "type": "email"},
+    {"id": "count", "type": "number", "validations": [{"validation": "max", "value": "10"},
+                                                     {"validation": "optional", "value": "true"}]},
+    {"id": "style", "type": "option", "data": {"values": ["short", "long"]}},
+]}
+
+JSON_SCHEMA = {
+    "type": "object",
+    "required": ["url"],
+    "properties": {
+        "url": {"type": "string", "format": "uri"},
+        "lang": {"type": "string", "enum": ["en", "de"]},
+        "code": {"type": "string", "pattern": "^[A-Z]{3}$"},
+        "items": {"type": "array", "maxItems": 2},
+    },
+}
+
+
+def test_mip003_accepts_valid_input():
+    validate = compile_schema(MIP003)
+    assert validate({"text": "hello", "email": "a@b.io", "style": 1}) == []
+    assert validate({"text": "hello", "email": "a@b.io", "style": "long", "count": 10}) == []
+
+
+def test_mip003_reports_each_field_once():
+    validate = compile_schema(MIP003)
+    errors = validate({"text": "hi", "email": "nope", "count": 11, "style": "medium"})
+    assert errors == [
+        "text: needs at least 3 characters",
+        "email: must be an email address",
+        "count: must be at most 10",
+        "style: must be one of: short, long",
+    ]
+    assert validate({"email": "a@b.io", "style": 0}) == ["text: is required"]
+    assert validate({"text": 5, "email": "a@b.io", "style": 0}) == ["text: must be a string"]
+
+
+def test_json_schema():
+    validate = compile_schema(JSON_SCHEMA)
+    assert validate({"url": "https://example.com", "lang": "en", "code": "ABC", "items": [1]}) == []
+    assert validate({"lang": "fr", "code": "abc", "items": [1, 2, 3]}) == [
+        "url: is required",
+        "lang: must be one of: en, de",
+        "code: must match ^[A-Z]{3}$",
+        "items: allows at most 2 selections",
+    ]
+    assert validate([]) == ["input must be a JSON object"]
+
+
+def test_unknown_shapes_are_not_checked():
+    assert compile_schema({"fields": []}) is None
+    assert compile_schema("text") is None
+    cache = SchemaCache()
+    assert cache.put("agent", "https://a", "not json").validate is None
+
+
+def test_cache_lru_and_invalidation():
+    cache = SchemaCache(max_entries=2, ttl=60)
+    for agent in ("a", "b"):
+        cache.put(agent, "https://x", json.dumps(MIP003))
+    assert cache.get("a", "https://x") is not None
+    cache.put("c", "https://x", json.dumps(MIP003))
+    assert cache.get("b", "https://x") is None
+    assert cache.invalidate(agent_id="a") == 1
+    assert list(cache.entries) == [("c", "https://x")]
+
+
+def test_cache_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(schema_cache_module.time, "monotonic", lambda: now[0])
+    cache = SchemaCache(ttl=10)
+    cache.put("a", "https://x", json.dumps(MIP003))
+    now[0] += 10
+    assert cache.get("a", "https://x") is None
+    assert not cache.entries
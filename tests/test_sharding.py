@@ -0,0 +1,30 @@
+from collections import Counter
+
+from sharding import HashRing
+
+CHATS = range(-5000, 5000)
+
+
+def test_routing_is_stable():
+    ring, again = HashRing(4), HashRing(4)
+    assert [ring.node_for(chat) for chat in CHATS] == [again.node_for(chat) for chat in CHATS]
+    assert {ring.node_for(chat) for chat in CHATS} == {0, 1, 2, 3}
+
+
+def test_chats_spread_evenly():
+    ring = HashRing(4)
+    counts = Counter(ring.node_for(chat) for chat in CHATS)
+    assert min(counts.values()) > len(CHATS) / 4 * 0.75
+
+
+def test_adding_a_worker_moves_only_its_share():
+    before, after = HashRing(4), HashRing(5)
+    moved = [chat for chat in CHATS if before.node_for(chat) != after.node_for(chat)]
+    # Only chats taken over by the new worker move, about 1/5 of them
+    assert all(after.node_for(chat) == 4 for chat in moved)
+    assert len(moved) < len(CHATS) * 0.3
+
+
+def test_single_worker_takes_everything():
+    for ring in (HashRing(1), HashRing(0)):
+        assert {ring.node_for(chat) for chat in CHATS} == {0}
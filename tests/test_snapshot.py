@@ -0,0 +1,59 @@
+import json
+import pickle
+
+import numpy as np
+
+from agent_index import agent_index, build_entries
+from fake_mcp_server import make_agent
+from ranking import Postings
+from snapshot import _MAGIC, read_snapshot, write_snapshot
+
+
+def _state():
+    result = json.dumps([make_agent(i) for i in range(200)])
+    entries, derived = build_entries(result, tuple(agent_index.derivers.items()))
+    return {"saved_at": 1.0, "index": {"entries": entries, "updated_at": 2.0, "derived": derived},
+            "status": {"ok": True}, "schemas": [("a", "u", "{}", 5.0)], "agent_stats": {"a": [1, 1, 0.5]}}
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    state = _state()
+    write_snapshot(path, state)
+    loaded = read_snapshot(path)
+
+    index = loaded["index"]
+    assert [agent for agent, _, _ in index["entries"]] == [agent for agent, _, _ in state["index"]["entries"]]
+    assert index["derived"]["cards"] == state["index"]["derived"]["cards"]
+    ranking, original = index["derived"]["ranking"], state["index"]["derived"]["ranking"]
+    np.testing.assert_array_equal(ranking["price"], original["price"])
+    assert isinstance(ranking["terms"], Postings)
+    for word in ("trans", "agent", "zzz"):
+        np.testing.assert_array_equal(ranking["terms"].prefix_positions(word),
+                                      original["terms"].prefix_positions(word))
+    assert loaded["schemas"] == [["a", "u", "{}", 5.0]]
+    assert loaded["agent_stats"] == {"a": [1, 1, 0.5]}
+
+
+def test_never_unpickles(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    path.write_bytes(_MAGIC + pickle.dumps({"index": {}}))
+    assert read_snapshot(str(path)) is None
+
+
+def test_ignores_other_versions_and_garbage(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    assert read_snapshot(str(path)) is None
+    path.write_bytes(b"")
+    assert read_snapshot(str(path)) is None
+    path.write_bytes(b"MASUMI-SNAPSHOT\x02" + b"\0" * 64)
+    assert read_snapshot(str(path)) is None
+    path.write_bytes(_MAGIC + b"\xff" * 64)
+    assert read_snapshot(str(path)) is None
+
+
+def test_empty_arrays(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    write_snapshot(path, {"a": np.array([], dtype=np.int32), "b": np.arange(3)})
+    loaded = read_snapshot(path)
+    assert loaded["a"].size == 0 and list(loaded["b"]) == [0, 1, 2]
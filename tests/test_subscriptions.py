@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+from agent_index import AgentIndex, RegistryDiff, extract_agents
+from formatting import render_registry_changes
+from subscriptions import SubscriptionStore
+
+
+def _agent(i, capability, tags=(), description="", name=None):
+    return {"agentIdentifier": f"agent{i:04d}", "name": name or f"Agent {i}", "capability": {"name": capability},
+            "tags": list(tags), "description": description}
+
+
+def _replace(index, agents, updated_at):
+    return index.replace(extract_agents(json.dumps(agents)), updated_at)
+
+
+def test_diff_compares_content_hashes():
+    index = AgentIndex()
+    assert _replace(index, [_agent(0, "translation"), _agent(1, "summaries")], 1.0) is None
+    assert not _replace(index, [_agent(0, "translation"), _agent(1, "summaries")], 2.0)
+
+    diff = _replace(index, [_agent(0, "translation", description="now faster"), _agent(2, "audio")], 3.0)
+    assert [a["agentIdentifier"] for a in diff.added] == ["agent0002"]
+    assert [a["agentIdentifier"] for a in diff.removed] == ["agent0001"]
+    assert [a["agentIdentifier"] for a in diff.changed] == ["agent0000"]
+    assert repr(diff) == "RegistryDiff(+1 -1 ~1)"
+
+
+def test_match_lists_each_agent_once_per_chat(tmp_path):
+    async def scenario():
+        store = SubscriptionStore(str(tmp_path / "subscriptions.json"))
+        store.subscribe(1, "translation")
+        store.subscribe(1, "language")
+        store.subscribe(2, "audio")
+        diff = RegistryDiff(added=[_agent(0, "translation", ["language"])], removed=[_agent(1, "audio")], changed=[])
+        matches = store.match(diff)
+
+        assert store.unsubscribe(1, "language") == 1
+        assert store.unsubscribe(1, "language") == 0
+        assert "language" not in store.by_topic
+        assert store.unsubscribe(2) == 1
+        after = store.match(diff)
+        await store._save_task
+        return matches, after
+
+    matches, after = asyncio.run(scenario())
+    topics, changes = matches[1]
+    assert topics == {"translation", "language"}
+    assert [a["agentIdentifier"] for a in changes["added"]] == ["agent0000"]
+    assert [a["agentIdentifier"] for a in matches[2][1]["removed"]] == ["agent0001"]
+    assert list(after) == [1] and after[1][0] == {"translation"}
+    assert json.loads((tmp_path / "subscriptions.json").read_text()) == {"1": ["translation"]}
+
+
+def test_registry_changes_escape_names_and_topics():
+    agent = _agent(0, "text_to_speech", name="*Best* [bot]")
+    text = render_registry_changes(["text_to_speech"], {"added": [agent]})
+    assert "for* text\\_to\\_speech\n" in text
+    assert "• \\*Best\\* \\[bot] · text\\_to\\_speech\n  `agent0000`" in text
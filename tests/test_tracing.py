@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import pytest
+
+import tracing
+from masumi_client import MasumiMCPClient
+from tracing import SpanExporter, span, start_trace
+
+
+class EchoServer:
+    """A server process stand-in answering every request with an empty result"""
+
+    returncode = None
+
+    def __init__(self):
+        self.stdin = self
+        self.stdout = self
+        self.sent = []
+
+    def write(self, data):
+        self.sent.append(json.loads(data))
+
+    async def drain(self):
+        pass
+
+    async def readline(self):
+        return json.dumps({"jsonrpc": "2.0", "id": self.sent[-1]["id"], "result": {}}).encode() + b"\n"
+
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    """Sample every trace; finished spans stay in exporter.buffer"""
+    exporter = SpanExporter(path=str(tmp_path / "spans.jsonl"), interval=3600)
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 1.0)
+    yield exporter
+    exporter.buffer.clear()
+
+
+def test_child_spans_link_to_their_parent(exporter):
+    async def scenario():
+        with start_trace("update", command="status") as root:
+            with span("get_mcp_client"):
+                with span("start_server"):
+                    pass
+            with pytest.raises(KeyError):
+                with span("parse"):
+                    raise KeyError("x")
+        return root
+
+    root = asyncio.run(scenario())
+    spans = {s.name: s for s in exporter.buffer}
+    assert list(spans) == ["start_server", "get_mcp_client", "parse", "update"]
+    assert root.parent_id is None and len(root.trace_id) == 32
+    assert spans["get_mcp_client"].parent_id == root.span_id
+    assert spans["start_server"].parent_id == spans["get_mcp_client"].span_id
+    assert {s.trace_id for s in spans.values()} == {root.trace_id}
+    assert len({s.span_id for s in spans.values()}) == 4
+    assert spans["parse"].status == "error" and spans["parse"].attributes["error"] == "KeyError"
+    assert root.traceparent == f"00-{root.trace_id}-{root.span_id}-01"
+
+
+def test_unsampled_trace_records_nothing(exporter, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0.0)
+    with start_trace("update") as root:
+        with span("child") as child:
+            assert root is None and child is None
+    assert exporter.buffer == []
+
+
+def _send(client):
+    return client._send_request({"jsonrpc": "2.0", "id": 3, "method": "tools/call",
+                                 "params": {"name": "list_agents", "arguments": {}}})
+
+
+def test_traceparent_is_propagated_in_meta(exporter):
+    async def scenario():
+        client = MasumiMCPClient()
+        client.server_process = EchoServer()
+        with start_trace("update") as root:
+            await _send(client)
+        return client.server_process.sent, root
+
+    [request], root = asyncio.run(scenario())
+    [request_span] = [s for s in exporter.buffer if s.name == "mcp.tools/call"]
+    assert request_span.parent_id == root.span_id
+    assert request["params"]["_meta"] == {"traceparent": f"00-{root.trace_id}-{request_span.span_id}-01"}
+
+
+def test_no_meta_without_a_sampled_trace(exporter, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0.0)
+
+    async def scenario():
+        client = MasumiMCPClient()
+        client.server_process = EchoServer()
+        with start_trace("update"):
+            await _send(client)
+        return client.server_process.sent
+
+    [request] = asyncio.run(scenario())
+    assert "_meta" not in request["params"]
@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from update_order import ChatOrderedUpdateProcessor
+
+
+def message(update_id, text, chat_id=1, user_id=10):
+    msg = Message(update_id, datetime.now(), Chat(chat_id, Chat.GROUP), from_user=User(user_id, "u", False), text=text)
+    return Update(update_id, message=msg)
+
+
+def run(updates, interrupt=None):
+    """Feed updates through the processor as PTB would; return the handling order"""
+    log = []
+
+    async def handle(update):
+        log.append(("start", update.update_id))
+        await asyncio.sleep(0.01)
+        log.append(("end", update.update_id))
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(16, interrupt=interrupt)
+        tasks = []
+        for update in updates:
+            tasks.append(asyncio.create_task(processor.process_update(update, handle(update))))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    return log
+
+
+def test_same_user_runs_in_order():
+    log = run([message(1, "hello"), message(2, "again"), message(3, "more")])
+    assert log == [("start", 1), ("end", 1), ("start", 2), ("end", 2), ("start", 3), ("end", 3)]
+
+
+def test_other_chats_and_users_run_concurrently():
+    log = run([message(1, "a"), message(2, "b", chat_id=2), message(3, "c", user_id=11)])
+    assert [event for event, _ in log[:3]] == ["start"] * 3
+
+
+def test_cancel_skips_the_line():
+    log = run([message(1, "hello"), message(2, "/cancel@bot")])
+    assert log[:2] == [("start", 1), ("start", 2)]
+
+
+def test_command_interrupts_running_update():
+    interrupted = []
+    log = run([message(1, "/search x"), message(2, "/list")], interrupt=interrupted.append)
+    assert interrupted == [(1, 10)]
+    assert log.index(("end", 1)) < log.index(("start", 2))
+
+
+def test_plain_text_does_not_interrupt():
+    interrupted = []
+    run([message(1, "/search x"), message(2, "hi")], interrupt=interrupted.append)
+    assert interrupted == []
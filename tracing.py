@@ -0,0 +1,186 @@
+import asyncio
+import atexit
+import functools
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+from config import TRACE_SAMPLE_RATE, TRACE_EXPORT_PATH, TRACE_OTLP_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """One timed operation in a trace"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time_ns()
+        self.end = 0
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header value for propagation"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start,
+            "end_ns": self.end,
+            "duration_ms": (self.end - self.start) / 1e6,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class SpanExporter:
+    """Buffers finished spans and writes them out in batches off the hot path"""
+
+    def __init__(self, path: str = TRACE_EXPORT_PATH, endpoint: str = TRACE_OTLP_ENDPOINT,
+                 batch_size: int = 256, interval: float = 2.0):
+        self.path = path
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer: List[Span] = []
+        self._task: Optional[asyncio.Task] = None
+        # Spans still buffered at exit would otherwise be lost
+        atexit.register(lambda: self._write_file(self._take()))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or self.endpoint)
+
+    def add(self, span: Span):
+        self.buffer.append(span)
+        if self._task is None:
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                # No loop (e.g. a sync script): flush inline
+                self._write_file(self._take())
+
+    def _take(self) -> List[Span]:
+        spans, self.buffer = self.buffer, []
+        return spans
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.buffer:
+                await self.flush()
+
+    async def flush(self):
+        spans = self._take()
+        if not spans:
+            return
+        try:
+            if self.path:
+                await asyncio.to_thread(self._write_file, spans)
+            if self.endpoint:
+                await self._post_otlp(spans)
+        except Exception as e:
+            logger.warning(f"Dropped {len(spans)} spans: {e}")
+
+    def _write_file(self, spans: List[Span]):
+        if not self.path or not spans:
+            return
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(span.to_dict()) + "\n" for span in spans))
+
+    async def _post_otlp(self, spans: List[Span]):
+        """Send spans as OTLP/HTTP JSON to a collector"""
+        import httpx
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "masumi-telegram-bot"}}]},
+            "scopeSpans": [{"scope": {"name": "masumi-bot"}, "spans": [{
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start),
+                "endTimeUnixNano": str(span.end),
+                "status": {"code": 2 if span.status == "error" else 1},
+                "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in span.attributes.items()],
+            } for span in spans]}],
+        }]}
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            await client.post(self.endpoint.rstrip("/") + "/v1/traces", json=body)
+
+
+exporter = SpanExporter()
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """Open the root span of a trace, sampled at TRACE_SAMPLE_RATE"""
+    if not exporter.enabled or random.random() >= TRACE_SAMPLE_RATE:
+        token = current_span.set(None)
+        try:
+            yield None
+        finally:
+            current_span.reset(token)
+        return
+    with _span(name, os.urandom(16).hex(), None, attributes) as span:
+        yield span
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current one; a no-op when the trace is not sampled"""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    with _span(name, parent.trace_id, parent.span_id, attributes) as child:
+        yield child
+
+
+@contextmanager
+def _span(name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+    span_obj = Span(name, trace_id, parent_id, attributes)
+    token = current_span.set(span_obj)
+    try:
+        yield span_obj
+    except BaseException as e:
+        span_obj.status = "error"
+        span_obj.set("error", type(e).__name__)
+        raise
+    finally:
+        span_obj.end = time.time_ns()
+        current_span.reset(token)
+        exporter.add(span_obj)
+
+
+def traced(name: str):
+    """Decorator running a coroutine function inside a child span"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
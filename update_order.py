@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# (chat id, user id); either is None for updates without one
+UpdateKey = Tuple[Optional[int], Optional[int]]
+
+# Commands that must reach a user's running command rather than queue behind it
+_BYPASS_COMMANDS = {"/cancel"}
+
+
+def update_key(update: Update) -> UpdateKey:
+    """Whose update this is: the chat and the user within it"""
+    chat, user = update.effective_chat, update.effective_user
+    return chat.id if chat else None, user.id if user else None
+
+
+def _command(text: str) -> str:
+    """"/cancel" for "/cancel@my_bot now", "" for plain text"""
+    return text.split(maxsplit=1)[0].split("@", 1)[0] if text.startswith("/") else ""
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs each user's messages in a chat one at a time, in arrival order.
+
+    Different chats and users still run concurrently, up to
+    `max_concurrent_updates`. /cancel, button presses and inline queries skip
+    the line. A command that arrives while the same user's earlier update is
+    running first calls `interrupt(key)`, so it supersedes that update rather
+    than waiting for it (see MasumiTelegramBot.cancellable).
+    """
+
+    def __init__(self, max_concurrent_updates: int, interrupt: Optional[Callable[[UpdateKey], None]] = None):
+        super().__init__(max_concurrent_updates)
+        self.interrupt = interrupt
+        # key -> future resolved when the key's latest update has been handled
+        self._tails: Dict[UpdateKey, asyncio.Future] = {}
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        message = update.message if isinstance(update, Update) else None
+        command = _command(message.text or "") if message else ""
+        if message is None or command in _BYPASS_COMMANDS:
+            await super().process_update(update, coroutine)
+            return
+
+        # Take a place in line before waiting for a concurrency slot
+        key = update_key(update)
+        previous = self._tails.get(key)
+        turn = self._tails[key] = asyncio.get_running_loop().create_future()
+        started = False
+        try:
+            if previous is not None and not previous.done():
+                if command and self.interrupt:
+                    self.interrupt(key)
+                # wait() rather than await, so being cancelled here leaves `previous` alone
+                await asyncio.wait((previous,))
+            started = True
+            await super().process_update(update, coroutine)
+        finally:
+            if not started:
+                coroutine.close()
+            turn.set_result(None)
+            if self._tails.get(key) is turn:
+                del self._tails[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass